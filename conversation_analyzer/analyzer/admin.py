@@ -1,6 +1,27 @@
 '''Settings for Django's admin panel.'''
 
 from django.contrib import admin
-from analyzer.models import SystemUser
+from analyzer.io.dedup import get_storage_saved
+from analyzer.models import Document, SystemUser
+from graph.cache import get_cache_stats
+from graph.metrics import get_load_stats
 
 admin.site.register(SystemUser)
+
+@admin.register(Document)
+class DocumentAdmin(admin.ModelAdmin):
+    '''
+    Admin for documents, which shows the storage saved by reusing identical uploads, how
+    often rendered graphs are reused, and how long the dashboard takes to load.
+    '''
+    list_display = ('display_name', 'owner', 'accepted', 'reused_from', 'archived_at')
+    list_filter = ('accepted',)
+    search_fields = ('display_name', 'content_hash')
+
+    def changelist_view(self, request, extra_context=None):
+        '''Adds the storage saved, and the graph cache and dashboard load statistics.'''
+        extra_context = extra_context or {}
+        extra_context['storage_saved'] = get_storage_saved()
+        extra_context['graph_cache'] = get_cache_stats()
+        extra_context['dashboard_loads'] = get_load_stats()
+        return super().changelist_view(request, extra_context=extra_context)
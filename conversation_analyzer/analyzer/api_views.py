@@ -0,0 +1,196 @@
+'''JSON endpoints for the dashboard graphs, metrics, message feed and search.'''
+
+from datetime import datetime, timedelta
+from http import HTTPStatus
+import json
+import math
+from uuid import UUID
+from django.contrib.auth.decorators import login_required
+from django.shortcuts import get_object_or_404
+from django.views.decorators.csrf import csrf_protect
+from django.http import HttpResponse, JsonResponse
+from django.urls import reverse
+from django.utils import timezone
+from analyzer.io import feed, search
+from analyzer.io.messages import get_owned_documents, NIL_UUID
+from analyzer.models import Document, Profile, SystemUser
+from analyzer.io import views_helper
+from graph import downsample, metrics, plot
+
+@login_required
+@csrf_protect
+def api_feed_document(request):
+    '''API endpoint for creating an empty document, which is filled by the live feed.'''
+    if request.method != 'POST':
+        return JsonResponse({
+            "error": "This endpoint only accepts POST requests.", "success":False
+        })
+    try:
+        display_name = json.loads(request.body)["display_name"]
+    except (KeyError, json.JSONDecodeError):
+        return JsonResponse({
+            "success": False, "error": "A name for the document is required."
+        }, status=HTTPStatus.BAD_REQUEST)
+
+    document = feed.create_feed_document(SystemUser.objects.get(user=request.user), display_name)
+    return JsonResponse({
+        "success": True, "document_id": document.uuid,
+        "feed_url": reverse('api_feed_messages', args=[document.uuid])
+    })
+
+@login_required
+@csrf_protect
+def api_feed_messages(request, document_id):
+    '''
+    API endpoint for the live feed, which appends a batch of messages to a document.
+    Each message has a sender, an ISO 8601 timestamp and a body.
+    '''
+    if request.method != 'POST':
+        return JsonResponse({
+            "error": "This endpoint only accepts POST requests.", "success":False
+        })
+    document = Document.objects.filter(
+        pk=document_id, owner__user=request.user, accepted=True).first()
+    if document is None:
+        return JsonResponse({
+            "success": False, "error": "This document was not found."
+        }, status=HTTPStatus.NOT_FOUND)
+    try:
+        new_messages = feed.feed_messages(document, json.loads(request.body).get("messages"))
+    except (AttributeError, json.JSONDecodeError):
+        return JsonResponse({
+            "success": False, "error": "No messages were provided."
+        }, status=HTTPStatus.BAD_REQUEST)
+    except feed.FeedError as e:
+        return JsonResponse({"success": False, "error": str(e)}, status=HTTPStatus.BAD_REQUEST)
+
+    return JsonResponse({
+        "success": True, "inserted": [message.pk for message in new_messages]
+    })
+
+@login_required
+def api_dashboard_graph(request, document_id, graph):
+    '''Gets a graph of the dashboard as Plotly figure JSON, with its description.'''
+    document_uuid = str(document_id)
+    if (document_uuid != NIL_UUID
+            and not get_owned_documents(request.user).filter(uuid=document_uuid).exists()):
+        return JsonResponse({
+            "success": False, "error": "This document was not found."
+        }, status=HTTPStatus.NOT_FOUND)
+    if graph not in views_helper.get_dashboard_graphs(document_uuid):
+        return JsonResponse({
+            "success": False, "error": "This graph was not found."
+        }, status=HTTPStatus.NOT_FOUND)
+    # The graph is cached as Plotly JSON text, parsing it for JsonResponse would only serialize
+    # it again.
+    # pylint: disable-next=http-response-with-content-type-json
+    return HttpResponse(views_helper.get_dashboard_graph(request.user, document_uuid, graph),
+                        content_type='application/json')
+
+def get_range(request) -> tuple[float, float]:
+    '''Gets the range of message IDs a graph is zoomed into, from start and end.'''
+    start, end = float(request.GET['start']), float(request.GET['end'])
+    if start > end or math.isnan(start) or math.isnan(end):
+        raise ValueError('The start of the range is after its end.')
+    return start, end
+
+def get_date_range(request) -> tuple[float, float]:
+    '''Gets the range of days a timeline is zoomed into as ordinals, from start and end dates.'''
+    start, end = (downsample.get_ordinal(request.GET[key]) for key in ('start', 'end'))
+    if start > end or math.isnan(start) or math.isnan(end):
+        raise ValueError('The start of the range is after its end.')
+    return start, end
+
+@login_required
+def api_dashboard_graph_range(request, document_id, graph):
+    '''
+    Gets the traces of a graph of the dashboard for a document between start and end, at full
+    resolution unless there are still too many points, as the graph is zoomed into.
+    '''
+    document_uuid = str(document_id)
+    if (graph not in plot.DOCUMENT_GRAPH_SERIES
+            or not get_owned_documents(request.user).filter(uuid=document_uuid).exists()):
+        return JsonResponse({
+            "success": False, "error": "This graph was not found."
+        }, status=HTTPStatus.NOT_FOUND)
+    try:
+        start, end = get_range(request)
+    except (KeyError, ValueError):
+        return JsonResponse({
+            "success": False, "error": "The range is invalid."
+        }, status=HTTPStatus.BAD_REQUEST)
+    return JsonResponse({"success": True, "traces": views_helper.get_dashboard_graph_range(
+        request.user, document_uuid, graph, start, end)})
+
+@login_required
+def api_profile_risk_range(request, profile_id):
+    '''Gets the trace of the graph of the risk of a profile between the start and end dates.'''
+    profile_data = get_object_or_404(Profile, pk=profile_id)
+    try:
+        start, end = get_date_range(request)
+    except (KeyError, ValueError):
+        return JsonResponse({
+            "success": False, "error": "The range is invalid."
+        }, status=HTTPStatus.BAD_REQUEST)
+    return JsonResponse({"success": True, "traces": views_helper.get_profile_risk_range(
+        profile_data, start, end)})
+
+@login_required
+@csrf_protect
+def api_dashboard_metrics(request):
+    '''Records how long the dashboard took to load, as measured by the browser.'''
+    if request.method != 'POST':
+        return JsonResponse({
+            "error": "This endpoint only accepts POST requests.", "success":False
+        })
+    try:
+        body = json.loads(request.body)
+        measures = {measure: float(body[measure]) for measure in
+                    ('time_to_first_graph', 'total_time', 'payload_bytes', 'graphs')}
+    except (ValueError, TypeError, KeyError):
+        return JsonResponse({
+            "success": False, "error": "The measurements are invalid."
+        }, status=HTTPStatus.BAD_REQUEST)
+    metrics.record_load(measures['time_to_first_graph'], measures['total_time'],
+                        int(measures['payload_bytes']), int(measures['graphs']))
+    return JsonResponse({"success": True})
+
+def get_search_date(value: str, end: bool = False) -> datetime:
+    '''
+    Gets a date or time of a search from ISO format, in the default timezone unless it has
+    one. The end of a search is exclusive, so an end date without a time includes that day.
+    '''
+    date = datetime.fromisoformat(value)
+    if end and len(value) == len('YYYY-MM-DD'):
+        date += timedelta(days=1)
+    if timezone.is_naive(date):
+        date = timezone.make_aware(date, timezone.get_default_timezone())
+    return date
+
+def get_search_filters(request) -> search.SearchFilters:
+    '''Gets the filters of a search of messages, raises ValueError if any is invalid.'''
+    parameters = {key: request.GET.get(key) or None
+                  for key in ('document', 'profile', 'start', 'end')}
+    try:
+        return search.SearchFilters(
+            document=parameters['document'] and str(UUID(parameters['document'])),
+            profile=parameters['profile'] and int(parameters['profile']),
+            start=parameters['start'] and get_search_date(parameters['start']),
+            end=parameters['end'] and get_search_date(parameters['end'], end=True))
+    except ValueError as error:
+        raise ValueError('The filters of the search are invalid.') from error
+
+@login_required
+def api_message_search(request):
+    '''
+    Searches the bodies of the messages of the documents of the user for q, filtered by
+    document, profile, start and end. Gives a page of results, and the cursor of the next.
+    '''
+    try:
+        page = search.search_messages(request.user, request.GET.get('q', ''),
+                                      get_search_filters(request), request.GET.get('after'))
+    except ValueError as error:
+        return JsonResponse({
+            "success": False, "error": str(error)
+        }, status=HTTPStatus.BAD_REQUEST)
+    return JsonResponse({"success": True} | page)
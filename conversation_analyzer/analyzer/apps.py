@@ -1,8 +1,15 @@
 # pylint: disable=missing-class-docstring,missing-module-docstring
 
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class AnalyzerConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'analyzer'
+
+    def ready(self):
+        # The search index is a virtual table which migrations cannot describe.
+        # pylint: disable-next=import-outside-toplevel
+        from analyzer.io.search import create_search_index
+        post_migrate.connect(create_search_index, sender=self)
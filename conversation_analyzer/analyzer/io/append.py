@@ -0,0 +1,135 @@
+'''Appending a later export of a conversation to an accepted document.'''
+import os
+import shutil
+from collections import Counter
+from django.conf import settings
+from django.db import transaction
+from analyzer.io import archive, ingestion, response_times, statistics
+from analyzer.io.common import request_openai_analysis, run_in_background
+from analyzer.io.nlp import run_nlp_on_messages
+from analyzer.io.views_helper import build_messages
+from analyzer.models import Document, Message
+
+# Keys of the OpenAI analysis with a value for every message, in order.
+PER_MESSAGE_LISTS = ('sentiment_messages', 'risk_score_messages')
+# Keys of the OpenAI analysis with items that refer to a message by its index.
+INDEXED_LISTS = ('contradictions', 'locations', 'monetary_requests')
+INDEXED_BEHAVIOUR = ('escalating_messages', 'manipulative_messages')
+
+def get_fingerprint_counts(document: Document) -> Counter:
+    '''Counts the fingerprints of the messages of a document, filling in any that are missing.'''
+    missing = list(Message.objects.filter(source=document, fingerprint=None)
+                   .select_related('owner'))
+    for message in missing:
+        message.fingerprint = Message.get_fingerprint(message.date, message.owner.name,
+                                                      message.body)
+    Message.objects.bulk_update(missing, ['fingerprint'], batch_size=settings.MESSAGE_BATCH_SIZE)
+    return Counter(Message.objects.filter(source=document)
+                   .values_list('fingerprint', flat=True))
+
+def split_unseen(rows: list[dict], messages: list[Message],
+                 seen: Counter) -> tuple[list[dict], list[Message]]:
+    '''
+    Gets the rows and messages with a fingerprint that is not in seen. A fingerprint seen
+    twice only skips the first two of its messages, as the same message can be sent again.
+    '''
+    seen = seen.copy()
+    new_rows = []
+    new_messages = []
+    for row, message in zip(rows, messages):
+        if seen[message.fingerprint] > 0:
+            seen[message.fingerprint] -= 1
+        else:
+            new_rows.append(row)
+            new_messages.append(message)
+    return new_rows, new_messages
+
+def detach_files(document: Document):
+    '''Gives a document its own copy of the files it shares with an identical document.'''
+    if not Document.objects.filter(file=document.file.name).exclude(pk=document.pk).exists():
+        return
+    file_name = f'uploaded_documents/{document.uuid}{os.path.splitext(document.file.name)[1]}'
+    shutil.copyfile(os.path.join(settings.MEDIA_ROOT, document.file.name),
+                    os.path.join(settings.MEDIA_ROOT, file_name))
+    shutil.copyfile(ingestion.get_save_path(document.file.name),
+                    ingestion.get_save_path(file_name))
+    document.file.name = file_name
+    document.save(update_fields=['file'])
+
+def shift_indices(items: list, offset: int, key: str|None = None) -> list:
+    '''Moves message indices of analysis items by offset, the index is at key of dict items.'''
+    if key is None:
+        return [item + offset if isinstance(item, (int, float)) else item for item in items]
+    return [
+        {**item, key: item[key] + offset}
+        if isinstance(item, dict) and isinstance(item.get(key), (int, float)) else item
+        for item in items
+    ]
+
+def merge_openai_data(previous: dict|None, delta, offset: int) -> dict|None:
+    '''
+    Merges the OpenAI analysis of appended messages into the analysis of the earlier messages.
+    The delta refers to messages by their index among the appended messages, which start at
+    offset. Judgements of the whole document are taken from the delta, which is requested with
+    the earlier summary as context.
+    '''
+    if not delta:
+        return previous
+    merged = dict(previous or {})
+    for key, value in delta.items():
+        if key in PER_MESSAGE_LISTS:
+            merged[key] = (merged.get(key) or []) + value
+        elif key in INDEXED_LISTS:
+            merged[key] = (merged.get(key) or []) + shift_indices(value, offset, 'message')
+        elif key == 'motives':
+            merged[key] = list(dict.fromkeys((merged.get(key) or []) + value))
+        elif key == 'dangerous_behaviour' and merged.get(key):
+            behaviour = dict(merged[key])
+            for flag in ('escalating', 'manipulative'):
+                behaviour[flag] = bool(behaviour.get(flag) or value.get(flag))
+            for indices in INDEXED_BEHAVIOUR:
+                behaviour[indices] = ((behaviour.get(indices) or [])
+                                      + shift_indices(value.get(indices) or [], offset))
+            if value.get('summary'):
+                behaviour['summary'] = value['summary']
+            merged[key] = behaviour
+        elif key == 'dangerous_behaviour':
+            merged[key] = {**value, **{indices: shift_indices(value.get(indices) or [], offset)
+                                       for indices in INDEXED_BEHAVIOUR}}
+        else:
+            merged[key] = value
+    return merged
+
+def update_openai_data(document_pk, rows: list[dict], offset: int):
+    '''Requests the OpenAI analysis of appended rows, and merges it into the document.'''
+    previous = Document.objects.get(pk=document_pk).openai_data or {}
+    delta = request_openai_analysis(rows, context=previous.get('summary'))
+    with transaction.atomic():
+        document = Document.objects.select_for_update().get(pk=document_pk)
+        document.openai_data = merge_openai_data(document.openai_data, delta, offset)
+        document.save(update_fields=['openai_data'])
+    statistics.bump_versions([document_pk])
+
+def append_rows(document: Document, field_mapping: dict, rows: list[dict]) -> list[Message]:
+    '''
+    Appends the rows of a later export to an accepted document. Only rows with a message
+    that is not in the document yet are inserted, and only those are analysed.
+    Gives the inserted messages.
+    '''
+    archive.open_document(document)
+    with transaction.atomic():
+        new_rows, new_messages = split_unseen(
+            rows, build_messages(document, field_mapping, rows), get_fingerprint_counts(document)
+        )
+        if not new_messages:
+            return []
+
+        Message.objects.bulk_create(new_messages, batch_size=settings.MESSAGE_BATCH_SIZE)
+        statistics.record_messages(new_messages)
+        response_times.record_messages(new_messages)
+        detach_files(document)
+        offset = ingestion.append_save(ingestion.get_save_path(document.file.name), new_rows)
+
+    run_nlp_on_messages(new_messages)
+    run_in_background(update_openai_data, document.pk, new_rows, offset)
+    return new_messages
@@ -0,0 +1,135 @@
+'''
+Archival of inactive documents.
+
+The messages and NLP results of documents which have not been opened for ARCHIVE_AFTER_DAYS are
+moved out of the database into a compressed JSON Lines archive, so the tables every page queries
+only hold documents in use. A summary is kept on the document, as are its statistics, and it is
+restored when opened.
+'''
+from collections import Counter
+from datetime import timedelta
+import gzip
+import json
+import os
+from django.conf import settings
+from django.db import transaction
+from django.db.models import QuerySet
+from django.utils import timezone
+from analyzer.io import response_times, statistics
+from analyzer.io.ingestion import encode_rows
+from analyzer.models import Document, Message, NLPTask, Profile
+
+def get_archive_path(document: Document) -> str:
+    '''Gets the path of the archive of a document.'''
+    return os.path.join(settings.MEDIA_ROOT, 'archives', f'{document.uuid}.jsonl.gz')
+
+def get_inactive_documents(days: int|None = None) -> QuerySet:
+    '''Gets the accepted documents which have not been opened for days, and are not archived.'''
+    cutoff = timezone.now() - timedelta(days=settings.ARCHIVE_AFTER_DAYS if days is None
+                                        else days)
+    return Document.objects.filter(accepted=True, archived_at=None, last_accessed__lt=cutoff)
+
+def summarise(messages: list[Message], results: dict[int, str|None]) -> dict:
+    '''Summarises the messages of a document, this is kept while they are archived.'''
+    dates = [message.date for message in messages]
+    return {
+        'messages': len(messages),
+        'analysed': sum(result is not None for result in results.values()),
+        'first_message': min(dates).isoformat() if dates else None,
+        'last_message': max(dates).isoformat() if dates else None,
+        'senders': dict(Counter(message.owner.name for message in messages).most_common()),
+    }
+
+def get_task_row(task: NLPTask) -> dict:
+    '''Gets the NLP task of a message as it is archived.'''
+    completed = task.completed_at
+    return {
+        'result': task.result,
+        'queued_at': task.queued_at.isoformat(),
+        'completed_at': completed.isoformat() if completed else None,
+    }
+
+def archive_document(document: Document) -> dict:
+    '''Moves the messages and NLP results of a document into its archive, gives its summary.'''
+    with transaction.atomic():
+        messages = list(Message.objects.filter(source=document).select_related('owner')
+                        .order_by('pk'))
+        tasks = {task.message_id: task for task in NLPTask.objects.filter(message__source=document)}
+        rows = [{
+            'pk': message.pk,
+            'date': message.date.isoformat(),
+            'body': message.body,
+            'owner': message.owner_id,
+            'owner_name': message.owner.name,
+            'fingerprint': message.fingerprint,
+            'nlp': get_task_row(tasks[message.pk]) if message.pk in tasks else None,
+        } for message in messages]
+
+        # The archive is complete before anything is deleted, a failure leaves the document as is.
+        path = get_archive_path(document)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with gzip.open(f'{path}.tmp', 'wt', encoding='utf8') as file:
+            file.write(encode_rows(rows))
+        os.replace(f'{path}.tmp', path)
+
+        document.archive_summary = summarise(
+            messages, {pk: task.result for pk, task in tasks.items()})
+        document.archived_at = timezone.now()
+        document.save(update_fields=['archive_summary', 'archived_at'])
+        Message.objects.filter(source=document).delete()
+        statistics.bump_versions([document.pk], {message.owner_id for message in messages})
+    return document.archive_summary
+
+def get_profiles(rows: list[dict]) -> dict[int, int]:
+    '''Maps the profiles of archived messages to existing ones, recreating any deleted since.'''
+    existing = set(Profile.objects.filter(pk__in={row['owner'] for row in rows})
+                   .values_list('pk', flat=True))
+    profiles = {}
+    for row in rows:
+        if row['owner'] in existing:
+            profiles[row['owner']] = row['owner']
+        elif row['owner'] not in profiles:
+            profiles[row['owner']] = Profile.objects.get_or_create(
+                name=row['owner_name'], defaults={'note': ''})[0].pk
+    return profiles
+
+def restore_document(document: Document) -> bool:
+    '''Moves the messages of an archived document back, gives whether it was archived.'''
+    with transaction.atomic():
+        document = Document.objects.select_for_update().get(pk=document.pk)
+        if document.archived_at is None:
+            return False
+        path = get_archive_path(document)
+        with gzip.open(path, 'rt', encoding='utf8') as file:
+            rows = [json.loads(line) for line in file if line.strip()]
+
+        profiles = get_profiles(rows)
+        Message.objects.bulk_create([
+            Message(pk=row['pk'], date=row['date'], body=row['body'], source=document,
+                    owner_id=profiles[row['owner']], fingerprint=row['fingerprint'])
+            for row in rows
+        ], batch_size=settings.MESSAGE_BATCH_SIZE)
+        response_times.update_response_times(document.pk)
+        NLPTask.objects.bulk_create([
+            NLPTask(message_id=row['pk'], result=row['nlp']['result'],
+                    queued_at=row['nlp']['queued_at'], completed_at=row['nlp']['completed_at'])
+            for row in rows if row['nlp'] is not None
+        ], batch_size=settings.MESSAGE_BATCH_SIZE)
+        document.archived_at = None
+        document.archive_summary = None
+        document.save(update_fields=['archived_at', 'archive_summary'])
+        # The statistics were kept while archived, unless profiles were deleted since.
+        recreated = [Profile(pk=pk) for owner, pk in profiles.items() if owner != pk]
+        if recreated:
+            statistics.rebuild_statistics([document], recreated)
+        statistics.bump_versions([document.pk], set(profiles.values()))
+        transaction.on_commit(lambda: os.unlink(path))
+    return True
+
+def open_document(document: Document):
+    '''Records that a document is in use, restoring its messages if it is archived.'''
+    Document.objects.filter(pk=document.pk).update(last_accessed=timezone.now())
+    if document.archived_at is not None:
+        restore_document(document)
+        document.archived_at = None
+        document.archive_summary = None
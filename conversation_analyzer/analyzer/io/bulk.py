@@ -0,0 +1,197 @@
+'''
+Bulk ingestion of many files, from a zip archive or a directory.
+
+manage.py ingest_bulk parses the files in a pool of processes. Archives uploaded through the
+API are ingested as background jobs instead, parsing one file at a time on an upload worker,
+as forking a process pool from the threads of a web server is unsafe.
+'''
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import json
+import os
+import shutil
+import tempfile
+import zipfile
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from analyzer.io import dedup, ingestion, jobs, storage
+from analyzer.io.common import write_unhandled_error
+from analyzer.io.views_helper import parse_field_mapping, populate_message
+from analyzer.models import BulkIngestionJob, Document, FieldMapping, SystemUser, uuid_path
+from data_ingestion.file_handling import FileProcessor
+
+class BulkIngestionError(Exception):
+    '''Exception for archives which are refused for bulk ingestion.'''
+
+def get_field_mapping(owner: SystemUser, data) -> dict:
+    '''
+    Gets the field mapping of a bulk upload from its form data, the saved mapping named
+    mapping_name or the mapping given as JSON in field_mapping. Raises BulkIngestionError if
+    neither is found.
+    '''
+    if data.get('mapping_name'):
+        mapping = FieldMapping.objects.filter(owner=owner, name=data['mapping_name']).first()
+        if mapping is None:
+            raise BulkIngestionError('This field mapping was not found.')
+        return mapping.mapping
+    try:
+        return parse_field_mapping(json.loads(data['field_mapping']))
+    except (KeyError, TypeError, json.JSONDecodeError) as e:
+        raise BulkIngestionError('No field mapping was provided.') from e
+
+def parse_member(path: str) -> dict:
+    '''Parses a single file, this runs in a worker process so it must not use the database.'''
+    try:
+        processor = FileProcessor(path)
+        processor.process()
+        if not processor.is_valid():
+            return {'rows': None, 'error': 'Could not parse this file.'}
+        return {'rows': processor.file.get_data(), 'error': None}
+    except Exception as e: # pylint: disable=broad-except
+        return {'rows': None, 'error': f'Could not parse this file: {e}'}
+
+def check_archive(archive: zipfile.ZipFile):
+    '''
+    Refuses archives with more than BULK_MAX_FILES members, or which would take more than
+    BULK_MAX_BYTES once extracted, e.g. zip bombs. Only the directory of the archive is read.
+    '''
+    members = archive.infolist()
+    if len(members) > settings.BULK_MAX_FILES:
+        raise BulkIngestionError(f'This archive has more than {settings.BULK_MAX_FILES} files.')
+    if sum(info.file_size for info in members) > settings.BULK_MAX_BYTES:
+        raise BulkIngestionError(f'This archive is larger than {settings.BULK_MAX_BYTES} bytes '
+                                 'once extracted.')
+
+def extract_members(source: str, directory: str) -> list[tuple[str, str]]:
+    '''
+    Lists the supported files in a zip archive or directory as (display name, path) pairs.
+    Archive members are extracted into directory, which the caller should remove.
+    '''
+    if os.path.isdir(source):
+        return sorted(
+            (os.path.relpath(os.path.join(root, name), source), os.path.join(root, name))
+            for root, _, names in os.walk(source)
+            for name in names if FileProcessor.is_supported(name)
+        )
+
+    members = []
+    with zipfile.ZipFile(source) as archive:
+        check_archive(archive)
+        for index, info in enumerate(archive.infolist()):
+            if info.is_dir() or not FileProcessor.is_supported(info.filename):
+                continue
+            # Never trust the paths inside an archive, only the extension is kept.
+            path = os.path.join(directory,
+                                f'{index}{os.path.splitext(info.filename)[1]}')
+            with archive.open(info) as member, open(path, 'wb') as file:
+                shutil.copyfileobj(member, file)
+            members.append((info.filename, path))
+    return members
+
+def store_member(owner: SystemUser, display_name: str, path: str,
+                 field_mapping: dict, rows: list[dict]) -> Document:
+    '''Stores a parsed file as an accepted document, its messages are inserted in bulk.'''
+    document = Document(display_name=os.path.basename(display_name), owner=owner,
+                        accepted=True, is_ingestion_output=True,
+                        content_hash=dedup.hash_file(path))
+    document.file.name = uuid_path(document, document.display_name)
+    original_path = os.path.join(settings.MEDIA_ROOT, document.file.name)
+    save_path = ingestion.get_save_path(document.file.name)
+    storage.store_file(path, original_path)
+    ingestion.write_save(save_path, rows)
+    try:
+        with transaction.atomic():
+            document.save()
+            populate_message(document.uuid, field_mapping, rows)
+    except Exception:
+        os.unlink(original_path)
+        os.unlink(save_path)
+        raise
+    return document
+
+def parse_members(members: list[tuple[str, str]], workers: int):
+    '''
+    Parses members in a pool of that many processes, or one at a time if workers is 0. Yields
+    the display name, path and parse of each member as it completes.
+    '''
+    if not workers:
+        for name, path in members:
+            yield name, path, parse_member(path)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(parse_member, path): (name, path) for name, path in members}
+        for future in as_completed(futures):
+            yield *futures[future], future.result()
+
+def ingest_bulk(owner: SystemUser, source: str, field_mapping: dict,
+                workers: int|None = None, progress=None) -> list[dict]:
+    '''
+    Ingests every supported file in a zip archive or directory with the same field mapping.
+    Files are parsed by workers processes, by default BULK_INGESTION_WORKERS, see
+    parse_members. progress is called with the number of files ingested and of files as each
+    completes. Gives a report for each file in the order of the source.
+    '''
+    workers = settings.BULK_INGESTION_WORKERS if workers is None else workers
+    reports = []
+    with tempfile.TemporaryDirectory() as directory:
+        members = extract_members(source, directory)
+        for name, path, parsed in parse_members(members, workers):
+            report = {'file': name, 'success': False}
+            try:
+                if parsed['error'] is not None:
+                    raise ValueError(parsed['error'])
+                document = store_member(owner, name, path, field_mapping, parsed['rows'])
+                report |= {'success': True, 'document': str(document.uuid),
+                           'messages': len(parsed['rows'])}
+            except KeyError as e:
+                report['error'] = f'This file has no {e} field for the field mapping.'
+            except Exception as e: # pylint: disable=broad-except
+                report['error'] = str(e) or type(e).__name__
+            reports.append(report)
+            if progress is not None:
+                progress(len(reports), len(members))
+    order = {name: index for index, (name, _) in enumerate(members)}
+    return sorted(reports, key=lambda report: order[report['file']])
+
+def update_bulk_job(job_pk, **fields):
+    '''Updates the status fields of a bulk job without touching the rest of the row.'''
+    BulkIngestionJob.objects.filter(pk=job_pk).update(updated=timezone.now(), **fields)
+
+def run_bulk_job(job_pk):
+    '''Ingests the archive of a bulk job one file at a time, then removes the archive.'''
+    job = BulkIngestionJob.objects.select_related('owner').get(pk=job_pk)
+    try:
+        update_bulk_job(job_pk, phase='parsing')
+        reports = ingest_bulk(job.owner, job.get_archive_path(), job.field_mapping, workers=0,
+                              progress=lambda done, total: update_bulk_job(
+                                  job_pk, files_done=done, files_total=total))
+        update_bulk_job(job_pk, phase='done', reports=reports)
+    except (zipfile.BadZipFile, BulkIngestionError) as e:
+        update_bulk_job(job_pk, phase='failed', error=str(e))
+    except Exception as e: # pylint: disable=broad-except
+        write_unhandled_error(e, "run_bulk_job")
+        update_bulk_job(job_pk, phase='failed', error='Could not ingest this archive.')
+    finally:
+        if os.path.exists(job.get_archive_path()):
+            os.unlink(job.get_archive_path())
+
+def start_bulk_job(owner: SystemUser, chunks, field_mapping: dict) -> BulkIngestionJob:
+    '''
+    Saves an uploaded zip archive from its chunks and queues it for ingestion, returns the job
+    to poll. Raises zipfile.BadZipFile or BulkIngestionError, without a job, if the archive
+    cannot be read or is refused.
+    '''
+    job = BulkIngestionJob(owner=owner, field_mapping=field_mapping)
+    os.makedirs(os.path.dirname(job.get_archive_path()), exist_ok=True)
+    with open(job.get_archive_path(), 'wb') as file:
+        for chunk in chunks:
+            file.write(chunk)
+    try:
+        with zipfile.ZipFile(job.get_archive_path()) as archive:
+            check_archive(archive)
+    except Exception:
+        os.unlink(job.get_archive_path())
+        raise
+    job.save()
+    jobs.run_job(run_bulk_job, job.pk)
+    return job
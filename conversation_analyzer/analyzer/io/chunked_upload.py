@@ -0,0 +1,107 @@
+'''I/O helpers for chunked, resumable uploads.'''
+from contextlib import contextmanager
+import fcntl
+import hashlib
+import os
+from django.conf import settings
+from analyzer.io import storage
+from analyzer.models import Document, UploadSession, uuid_path
+
+COPY_BUFFER_SIZE = 64 * 1024
+
+class ChunkError(Exception):
+    '''Exception for chunks which cannot be appended to an upload.'''
+
+def start_session(owner, display_name: str, total_size: int) -> UploadSession:
+    '''Creates an upload session and its empty temporary file.'''
+    session = UploadSession.objects.create(owner=owner, display_name=display_name,
+                                           total_size=total_size,
+                                           chunk_size=settings.UPLOAD_CHUNK_SIZE)
+    os.makedirs(os.path.dirname(session.get_temp_path()), exist_ok=True)
+    with open(session.get_temp_path(), 'wb'):
+        pass
+    return session
+
+@contextmanager
+def lock_session(session: UploadSession):
+    '''
+    Locks the temporary file of an upload and reloads its session, so concurrent requests for
+    the same upload check the acknowledged offset and write to the file one at a time. Gives
+    the open file. The lock is held by the file, so it also holds between processes.
+    '''
+    try:
+        with open(session.get_temp_path(), 'r+b') as file:
+            fcntl.flock(file, fcntl.LOCK_EX)
+            session.refresh_from_db()
+            yield file
+    except (FileNotFoundError, UploadSession.DoesNotExist) as e:
+        raise ChunkError('This upload is no longer in progress.') from e
+
+def append_chunk(session: UploadSession, offset: int, length: int, stream,
+                 chunk_checksum: str|None = None) -> int:
+    '''
+    Writes a chunk read from stream at offset, which must be the acknowledged offset.
+    Returns the new acknowledged offset, the chunk is discarded if its checksum mismatches.
+    '''
+    with lock_session(session) as file:
+        if offset != session.received:
+            raise ChunkError(f'Expected a chunk at offset {session.received}.')
+        if length > session.chunk_size or offset + length > session.total_size:
+            raise ChunkError('The chunk is larger than expected.')
+
+        digest = hashlib.sha256()
+        # Anything past the acknowledged offset is from an interrupted chunk.
+        file.truncate(offset)
+        file.seek(offset)
+        remaining = length
+        while remaining > 0:
+            buffer = stream.read(min(COPY_BUFFER_SIZE, remaining))
+            if not buffer:
+                break
+            digest.update(buffer)
+            file.write(buffer)
+            remaining -= len(buffer)
+        if remaining > 0 or (chunk_checksum and digest.hexdigest() != chunk_checksum.lower()):
+            file.truncate(offset)
+            raise ChunkError('The chunk was not received correctly.')
+
+        session.received = offset + length
+        session.save(update_fields=['received', 'updated'])
+        return session.received
+
+def composite_checksum(path: str, chunk_size: int) -> str:
+    '''
+    Gets the SHA-256 of the concatenated hex SHA-256 digests of each chunk of a file.
+    Unlike a whole file digest, a browser can compute this one chunk at a time.
+    '''
+    composite = hashlib.sha256()
+    with open(path, 'rb') as file:
+        while chunk := file.read(chunk_size):
+            composite.update(hashlib.sha256(chunk).hexdigest().encode())
+    return composite.hexdigest()
+
+def complete_session(session: UploadSession, checksum: str) -> Document:
+    '''
+    Verifies a fully received upload, then moves it into the media store as a Document.
+    The session is removed afterwards.
+    '''
+    with lock_session(session) as file:
+        if session.received != session.total_size:
+            raise ChunkError(
+                f'Only {session.received} of {session.total_size} bytes were received.')
+        if composite_checksum(session.get_temp_path(), session.chunk_size) != checksum.lower():
+            # Start the upload again, as there is no telling which chunk is corrupt.
+            file.truncate(0)
+            session.received = 0
+            session.save(update_fields=['received', 'updated'])
+            raise ChunkError('The checksum of the uploaded file does not match.')
+
+        document = Document(display_name=session.display_name, owner=session.owner)
+        document.file.name = uuid_path(document, session.display_name)
+        path = os.path.join(settings.MEDIA_ROOT, document.file.name)
+        os.replace(session.get_temp_path(), path)
+    if storage.should_compress(path):
+        storage.compress_file(path)
+    document.save()
+    session.delete()
+    return document
@@ -1,9 +1,11 @@
 '''Utility functions for I/O operations.'''
 import json
 import os
+import threading
 from typing import Any, Callable, Generic, TypeVar
 from django.conf import settings
 from django.db import models
+from analyzer.io import statistics
 from analyzer.models import Document
 import openai
 
@@ -48,34 +50,9 @@ class PendingRecord(Generic[T]):
 
     def get_openai_data(self, parsed_file):
         """Returns the OpenAI data for the record."""
-        response_object = {}
-
-        def request_data(response_object, parsed_file):
-            with open(
-                os.path.join(settings.STATIC_DIR, 'openAIRequestAnalysis.json'),
-                'r',
-                encoding='utf8'
-            ) as f:
-                file_data = json.loads(f.read())  # Load file contents as a string
-                for key in ('analyser', 'contradictions', 'locations', 'behaviour'):
-                    request = file_data[key]
-                    request['messages'].append({
-                        'role': 'user',
-                        'content': json.dumps(parsed_file)
-                    })
-                    print("[LOG] Making OpenAI request...")
-                    response = openai.ChatCompletion.create(**request)
-                    response_object.update(
-                        json.loads(
-                            response
-                            ["choices"][0]["message"]["tool_calls"][0]["function"]["arguments"]
-                        )
-                    )
-
-            return response_object
-
-        self.model.openai_data = generic_openai_request(request_data, response_object, parsed_file)
+        self.model.openai_data = request_openai_analysis(parsed_file)
         self.model.save()
+        statistics.bump_versions([self.model.pk])
 
     def reject(self):
         """Rejects the record, and deletes it from the database."""
@@ -83,11 +60,66 @@ class PendingRecord(Generic[T]):
         path_parsed = os.path.join(settings.MEDIA_ROOT, 'ingestion_saves', str(self.model.uuid))
         uuid, ext = os.path.splitext(str(self.model.file).rsplit('/', maxsplit=1)[-1])
         path_parsed += ext
-        os.unlink(path_original)
-        os.unlink(path_parsed)
+        if Document.objects.filter(file=self.model.file.name).exclude(pk=self.model.pk).exists():
+            # The files belong to an identical document, which still needs them.
+            self.model.delete()
+            return
+        if os.path.exists(path_original):
+            os.unlink(path_original)
+        if os.path.exists(path_parsed):
+            os.unlink(path_parsed)
         self.model.delete()
         Document.objects.filter(file__contains=uuid).delete()
 
+def request_openai_analysis(parsed_file, context: str|None = None):
+    """
+    Requests every analysis of the parsed rows from OpenAI, combined into one object.
+    When only the new rows of a conversation are sent, context summarises the earlier rows.
+    """
+    response_object: dict[str, Any] = {}
+
+    def request_data(response_object, parsed_file):
+        with open(
+            os.path.join(settings.STATIC_DIR, 'openAIRequestAnalysis.json'),
+            'r',
+            encoding='utf8'
+        ) as f:
+            file_data = json.loads(f.read())  # Load file contents as a string
+            for key in ('analyser', 'contradictions', 'locations', 'behaviour'):
+                request = file_data[key]
+                if context:
+                    request['messages'].append({
+                        'role': 'user',
+                        'content': 'These messages continue a conversation, which so far is '
+                                   f'summarised as: {context}'
+                    })
+                request['messages'].append({
+                    'role': 'user',
+                    'content': json.dumps(parsed_file)
+                })
+                print("[LOG] Making OpenAI request...")
+                response = openai.ChatCompletion.create(**request)
+                response_object.update(
+                    json.loads(
+                        response
+                        ["choices"][0]["message"]["tool_calls"][0]["function"]["arguments"]
+                    )
+                )
+
+        return response_object
+
+    return generic_openai_request(request_data, response_object, parsed_file)
+
+def run_in_background(function: Callable, *args):
+    """
+    Runs a function in a thread of its own, such as an OpenAI request. While testing it runs
+    before this returns instead, so its writes are made within the test.
+    """
+    if settings.TESTING:
+        function(*args)
+    else:
+        threading.Thread(target=function, args=args).start()
+
 def write_unhandled_error(error, caller: str):
     """Writes an unhandled error to a file."""
     with open('unhandled_errors.txt', 'a', encoding='utf8') as file:
@@ -0,0 +1,84 @@
+'''Content-addressed deduplication of uploaded documents.'''
+import hashlib
+import os
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from analyzer.io import archive, ingestion, statistics, storage
+from analyzer.models import Document, Message, NLPTask
+
+HASH_BUFFER_SIZE = 1024 * 1024
+
+def hash_file(path: str) -> str:
+    '''
+    Gets the SHA-256 of the content of a stored file in hexadecimal, without reading it into
+    memory at once. Compressed files are hashed by their decompressed content.
+    '''
+    digest = hashlib.sha256()
+    with storage.open_stored(path) as file:
+        while buffer := file.read(HASH_BUFFER_SIZE):
+            digest.update(buffer)
+    return digest.hexdigest()
+
+def get_reusable(document: Document) -> Document|None:
+    '''Gets an accepted document of the same owner with identical content, if there is one.'''
+    if document.content_hash is None:
+        return None
+    return Document.objects.filter(
+        owner=document.owner, accepted=True, content_hash=document.content_hash
+    ).exclude(pk=document.pk).order_by(F('reused_from').asc(nulls_first=True)).first()
+
+def find_duplicate(document: Document) -> Document|None:
+    '''Hashes a newly uploaded document, then gets an accepted document it duplicates.'''
+    document.content_hash = hash_file(document.file.path)
+    document.save(update_fields=['content_hash'])
+    return get_reusable(document)
+
+def reuse_document(document: Document, original: Document) -> Document:
+    '''
+    Accepts an uploaded document as a copy of an identical accepted document.
+    The original file and ingestion save are shared, and the messages are copied with their
+    NLP results, so nothing is parsed or analysed again. The uploaded file is removed.
+    '''
+    uploaded_path = document.file.path
+    archive.open_document(original)
+    with transaction.atomic():
+        document.file.name = original.file.name
+        document.reused_from = original
+        document.openai_data = original.openai_data
+        document.accepted = True
+        document.is_ingestion_output = True
+        document.save()
+        document.mentioned_profiles.set(original.mentioned_profiles.all())
+
+        messages = list(Message.objects.filter(source=original).order_by('pk'))
+        results = dict(NLPTask.objects.filter(message__source=original, result__isnull=False)
+                       .values_list('message_id', 'result'))
+        copies = Message.objects.bulk_create([
+            Message(date=message.date, body=message.body, source=document,
+                    owner_id=message.owner_id, fingerprint=message.fingerprint,
+                    response_time=message.response_time)
+            for message in messages
+        ], batch_size=settings.MESSAGE_BATCH_SIZE)
+        NLPTask.objects.bulk_create([
+            NLPTask(message=copy, result=results[message.pk])
+            for message, copy in zip(messages, copies) if message.pk in results
+        ], batch_size=settings.MESSAGE_BATCH_SIZE)
+        statistics.record_messages(copies)
+        statistics.record_results((copy, results[message.pk])
+                                  for message, copy in zip(messages, copies)
+                                  if message.pk in results)
+    if uploaded_path != document.file.path:
+        os.unlink(uploaded_path)
+    return document
+
+def get_storage_saved() -> dict:
+    '''Gets the number of reused documents, and the bytes of files they did not duplicate.'''
+    saved_bytes = 0
+    reused = Document.objects.filter(reused_from__isnull=False)
+    for file_name in reused.values_list('file', flat=True):
+        for path in (os.path.join(settings.MEDIA_ROOT, file_name),
+                     ingestion.get_save_path(file_name)):
+            if os.path.exists(path):
+                saved_bytes += os.path.getsize(path)
+    return {'documents': reused.count(), 'bytes': saved_bytes}
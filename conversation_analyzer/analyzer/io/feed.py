@@ -0,0 +1,78 @@
+'''Live feed of messages into an accepted document, for ongoing conversations.'''
+import os
+from collections import Counter
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from analyzer.io import archive, ingestion, response_times, statistics, storage
+from analyzer.io.append import detach_files, split_unseen
+from analyzer.io.nlp import run_nlp_on_messages
+from analyzer.io.views_helper import build_messages
+from analyzer.models import Document, Message, SystemUser, uuid_path
+from nlp.nlp import INTERACTIVE_PRIORITY
+
+# Messages of the feed are saved with these fields, which is also their field mapping.
+FEED_FIELDS = {'sender': 'sender', 'timestamp': 'timestamp', 'body': 'body'}
+
+class FeedError(Exception):
+    '''Raised when a batch of the live feed is not valid.'''
+
+def create_feed_document(owner: SystemUser, display_name: str) -> Document:
+    '''Creates an empty accepted document, for messages which arrive through the live feed.'''
+    document = Document(display_name=display_name, owner=owner, accepted=True,
+                        is_ingestion_output=True)
+    document.file.name = uuid_path(document, f'{display_name}.json')
+    with storage.open_for_write(os.path.join(settings.MEDIA_ROOT, document.file.name), 'wt',
+                                encoding='utf8') as file:
+        file.write('[]')
+    ingestion.write_save(ingestion.get_save_path(document.file.name), [])
+    document.save()
+    return document
+
+def validate_batch(entries) -> list[dict]:
+    '''Checks a batch of the feed, gives its messages as rows of the ingestion save.'''
+    if not isinstance(entries, list) or not entries:
+        raise FeedError('No messages were provided.')
+    if len(entries) > settings.FEED_MAX_BATCH:
+        raise FeedError(f'At most {settings.FEED_MAX_BATCH} messages can be sent at once.')
+    rows = []
+    for index, entry in enumerate(entries):
+        if (not isinstance(entry, dict)
+                or not all(isinstance(entry.get(field), str) for field in FEED_FIELDS)):
+            raise FeedError(f'Message {index} must have a sender, timestamp and body.')
+        rows.append({field: entry[field] for field in FEED_FIELDS})
+    return rows
+
+def save_rows(document: Document, rows: list[dict]):
+    '''Appends rows of the feed to the ingestion save of a document, see feed_messages.'''
+    detach_files(document)
+    ingestion.append_save(ingestion.get_save_path(document.file.name), rows)
+
+def feed_messages(document: Document, entries) -> list[Message]:
+    '''
+    Appends a batch of messages to a document, they are inserted together and queued for NLP
+    ahead of bulk work. Messages which are already in the document are skipped, so a batch
+    can be sent again if its response was lost. Gives the inserted messages.
+    '''
+    rows = validate_batch(entries)
+    archive.open_document(document)
+    try:
+        messages = build_messages(document, FEED_FIELDS, rows)
+    except ValidationError as e:
+        raise FeedError('Timestamps must be in ISO 8601 format.') from e
+
+    seen = Counter(Message.objects.filter(
+        source=document, fingerprint__in={message.fingerprint for message in messages}
+    ).values_list('fingerprint', flat=True))
+    new_rows, new_messages = split_unseen(rows, messages, seen)
+    if not new_messages:
+        return []
+
+    with transaction.atomic():
+        Message.objects.bulk_create(new_messages, batch_size=settings.MESSAGE_BATCH_SIZE)
+        statistics.record_messages(new_messages)
+        response_times.record_messages(new_messages)
+        # The save only gets the rows once their messages are committed.
+        transaction.on_commit(lambda: save_rows(document, new_rows))
+    run_nlp_on_messages(new_messages, INTERACTIVE_PRIORITY)
+    return new_messages
@@ -1,27 +1,173 @@
-'''I/O helpers for data ingestion.'''
+'''
+I/O helpers for data ingestion.
+
+Ingestion saves hold the parsed rows of a document as JSON Lines, one compact object per line,
+compressed by the media store if MEDIA_GZIP is set. Saves written as a single JSON array by
+earlier versions can still be read, the format is detected from the content of the file.
+'''
+from collections import OrderedDict
+from functools import lru_cache
+import itertools
 import json
 import os
-from typing import Any, TextIO
+import threading
+from typing import Any, Iterator
 from django.conf import settings
+from analyzer.io import storage
 from analyzer.io.common import PendingRecord
 from analyzer.models import Document, SystemUser
 
+# Parsed rows of recently read saves, by path, with the version of the file they were read from.
+_save_cache: OrderedDict[str, tuple[tuple[int, int], list[dict]]] = OrderedDict()
+_save_cache_lock = threading.Lock()
+_save_write_lock = threading.Lock()
+
 def get_openai_request_config() -> Any:
     '''Loads the request configuration for OpenAI from the static files directory.'''
     with open(os.path.join(settings.STATIC_DIR, 'openAIRequest.json'), 'r', encoding='utf8') as f:
         return json.load(f)
 
-def get_saves_write_handle(
+def get_save_record(
     filename: str,
     uploading_user: SystemUser
-) -> tuple[TextIO, PendingRecord[Document]]:
+) -> tuple[str, PendingRecord[Document]]:
     '''
-    Writes saves from data ingestion to a designated location,
-    pending record should be confirmed once the file write is complete.
+    Gets the location of the save from data ingestion for an uploaded file,
+    pending record should be confirmed once the save is written.
     '''
     uuid, _ext = os.path.splitext(filename.split("/")[-1])
     path = os.path.join(settings.MEDIA_ROOT, 'ingestion_saves', uuid)
-    # pylint: disable=consider-using-with
-    file = open(path, 'w', encoding='utf8')
-    return file, PendingRecord(Document(file=path, display_name=filename,
+    return path, PendingRecord(Document(file=path, display_name=filename,
                                         is_ingestion_output=True, owner=uploading_user))
+
+def get_save_path(filename: str) -> str:
+    '''Gets the path of the ingestion save for the media store name of an uploaded document.'''
+    uuid, ext = os.path.splitext(filename.split("/")[-1])
+    return os.path.join(settings.MEDIA_ROOT, 'ingestion_saves', uuid + ext)
+
+def get_save_version(path: str) -> tuple[int, int]:
+    '''Gets the modification time and size of a save, which change whenever it is written.'''
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+def is_json_array(file) -> bool:
+    '''Whether an open save is a single JSON array, the file is rewound afterwards.'''
+    for line in file:
+        if line.strip():
+            file.seek(0)
+            return line.lstrip().startswith(b'[')
+    file.seek(0)
+    return False
+
+def encode_rows(rows: list[dict]) -> str:
+    '''Encodes rows as JSON Lines.'''
+    return ''.join(json.dumps(row, ensure_ascii=False, separators=(',', ':')) + '\n'
+                   for row in rows)
+
+def write_save(path: str, rows: list[dict]):
+    '''Writes the parsed rows of a document as an ingestion save.'''
+    with _save_write_lock, storage.open_for_write(path, 'wt', encoding='utf8') as file:
+        file.write(encode_rows(rows))
+
+def iter_save_rows(path: str, start: int = 0, stop: int|None = None) -> Iterator[dict]:
+    '''Streams rows start to stop of a save, rows outside the range are not parsed.'''
+    with storage.open_stored(path) as file:
+        if is_json_array(file):
+            yield from json.load(file)[start:stop]
+            return
+        lines = (line for line in file if line.strip())
+        for line in itertools.islice(lines, start, stop):
+            yield json.loads(line)
+
+@lru_cache(maxsize=64)
+def get_line_offsets(path: str, _version: tuple[int, int]) -> list[int]:
+    '''
+    Gets the byte offset of every row of an uncompressed JSON Lines save, for seeking.
+    The version of the file is only used to key the cache.
+    '''
+    offsets = []
+    position = 0
+    with open(path, 'rb') as file:
+        for line in file:
+            if line.strip():
+                offsets.append(position)
+            position += len(line)
+    return offsets
+
+def get_cached_rows(path: str, version: tuple[int, int]) -> list[dict]|None:
+    '''Gets the parsed rows of a save if they are cached for this version of the file.'''
+    with _save_cache_lock:
+        cached = _save_cache.get(path)
+        if cached is None or cached[0] != version:
+            return None
+        _save_cache.move_to_end(path)
+        return cached[1]
+
+def cache_rows(path: str, version: tuple[int, int], rows: list[dict]):
+    '''Caches the parsed rows of a save, evicting the least recently used saves.'''
+    with _save_cache_lock:
+        _save_cache[path] = (version, rows)
+        _save_cache.move_to_end(path)
+        while len(_save_cache) > settings.INGESTION_SAVE_CACHE_SIZE:
+            _save_cache.popitem(last=False)
+
+def read_save(path: str) -> list[dict]:
+    '''
+    Reads every row of a save, recently read saves are kept parsed in memory.
+    The rows are shared with the cache, so they must not be modified.
+    '''
+    version = get_save_version(path)
+    rows = get_cached_rows(path, version)
+    if rows is None:
+        rows = list(iter_save_rows(path))
+        cache_rows(path, version, rows)
+    return list(rows)
+
+def read_save_range(path: str, start: int, stop: int) -> list[dict]:
+    '''Reads rows start to stop of a save, without parsing the other rows.'''
+    version = get_save_version(path)
+    rows = get_cached_rows(path, version)
+    if rows is not None:
+        return rows[start:stop]
+    with storage.open_stored(path) as file:
+        if storage.is_compressed(path) or is_json_array(file):
+            return list(iter_save_rows(path, start, stop))
+
+    offsets = get_line_offsets(path, version)
+    if start >= len(offsets):
+        return []
+    with open(path, 'rb') as file:
+        file.seek(offsets[start])
+        lines = (line for line in file if line.strip())
+        return [json.loads(line) for line in itertools.islice(lines, stop - start)]
+
+def count_save_rows(path: str) -> int:
+    '''Counts the rows of a save, without parsing them if it is in JSON Lines.'''
+    rows = get_cached_rows(path, get_save_version(path))
+    if rows is not None:
+        return len(rows)
+    with storage.open_stored(path) as file:
+        if is_json_array(file):
+            return len(json.load(file))
+        return sum(1 for line in file if line.strip())
+
+def append_save(path: str, rows: list[dict]) -> int:
+    '''
+    Appends parsed rows to an ingestion save, gives the number of rows it had before.
+    Only the new rows are written, unless the save is still a single JSON array.
+    '''
+    version = get_save_version(path)
+    cached_rows = get_cached_rows(path, version)
+    with storage.open_stored(path) as file:
+        legacy = is_json_array(file)
+    if legacy:
+        saved_rows = read_save(path)
+        write_save(path, saved_rows + rows)
+        return len(saved_rows)
+
+    saved_count = count_save_rows(path)
+    with _save_write_lock, storage.open_for_write(path, 'at', encoding='utf8') as file:
+        file.write(encode_rows(rows))
+    if cached_rows is not None:
+        cache_rows(path, get_save_version(path), cached_rows + rows)
+    return saved_count
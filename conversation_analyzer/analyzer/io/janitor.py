@@ -0,0 +1,150 @@
+'''
+Periodic housekeeping, off the request path.
+
+Abandoned uploads, stale NLP tasks and media files which no record refers to are removed in
+batches, every JANITOR_INTERVAL seconds by a background thread of the web server, or by running
+manage.py housekeeping.
+'''
+import os
+import threading
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+from analyzer.io import archive, ingestion
+from analyzer.io.common import PendingRecord, write_unhandled_error
+from analyzer.models import BulkIngestionJob, Document, IngestionJob, NLPTask, UploadSession
+
+_scheduler_lock = threading.Lock()
+_scheduler: threading.Thread|None = None
+
+def hours_ago(hours: float):
+    '''Gets the time the given number of hours ago.'''
+    return timezone.now() - timedelta(hours=hours)
+
+def reject_pending_documents() -> int:
+    '''
+    Removes uploads which were not accepted within PENDING_DOCUMENT_MAX_AGE_HOURS, with their
+    files and ingestion saves. Uploads which are still being parsed are left alone.
+    '''
+    pending = (Document.objects.filter(is_ingestion_output=False, accepted=False,
+                                       last_accessed__lt=hours_ago(
+                                           settings.PENDING_DOCUMENT_MAX_AGE_HOURS))
+               .exclude(ingestionjob__phase__in=('queued', 'parsing', 'saving')))
+    pks = list(pending.values_list('pk', flat=True))
+    for start in range(0, len(pks), settings.JANITOR_BATCH_SIZE):
+        batch = pks[start:start + settings.JANITOR_BATCH_SIZE]
+        for document in Document.objects.filter(pk__in=batch):
+            PendingRecord(document).reject()
+    return len(pks)
+
+def remove_stale_nlp_tasks() -> int:
+    '''
+    Removes NLP tasks which have not completed within NLP_TASK_TIMEOUT_HOURS, e.g. as the
+    server was restarted with them in its queue. Their messages are queued again when viewed.
+    '''
+    stale = NLPTask.objects.filter(result=None, queued_at__lt=hours_ago(
+        settings.NLP_TASK_TIMEOUT_HOURS)).order_by('pk').values_list('pk', flat=True)
+    removed = 0
+    while batch := list(stale[:settings.JANITOR_BATCH_SIZE]):
+        removed += NLPTask.objects.filter(pk__in=batch).delete()[0]
+    return removed
+
+def remove_stale_upload_sessions() -> int:
+    '''Removes chunked uploads which have not received a chunk in UPLOAD_SESSION_MAX_AGE_HOURS.'''
+    stale = UploadSession.objects.filter(
+        updated__lt=hours_ago(settings.UPLOAD_SESSION_MAX_AGE_HOURS))
+    removed = 0
+    for session in stale.iterator(chunk_size=settings.JANITOR_BATCH_SIZE):
+        if os.path.exists(session.get_temp_path()):
+            os.unlink(session.get_temp_path())
+        session.delete()
+        removed += 1
+    return removed
+
+def remove_finished_jobs() -> int:
+    '''Removes ingestion and bulk jobs which finished over INGESTION_JOB_MAX_AGE_HOURS ago.'''
+    cutoff = hours_ago(settings.INGESTION_JOB_MAX_AGE_HOURS)
+    finished = {'phase__in': ('done', 'failed'), 'updated__lt': cutoff}
+    return (IngestionJob.objects.filter(**finished).delete()[0]
+            + BulkIngestionJob.objects.filter(**finished).delete()[0])
+
+def get_referenced_media() -> set[str]:
+    '''Gets the paths of every file in the media store which a record refers to.'''
+    referenced = set()
+    for file_name, archived_at, uuid in Document.objects.values_list(
+            'file', 'archived_at', 'uuid').iterator(chunk_size=settings.JANITOR_BATCH_SIZE):
+        path = os.path.join(settings.MEDIA_ROOT, file_name)
+        referenced.add(os.path.normpath(path))
+        if os.path.dirname(path) == os.path.join(settings.MEDIA_ROOT, 'uploaded_documents'):
+            referenced.add(os.path.normpath(ingestion.get_save_path(file_name)))
+        if archived_at is not None:
+            referenced.add(os.path.normpath(archive.get_archive_path(Document(uuid=uuid))))
+    for session in UploadSession.objects.all().iterator(chunk_size=settings.JANITOR_BATCH_SIZE):
+        referenced.add(os.path.normpath(session.get_temp_path()))
+    for job in BulkIngestionJob.objects.exclude(phase__in=('done', 'failed')).iterator(
+            chunk_size=settings.JANITOR_BATCH_SIZE):
+        referenced.add(os.path.normpath(job.get_archive_path()))
+    return referenced
+
+def remove_orphaned_media() -> int:
+    '''
+    Removes files of the media store which no record refers to. Only files which have not been
+    modified for ORPHANED_MEDIA_MIN_AGE_HOURS are removed, as their record may not be saved yet.
+    '''
+    referenced = get_referenced_media()
+    cutoff = time.time() - settings.ORPHANED_MEDIA_MIN_AGE_HOURS * 3600
+    removed = 0
+    for directory in ('uploaded_documents', 'ingestion_saves', 'upload_sessions', 'archives',
+                      'bulk_uploads'):
+        path = os.path.join(settings.MEDIA_ROOT, directory)
+        if not os.path.isdir(path):
+            continue
+        for entry in os.scandir(path):
+            if (entry.is_file() and not entry.name.startswith('.')
+                    and os.path.normpath(entry.path) not in referenced
+                    and entry.stat().st_mtime < cutoff):
+                os.unlink(entry.path)
+                removed += 1
+    return removed
+
+# Housekeeping tasks in the order they are run, the media store is checked last so that files
+# of records removed by the other tasks are not left behind.
+TASKS = {
+    'pending documents': reject_pending_documents,
+    'stale NLP tasks': remove_stale_nlp_tasks,
+    'stale upload sessions': remove_stale_upload_sessions,
+    'finished ingestion jobs': remove_finished_jobs,
+    'orphaned media files': remove_orphaned_media,
+}
+
+def run_housekeeping() -> dict[str, int]:
+    '''Runs every housekeeping task, gives the number of items each one removed.'''
+    report = {}
+    for name, task in TASKS.items():
+        try:
+            report[name] = task()
+        except Exception as e: # pylint: disable=broad-except
+            write_unhandled_error(e, f'housekeeping of {name}')
+            report[name] = 0
+    return report
+
+def _run_periodically():
+    '''Runs housekeeping every JANITOR_INTERVAL seconds, for the lifetime of the process.'''
+    while True:
+        time.sleep(settings.JANITOR_INTERVAL)
+        try:
+            run_housekeeping()
+        finally:
+            connection.close()
+
+def start_scheduler():
+    '''Starts housekeeping in the background of this process, unless it is already running.'''
+    global _scheduler # pylint: disable=global-statement
+    if not settings.JANITOR_INTERVAL:
+        return
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = threading.Thread(target=_run_periodically, name='janitor', daemon=True)
+            _scheduler.start()
@@ -0,0 +1,68 @@
+'''Background processing of uploaded documents.'''
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import connection
+from analyzer.io import preview
+from analyzer.io.common import write_unhandled_error
+from analyzer.models import Document, IngestionJob
+from data_ingestion import ai_parsing, file_handling
+
+_executor = ThreadPoolExecutor(max_workers=settings.INGESTION_WORKERS,
+                               thread_name_prefix='ingestion')
+
+def update_job(job_pk, **fields):
+    '''Updates the status fields of a job without touching the rest of the row.'''
+    IngestionJob.objects.filter(pk=job_pk).update(**fields)
+
+def run_upload_job(job_pk):
+    '''Parses the document of a job and writes its ingestion save.'''
+    job = IngestionJob.objects.select_related('document__owner').get(pk=job_pk)
+    try:
+        update_job(job_pk, phase='parsing')
+        processor = file_handling.FileProcessor(
+            job.document.file.path,
+            progress=lambda rows_parsed: update_job(job_pk, rows_parsed=rows_parsed)
+        )
+        # The first rows of line based files can be shown while the rest is parsed.
+        head = processor.parse_head(settings.UPLOAD_PREVIEW_HEAD_ROWS)
+        if head:
+            update_job(job_pk, preview_ready=True, preview=preview.build_preview(head, False))
+        processor.process()
+        if not processor.is_valid():
+            update_job(job_pk, phase='failed', error='Could not parse this file.')
+            return
+
+        update_job(job_pk, phase='saving')
+        file_name = processor.file.save(job.document.owner)
+        rows = processor.file.get_data()
+        update_job(job_pk, phase='done', preview_ready=True, file_name=file_name,
+                   rows_parsed=len(rows), preview=preview.build_preview(rows))
+    except file_handling.InvalidFileException:
+        update_job(job_pk, phase='failed',
+                   error='Could not parse this file. Check that this is a valid file type.')
+    except ai_parsing.WindowParseError as e:
+        update_job(job_pk, phase='failed', error=str(e))
+    except Exception as e: # pylint: disable=broad-except
+        write_unhandled_error(e, "run_upload_job")
+        update_job(job_pk, phase='failed', error='Could not parse this file.')
+
+def _run_in_worker(function, *args):
+    '''Runs a job on a worker thread, which should not keep its database connection.'''
+    try:
+        function(*args)
+    finally:
+        connection.close()
+
+def run_job(function, *args):
+    '''Runs a job on the background workers, or now if INGESTION_BACKGROUND is off.'''
+    if settings.INGESTION_BACKGROUND:
+        _executor.submit(_run_in_worker, function, *args)
+    else:
+        function(*args)
+
+def start_upload_job(document: Document) -> IngestionJob:
+    '''Queues the uploaded document for parsing, returns the job to poll.'''
+    job = IngestionJob.objects.create(document=document)
+    run_job(run_upload_job, job.pk)
+    job.refresh_from_db()
+    return job
@@ -1,9 +1,12 @@
 '''All interactions with NLPTask and running the NLP should go here.'''
-import json
 import sys
+from django.conf import settings
+from django.utils import timezone
+from analyzer.io import statistics
 from analyzer.io.common import AsyncPendingRecord
 from analyzer.models import Message, NLPTask, Profile
 from nlp import nlp
+from nlp.nlp import BULK_PRIORITY
 
 if 'makemigrations' not in sys.argv and 'migrate' not in sys.argv:
     NLP_ANALYZER = nlp.NLPAnalyzer()
@@ -21,22 +24,31 @@ class NLPTaskRecordManager:
                                       .filter(pk=self.selector_pk)).first()
 
     def fulfill(self, model, fulfill_value):
-        '''Fulfills the task.'''
+        '''Fulfills the task, adding its result to the statistics of the message.'''
+        if model.result is None:
+            statistics.record_results([(model.message, fulfill_value)])
         model.result = fulfill_value
+        model.completed_at = timezone.now()
         return model
 
-def run_nlp_on_messages(messages):
-    '''Instantiates tasks to process messages with NLP.'''
+def run_nlp_on_messages(messages, priority=BULK_PRIORITY):
+    '''
+    Instantiates tasks to process messages with NLP, messages with a task are skipped.
+    The messages are queued, use INTERACTIVE_PRIORITY when someone is waiting for them.
+    '''
+    has_task = set(NLPTask.objects.filter(message__in=messages)
+                   .values_list('message_id', flat=True))
+    new_messages = [message for message in messages if message.pk not in has_task]
+    NLPTask.objects.bulk_create([NLPTask(message=message, result=None)
+                                 for message in new_messages],
+                                batch_size=settings.MESSAGE_BATCH_SIZE)
     sentences = []
     pending_records = []
-    for message in messages:
-        if not NLPTask.objects.filter(message=message).exists():
-            NLPTask(message=message, result=None).save()
-            runner = NLPTaskRecordManager(message.pk)
-            sentences.append(message.body)
-            pending_records.append(AsyncPendingRecord(runner.fulfill, runner.selector))
-    threads = NLP_ANALYZER.analyze_pooled(sentences, pending_records)
-    return threads
+    for message in new_messages:
+        runner = NLPTaskRecordManager(message.pk)
+        sentences.append(message.body)
+        pending_records.append(AsyncPendingRecord(runner.fulfill, runner.selector))
+    NLP_ANALYZER.submit(sentences, pending_records, priority)
 
 def get_messages_nlp_progress(messages):
     '''Gets the progress of document processing in percentage.'''
@@ -45,16 +57,6 @@ def get_messages_nlp_progress(messages):
         return 100
     return len(tasks.exclude(result=None)) * 100 / len(tasks)
 
-def wait_nlp_tasks(messages):
-    '''Only returns a list of NLP results if all of them are completed'''
-    nlp_results = []
-    has_tasks_pending = NLPTask.objects.filter(message__in=messages, result=None).exists()
-    if not has_tasks_pending:
-        for message_obj in messages:
-            results = json.loads(NLPTask.objects.get(message=message_obj).result)
-            nlp_results.append(results)
-    return nlp_results, has_tasks_pending
-
 def get_profile_from_topic(topic):
     '''Gets an appropriate profile for a given topic, creates it if needed.'''
     if topic['concept'] != 'PERSON':
@@ -0,0 +1,88 @@
+'''Bounded previews of parsed uploads, for choosing a field mapping.'''
+import itertools
+import random
+from collections import Counter
+from datetime import datetime
+from typing import Any, Callable, Iterable, Sequence
+from django.conf import settings
+
+# Kinds of parsed field values by their type, booleans first as they are also integers.
+VALUE_TYPES: tuple[tuple[type|tuple[type, ...], str], ...] = (
+    (bool, 'boolean'), ((int, float), 'number'), (dict, 'object'), (list, 'list'))
+# Kinds of field values given as text, by the function parsing them.
+TEXT_TYPES: tuple[tuple[str, Callable[[str], Any]], ...] = (
+    ('number', float), ('datetime', datetime.fromisoformat))
+
+def get_text_type(text: str) -> str:
+    '''Gets the kind of a field value given as text, a number, a datetime or text.'''
+    for kind, parse in TEXT_TYPES:
+        try:
+            parse(text)
+            return kind
+        except ValueError:
+            pass
+    return 'text'
+
+def get_value_type(value: Any) -> str|None:
+    '''Gets the kind of a field value shown in the preview, None if the field is empty.'''
+    if value is None or value == '':
+        return None
+    for value_type, kind in VALUE_TYPES:
+        if isinstance(value, value_type):
+            return kind
+    return get_text_type(str(value).strip())
+
+def sample_rows(rows: Iterable[dict], head: int, size: int) -> tuple[list[dict], int]:
+    '''
+    Gets the first head rows and a uniform random sample of size of the rest, in their order
+    in the file, with the total number of rows. Rows are read once, so this works on streams.
+    '''
+    if isinstance(rows, Sequence):
+        indices = range(head, len(rows))
+        sampled = sorted(random.sample(indices, min(size, len(indices))))
+        return list(rows[:head]) + [rows[index] for index in sampled], len(rows)
+
+    rows = iter(rows)
+    head_rows = list(itertools.islice(rows, head))
+    reservoir: list[tuple[int, dict]] = []
+    total = len(head_rows)
+    for index, row in enumerate(rows):
+        total += 1
+        if index < size:
+            reservoir.append((index, row))
+        elif (replace := random.randrange(index + 1)) < size:
+            reservoir[replace] = (index, row)
+    return head_rows + [row for _, row in sorted(reservoir, key=lambda item: item[0])], total
+
+def get_field_stats(rows: list[dict]) -> dict[str, dict]:
+    '''Gets how often each field is filled in the rows, and the kinds of its values.'''
+    stats: dict[str, dict] = {}
+    for row in rows:
+        for field, value in row.items():
+            field_stats = stats.setdefault(field, {'filled': 0, 'types': Counter()})
+            value_type = get_value_type(value)
+            if value_type is not None:
+                field_stats['filled'] += 1
+                field_stats['types'][value_type] += 1
+    for field_stats in stats.values():
+        field_stats['fill_rate'] = round(field_stats['filled'] / len(rows), 3)
+        field_stats['types'] = dict(field_stats['types'].most_common())
+    return stats
+
+def build_preview(rows: Iterable[dict], complete: bool = True) -> dict:
+    '''
+    Builds the preview of parsed rows: the head of the file and a random sample of the rest,
+    the fields found in them, and statistics of each field over the previewed rows.
+    complete is False for a preview of the first rows of a file that is still being parsed.
+    '''
+    preview_rows, total = sample_rows(rows, settings.UPLOAD_PREVIEW_HEAD_ROWS,
+                                      settings.UPLOAD_PREVIEW_SAMPLE_ROWS)
+    preview_rows = [row for row in preview_rows if isinstance(row, dict)]
+    return {
+        'rows': preview_rows,
+        'fields': list(dict.fromkeys(field for row in preview_rows for field in row)),
+        'field_stats': get_field_stats(preview_rows),
+        'total_rows': total,
+        'sampled': total > len(preview_rows),
+        'complete': complete,
+    }
@@ -1,19 +1,85 @@
-"""Helper function for relations between users."""
-from analyzer.models import Document, Message
+"""
+Relations between profiles who sent messages in the same documents.
 
-def get_document_profiles(document):
-    """Gathers names of all people mentioned in a document."""
-    all_document_profiles = set(message.owner
-        for message in Message.objects.filter(source=document))
-    return all_document_profiles
+The relations are weighted by the number of documents two profiles both sent messages in, and
+are updated as each profile sends its first message in a document, see
+statistics.StatisticsUpdate, so the profile page reads them instead of every message.
+"""
+from collections import Counter
+from itertools import combinations
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from analyzer.models import DocumentParticipant, ProfileRelation
 
-def set_profile_relation(profile):
-    """Gathers and then sets profile relations."""
-    related_profiles = set()
-    for document in Document.objects.all():
-        document_profiles = get_document_profiles(document)
-        if profile not in document_profiles:
-            continue
-        document_profiles.discard(profile)
-        related_profiles |= document_profiles
-    profile.related_profiles.add(*related_profiles)
+def get_pairs(profile_ids, others=()) -> Counter[tuple[int, int]]:
+    """Gets every pair of the profiles, and of the profiles with others, in both directions."""
+    pairs: Counter[tuple[int, int]] = Counter()
+    profile_ids = sorted(set(profile_ids))
+    for left, right in combinations(profile_ids, 2):
+        pairs[(left, right)] += 1
+        pairs[(right, left)] += 1
+    for left in profile_ids:
+        for right in others:
+            pairs[(left, right)] += 1
+            pairs[(right, left)] += 1
+    return pairs
+
+def add_relations(pairs: Counter[tuple[int, int]]):
+    """Adds documents to the relations of pairs of profiles, creating those which are new."""
+    keys = list(pairs)
+    existing: dict[tuple[int, int], int] = {}
+    for start in range(0, len(keys), settings.MESSAGE_BATCH_SIZE):
+        batch = keys[start:start + settings.MESSAGE_BATCH_SIZE]
+        for pk, left, right in (ProfileRelation.objects
+                                .filter(from_profile__in={key[0] for key in batch},
+                                        to_profile__in={key[1] for key in batch})
+                                .values_list('pk', 'from_profile_id', 'to_profile_id')):
+            existing[(left, right)] = pk
+    ProfileRelation.objects.bulk_create(
+        [ProfileRelation(from_profile_id=left, to_profile_id=right, document_count=count)
+         for (left, right), count in pairs.items() if (left, right) not in existing],
+        batch_size=settings.MESSAGE_BATCH_SIZE)
+    for key, pk in existing.items():
+        if key in pairs:
+            ProfileRelation.objects.filter(pk=pk).update(
+                document_count=F('document_count') + pairs[key])
+
+def add_participants(joined: dict):
+    """
+    Relates profiles who sent their first messages in documents to the other profiles of the
+    documents, joined are the keys of the new profiles by document. Their participation must
+    already be saved.
+    """
+    pairs: Counter[tuple[int, int]] = Counter()
+    for document_id, profile_ids in joined.items():
+        others = (DocumentParticipant.objects.filter(document_id=document_id)
+                  .exclude(profile_id__in=profile_ids).values_list('profile_id', flat=True))
+        pairs.update(get_pairs(profile_ids, list(others)))
+    add_relations(pairs)
+
+def rebuild_relations() -> dict:
+    """
+    Computes the relations of every profile again from the participants of every document,
+    e.g. for documents inserted before relations were kept.
+    """
+    pairs: Counter[tuple[int, int]] = Counter()
+    participants: list[int] = []
+    document = None
+    for document_id, profile_id in (DocumentParticipant.objects.order_by('document_id')
+                                    .values_list('document_id', 'profile_id')
+                                    .iterator(chunk_size=settings.MESSAGE_BATCH_SIZE)):
+        if document_id != document:
+            pairs.update(get_pairs(participants))
+            participants, document = [], document_id
+        participants.append(profile_id)
+    pairs.update(get_pairs(participants))
+    with transaction.atomic():
+        ProfileRelation.objects.all().delete()
+        add_relations(pairs)
+    return {'profiles': len({left for left, _ in pairs}), 'relations': len(pairs) // 2}
+
+def get_related_profiles(profile) -> list[ProfileRelation]:
+    """Gets the relations of a profile, the profiles it shares the most documents with first."""
+    return list(ProfileRelation.objects.filter(from_profile=profile).select_related('to_profile')
+                .order_by('-document_count', 'to_profile__name'))
@@ -0,0 +1,79 @@
+'''
+Response times of messages, the time since the previous message of their document.
+
+Response times are stored with each message as it is inserted, so the dashboard reads them
+instead of comparing the date of every message with the one before it on each load. They are
+computed in one ordered pass with the LAG window function, from the earliest inserted message
+onwards, as messages inserted later may be dated between messages of the document.
+'''
+from typing import cast
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import DateTimeField, F, Field, Window
+from django.db.models.functions import Lag
+from django.utils import timezone
+from analyzer.models import Document, Message
+
+def get_response_time(date, previous_date) -> float|None:
+    '''Gets the seconds between a message and the previous one, None if there is none.'''
+    return None if previous_date is None else (date - previous_date).total_seconds()
+
+def update_response_times(document_id, since=None) -> int:
+    '''
+    Computes the response times of the messages of a document dated since since, by default
+    of every message. Only the messages whose response time changed are saved, gives how many.
+    '''
+    messages = Message.objects.filter(source_id=document_id)
+    previous_date = None
+    if since is not None:
+        previous_date = (messages.filter(date__lt=since).order_by('-date', '-pk')
+                         .values_list('date', flat=True).first())
+        messages = messages.filter(date__gte=since)
+    order = (F('date').asc(), F('pk').asc())
+    rows = (messages.annotate(previous_date=Window(Lag('date'), order_by=order))
+            .order_by(*order)
+            .values_list('pk', 'date', 'previous_date', 'response_time')
+            .iterator(chunk_size=settings.MESSAGE_BATCH_SIZE))
+
+    changed = []
+    for index, (pk, date, lag, response_time) in enumerate(rows):
+        # The first message has no previous message within those selected.
+        response = get_response_time(date, previous_date if index == 0 else lag)
+        if response != response_time:
+            changed.append((response, pk))
+    save_response_times(changed)
+    return len(changed)
+
+def save_response_times(changed: list[tuple[float|None, int]]):
+    '''
+    Saves response times, given as pairs of a response time and the key of its message.
+    bulk_update builds an expression for every message, which takes most of the time for large
+    documents, so they are saved with one parameterised statement instead.
+    '''
+    quote = connection.ops.quote_name
+    statement = (f'UPDATE {quote(Message._meta.db_table)} SET {quote("response_time")} = %s '
+                 f'WHERE {quote(cast(Field, Message._meta.pk).column)} = %s')
+    with transaction.atomic(), connection.cursor() as cursor:
+        for start in range(0, len(changed), settings.MESSAGE_BATCH_SIZE):
+            cursor.executemany(statement, changed[start:start + settings.MESSAGE_BATCH_SIZE])
+
+def record_messages(messages):
+    '''Computes the response times of the documents of inserted messages.'''
+    earliest = {}
+    for message in messages:
+        date = DateTimeField().to_python(message.date)
+        if timezone.is_naive(date):
+            date = timezone.make_aware(date, timezone.get_default_timezone())
+        if message.source_id not in earliest or date < earliest[message.source_id]:
+            earliest[message.source_id] = date
+    for document_id, since in earliest.items():
+        update_response_times(document_id, since)
+
+def backfill_response_times() -> dict:
+    '''
+    Computes the response times of the messages of every document which is not archived,
+    e.g. for messages inserted before response times were stored.
+    '''
+    documents = list(Document.objects.filter(archived_at=None).values_list('pk', flat=True))
+    return {'documents': len(documents),
+            'messages': sum(update_response_times(document) for document in documents)}
@@ -0,0 +1,191 @@
+'''
+Full-text search over the bodies of messages.
+
+Message bodies are indexed in an SQLite FTS5 table, with the messages table as its content so
+the bodies are not stored twice. Triggers keep the index in sync as messages are inserted,
+edited and deleted, including by bulk inserts and archiving, and the index and triggers are
+created after migrating, see create_search_index. Results are ranked with BM25 and paged by
+keyset, the rank and key of the last result, so later pages take as long as the first.
+'''
+import html
+import re
+from datetime import datetime
+from typing import cast
+from django.conf import settings
+from django.db import connections, DEFAULT_DB_ALIAS
+from django.db.models import DateTimeField, Field, UUIDField
+from analyzer.models import Document, Message, SystemUser
+
+SEARCH_TABLE = 'analyzer_message_fts'
+
+# Columns of the primary keys of messages and documents, which every model has.
+MESSAGE_KEY = cast(Field, Message._meta.pk).column
+DOCUMENT_KEY = cast(Field, Document._meta.pk).column
+
+# Matches are marked in snippets with characters which are not in message bodies, which are
+# replaced with tags once the snippet is escaped.
+MATCH_START = '\ue000'
+MATCH_END = '\ue001'
+
+QUERY_TOKEN = re.compile(r'"([^"]*)"?|(\S+)')
+WORD = re.compile(r'\w+')
+
+def get_search_statements(quote) -> list[str]:
+    '''Gets the statements creating the index and the triggers keeping it in sync.'''
+    table, messages = quote(SEARCH_TABLE), quote(Message._meta.db_table)
+    key, body = quote(MESSAGE_KEY), quote('body')
+    insert = f'INSERT INTO {table}(rowid, body) VALUES (new.{key}, new.{body});'
+    delete = (f"INSERT INTO {table}({table}, rowid, body) "
+              f"VALUES ('delete', old.{key}, old.{body});")
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {table} USING fts5(body, content={messages}, "
+        f"content_rowid={key}, tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+        f'CREATE TRIGGER IF NOT EXISTS {quote(SEARCH_TABLE + "_insert")} AFTER INSERT ON '
+        f'{messages} BEGIN {insert} END',
+        f'CREATE TRIGGER IF NOT EXISTS {quote(SEARCH_TABLE + "_delete")} AFTER DELETE ON '
+        f'{messages} BEGIN {delete} END',
+        f'CREATE TRIGGER IF NOT EXISTS {quote(SEARCH_TABLE + "_update")} AFTER UPDATE OF body ON '
+        f'{messages} BEGIN {delete} {insert} END',
+    ]
+
+def create_search_index(using=DEFAULT_DB_ALIAS, **_kwargs):
+    '''
+    Creates the search index and its triggers if they do not exist, indexing every message
+    when the index is new. Connected to post_migrate, as there is no migration for them, so
+    it does nothing until the messages table has been created.
+    '''
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        if Message._meta.db_table not in connection.introspection.table_names(cursor):
+            return
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s",
+                       [SEARCH_TABLE])
+        exists = cursor.fetchone() is not None
+        for statement in get_search_statements(connection.ops.quote_name):
+            cursor.execute(statement)
+        if not exists:
+            rebuild_search_index(using)
+
+def rebuild_search_index(using=DEFAULT_DB_ALIAS):
+    '''Indexes every message again, e.g. for messages inserted before the index existed.'''
+    connection = connections[using]
+    table = connection.ops.quote_name(SEARCH_TABLE)
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {table}({table}) VALUES ('rebuild')")
+
+def get_match_query(text: str) -> str:
+    '''
+    Gets the FTS5 query of what was typed into search: words, which must all match, phrases
+    in double quotes, and prefixes ending with *. Other syntax is ignored, so any text is a
+    valid query. Raises ValueError if it has no words.
+    '''
+    terms = []
+    for phrase, token in QUERY_TOKEN.findall(text):
+        words = WORD.findall(phrase or token)
+        if not words:
+            continue
+        if phrase:
+            terms.append(f'"{" ".join(words)}"')
+            continue
+        terms.extend(f'"{word}"' for word in words)
+        if token.endswith('*'):
+            terms[-1] += '*'
+    if not terms:
+        raise ValueError('The search has no words.')
+    return ' '.join(terms)
+
+def get_cursor(key: int, rank: float) -> str:
+    '''Gets the cursor of the page of results after the result of key and rank.'''
+    return f'{rank!r}:{key}'
+
+def parse_cursor(cursor: str) -> tuple[float, int]:
+    '''Gets the rank and key of a cursor, raises ValueError if it is not one.'''
+    try:
+        rank, key = cursor.split(':')
+        return float(rank), int(key)
+    except ValueError as error:
+        raise ValueError('The cursor of the page is invalid.') from error
+
+def get_snippet(snippet: str) -> str:
+    '''Escapes a snippet of a message body as HTML, with its matches in mark tags.'''
+    return html.escape(snippet).replace(MATCH_START, '<mark>').replace(MATCH_END, '</mark>')
+
+class SearchFilters:
+    '''Filters of a search of messages, all optional. end is exclusive.'''
+
+    def __init__(self, document: str|None = None, profile: int|None = None,
+                 start: datetime|None = None, end: datetime|None = None):
+        self.document = document
+        self.profile = profile
+        self.start = start
+        self.end = end
+
+    def get_conditions(self, connection) -> tuple[list[str], list]:
+        '''Gets the conditions on the messages table m of the filters, with their parameters.'''
+        conditions, parameters = [], []
+        if self.document is not None:
+            conditions.append('m.source_id = %s')
+            parameters.append(UUIDField().get_db_prep_value(self.document, connection))
+        if self.profile is not None:
+            conditions.append('m.owner_id = %s')
+            parameters.append(self.profile)
+        for value, operator in ((self.start, '>='), (self.end, '<')):
+            if value is not None:
+                conditions.append(f'm.date {operator} %s')
+                parameters.append(DateTimeField().get_db_prep_value(value, connection))
+        return conditions, parameters
+
+def search_messages(user, text: str, filters: SearchFilters|None = None, after: str|None = None,
+                    limit: int|None = None) -> dict:
+    '''
+    Searches the messages of the documents of a user for text, see get_match_query, best
+    matches first, in pages of limit results, by default SEARCH_PAGE_SIZE. Gives the results
+    with the cursor of the next page, None if it is the last, which is passed as after.
+    Raises ValueError if the text has no words or after is not a cursor.
+    '''
+    connection = connections[DEFAULT_DB_ALIAS]
+    quote = connection.ops.quote_name
+    table, key = quote(SEARCH_TABLE), quote(MESSAGE_KEY)
+    limit = settings.SEARCH_PAGE_SIZE if limit is None else limit
+
+    conditions, parameters = (filters or SearchFilters()).get_conditions(connection)
+    conditions = [f'{table} MATCH %s', 'd.accepted', 'd.is_ingestion_output'] + conditions
+    parameters = [get_match_query(text)] + parameters
+    if not user.is_superuser:
+        conditions.append('d.owner_id = %s')
+        parameters.append(SystemUser.objects.get(user=user).pk)
+    if after is not None:
+        conditions.append(f'({table}.rank, m.{key}) > (%s, %s)')
+        parameters.extend(parse_cursor(after))
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT m.{key}, {table}.rank, snippet({table}, 0, %s, %s, '…', 16) FROM {table} "
+            f'JOIN {quote(Message._meta.db_table)} m ON m.{key} = {table}.rowid '
+            f'JOIN {quote(Document._meta.db_table)} d '
+            f'ON d.{quote(DOCUMENT_KEY)} = m.source_id '
+            f'WHERE {" AND ".join(conditions)} ORDER BY {table}.rank, m.{key} LIMIT %s',
+            [MATCH_START, MATCH_END] + parameters + [limit + 1])
+        rows = cursor.fetchall()
+
+    page = rows[:limit]
+    messages = Message.objects.select_related('source', 'owner').in_bulk(
+        [pk for pk, _, _ in page])
+    return {
+        'results': [get_result(messages[pk], rank, snippet) for pk, rank, snippet in page],
+        'next': get_cursor(*page[-1][:2]) if len(rows) > limit else None,
+    }
+
+def get_result(message: Message, rank: float, snippet: str) -> dict:
+    '''Gets a result of a search as JSON.'''
+    return {
+        'id': message.pk,
+        'rank': rank,
+        'snippet': get_snippet(snippet),
+        'date': message.date.isoformat(),
+        'document': {'uuid': str(message.source_id), 'display_name': message.source.display_name,
+                     'url': message.source.get_url()},
+        'profile': {'id': message.owner_id, 'name': message.owner.name},
+    }
@@ -0,0 +1,324 @@
+'''
+Statistics of documents and profiles, maintained incrementally.
+
+Message counts, running sums of the NLP results and histograms of risk and sentiment are
+updated as messages are inserted and as their results land, so the dashboards and profile
+pages read a single row instead of every message of a document or profile. Each update bumps
+the version of the statistics, which keys the cache of rendered graphs.
+
+The statistics of profiles also hold the mean risk of each day, and the documents the profile
+sent messages in, which is all the profile page draws.
+
+The topics mentioned by each profile in each document are kept alongside as TopicMention rows,
+an index from topic to the documents and profiles which mentioned it, so the topics documents
+have in common are queried from it instead of from every NLP result.
+'''
+import json
+import threading
+from collections import Counter
+from datetime import date, timezone as dt_timezone
+from typing import Any
+from uuid import UUID
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, DateTimeField, F
+from django.utils import timezone
+import numpy as np
+from analyzer.io import relation
+from analyzer.models import (Document, DocumentParticipant, DocumentStatistics, Message, Profile,
+                             ProfileStatistics, TopicMention)
+
+# Fields of the statistics which are running sums, with the field of the NLP result they sum.
+SUMMED_FIELDS = {
+    'risk': 'risk',
+    'sentiment': 'sentiment',
+    'joy': 'joy_extreme',
+    'sad': 'sad_extreme',
+    'anger': 'anger_extreme',
+    'fear': 'fear_extreme',
+}
+HISTOGRAM_FIELDS = ('risk', 'sentiment')
+
+# Histograms are read, updated and written back, which must not interleave between the NLP
+# workers of a process.
+_lock = threading.Lock()
+
+def parse_result(result: str|dict) -> dict[str, Any]:
+    '''Gets an NLP result, as stored in NLPTask.result or already parsed, as a dict.'''
+    return json.loads(result) if isinstance(result, str) else result
+
+def get_bin(value: float) -> int:
+    '''Gets the histogram bin of a value in [-1, 1], values outside are in the outer bins.'''
+    bins = settings.STATISTICS_HISTOGRAM_BINS
+    return min(max(int((value + 1) / 2 * bins), 0), bins - 1)
+
+def get_day(message_date) -> str:
+    '''Gets the day of the timeline of a message date, a datetime or string, in UTC.'''
+    message_date = DateTimeField().to_python(message_date)
+    if timezone.is_naive(message_date):
+        message_date = timezone.make_aware(message_date, timezone.get_default_timezone())
+    return message_date.astimezone(dt_timezone.utc).date().isoformat()
+
+def get_bin_edges() -> list[float]:
+    '''Gets the edges of the histogram bins, from -1 to 1.'''
+    bins = settings.STATISTICS_HISTOGRAM_BINS
+    return [-1 + 2 * index / bins for index in range(bins + 1)]
+
+class StatisticsDelta:
+    '''Changes to be added to the statistics of a document or profile.'''
+
+    def __init__(self):
+        self.messages = 0
+        self.profiles = 0
+        self.analysed = 0
+        self.sums = dict.fromkeys(SUMMED_FIELDS, 0.0)
+        self.histograms = {field: [0] * settings.STATISTICS_HISTOGRAM_BINS
+                           for field in HISTOGRAM_FIELDS}
+        self.timeline = {}
+        self.document_ids = []
+
+    def add_result(self, result: str|dict, day: str|None = None):
+        '''
+        Adds an NLP result, as stored in NLPTask.result or parsed, to the timeline at day if
+        given, see get_day.
+        '''
+        parsed = parse_result(result)
+        self.analysed += 1
+        if day is not None:
+            count, risk_sum = self.timeline.get(day, (0, 0.0))
+            self.timeline[day] = (count + 1, risk_sum + parsed.get('risk', 0))
+        for field, key in SUMMED_FIELDS.items():
+            self.sums[field] += parsed.get(key, 0)
+        for field in HISTOGRAM_FIELDS:
+            if field in parsed:
+                self.histograms[field][get_bin(parsed[field])] += 1
+
+    def apply(self, statistics: DocumentStatistics|ProfileStatistics):
+        '''Adds the changes to statistics, which are saved.'''
+        statistics.message_count += self.messages
+        statistics.analysed_count += self.analysed
+        for field, value in self.sums.items():
+            setattr(statistics, f'{field}_sum', getattr(statistics, f'{field}_sum') + value)
+        for field, delta in self.histograms.items():
+            histogram = getattr(statistics, f'{field}_histogram')
+            if len(histogram) != len(delta):
+                # STATISTICS_HISTOGRAM_BINS changed, rebuild_statistics bins them again.
+                histogram = [0] * len(delta)
+            setattr(statistics, f'{field}_histogram',
+                    [count + added for count, added in zip(histogram, delta)])
+        if isinstance(statistics, DocumentStatistics):
+            statistics.profile_count += self.profiles
+        else:
+            for day, (count, risk_sum) in self.timeline.items():
+                previous = statistics.risk_timeline.get(day, (0, 0.0))
+                statistics.risk_timeline[day] = [previous[0] + count, previous[1] + risk_sum]
+            statistics.document_ids += self.document_ids
+        statistics.version += 1
+        statistics.save()
+
+class StatisticsUpdate:
+    '''Changes to the statistics of several documents and profiles, added in one transaction.'''
+
+    def __init__(self):
+        self.documents: dict[str, StatisticsDelta] = {}
+        self.profiles: dict[int, StatisticsDelta] = {}
+        self.participants = Counter()
+        self.topics = Counter()
+
+    def get_deltas(self, document_id, profile_id) -> tuple[StatisticsDelta, StatisticsDelta]:
+        '''Gets the changes to the statistics of a document and a profile.'''
+        return (self.documents.setdefault(document_id, StatisticsDelta()),
+                self.profiles.setdefault(profile_id, StatisticsDelta()))
+
+    def add_message(self, document_id, profile_id):
+        '''Adds an inserted message.'''
+        for delta in self.get_deltas(document_id, profile_id):
+            delta.messages += 1
+        self.participants[(document_id, profile_id)] += 1
+
+    def add_result(self, document_id, profile_id, result: str|dict, message_date=None):
+        '''Adds the NLP result of a message, to the timeline of the profile if dated.'''
+        parsed = parse_result(result)
+        day = None if message_date is None else get_day(message_date)
+        for delta in self.get_deltas(document_id, profile_id):
+            delta.add_result(parsed, day)
+        self.add_topics(document_id, profile_id, parsed)
+
+    def add_topics(self, document_id, profile_id, result: dict[str, Any]):
+        '''Adds the topics of the NLP result of a message, each once.'''
+        for keyword in dict.fromkeys(topic[0] for topic in result.get('topics', ())):
+            self.topics[(keyword, document_id, profile_id)] += 1
+
+    def apply_topics(self):
+        '''Adds the topic mentions, creating those which are new.'''
+        keys = list(self.topics)
+        existing = {}
+        for start in range(0, len(keys), settings.MESSAGE_BATCH_SIZE):
+            batch = keys[start:start + settings.MESSAGE_BATCH_SIZE]
+            for pk, *key in (TopicMention.objects.filter(
+                    keyword__in={key[0] for key in batch}, document__in={key[1] for key in batch})
+                    .values_list('pk', 'keyword', 'document_id', 'profile_id')):
+                existing[tuple(key)] = pk
+        TopicMention.objects.bulk_create(
+            [TopicMention(keyword=keyword, document_id=document_id, profile_id=profile_id,
+                          message_count=count)
+             for (keyword, document_id, profile_id), count in self.topics.items()
+             if (keyword, document_id, profile_id) not in existing],
+            batch_size=settings.MESSAGE_BATCH_SIZE)
+        for key, pk in existing.items():
+            if key in self.topics:
+                TopicMention.objects.filter(pk=pk).update(
+                    message_count=F('message_count') + self.topics[key])
+
+    def apply(self):
+        '''Adds the changes to the statistics, the lock must be held.'''
+        with transaction.atomic():
+            joined = {}
+            for (document_id, profile_id), count in self.participants.items():
+                participant, created = DocumentParticipant.objects.get_or_create(
+                    document_id=document_id, profile_id=profile_id)
+                DocumentParticipant.objects.filter(pk=participant.pk).update(
+                    message_count=F('message_count') + count)
+                self.documents[document_id].profiles += created
+                if created:
+                    joined.setdefault(document_id, []).append(profile_id)
+                    self.profiles.setdefault(profile_id, StatisticsDelta()).document_ids.append(
+                        str(document_id))
+            if joined:
+                relation.add_participants(joined)
+            if self.topics:
+                self.apply_topics()
+            for document_id, delta in self.documents.items():
+                delta.apply(DocumentStatistics.objects.select_for_update()
+                            .get_or_create(document_id=document_id)[0])
+            for profile_id, delta in self.profiles.items():
+                delta.apply(ProfileStatistics.objects.select_for_update()
+                            .get_or_create(profile_id=profile_id)[0])
+
+def record_messages(messages):
+    '''Adds inserted messages to the statistics of their documents and profiles.'''
+    update = StatisticsUpdate()
+    for message in messages:
+        update.add_message(message.source_id, message.owner_id)
+    with _lock:
+        update.apply()
+
+def record_results(results):
+    '''
+    Adds NLP results to the statistics of the documents and profiles of their messages,
+    results are pairs of a message and its result. Each result must only be added once.
+    '''
+    update = StatisticsUpdate()
+    for message, result in results:
+        update.add_result(message.source_id, message.owner_id, result, message.date)
+    with _lock:
+        update.apply()
+
+def rebuild_statistics(documents=None, profiles=None):
+    '''
+    Computes the statistics of documents and profiles from their messages again, by default
+    of every one, e.g. for messages inserted before statistics were kept. The statistics of
+    archived documents are left as they are, as their messages are not in the database, so
+    the statistics of profiles only count messages which are not archived.
+    '''
+    documents = Document.objects.filter(archived_at=None, **(
+        {} if documents is None else {'pk__in': [document.pk for document in documents]}))
+    profiles = Profile.objects.filter(
+        **({} if profiles is None else {'pk__in': [profile.pk for profile in profiles]}))
+    document_ids = list(documents.values_list('pk', flat=True))
+    profile_ids = list(profiles.values_list('pk', flat=True))
+
+    update = StatisticsUpdate()
+    for document_id in document_ids:
+        update.documents[document_id] = StatisticsDelta()
+    for profile_id in profile_ids:
+        update.profiles[profile_id] = StatisticsDelta()
+
+    for document_id, profile_id, result in (
+            Message.objects.filter(source__in=documents)
+            .values_list('source_id', 'owner_id', 'nlptask__result')
+            .iterator(chunk_size=settings.MESSAGE_BATCH_SIZE)):
+        delta = update.documents[document_id]
+        delta.messages += 1
+        update.participants[(document_id, profile_id)] += 1
+        if result is not None:
+            result = json.loads(result)
+            delta.add_result(result)
+            update.add_topics(document_id, profile_id, result)
+    for profile_id, message_date, result in (
+            Message.objects.filter(owner__in=profiles)
+            .values_list('owner_id', 'date', 'nlptask__result')
+            .iterator(chunk_size=settings.MESSAGE_BATCH_SIZE)):
+        delta = update.profiles[profile_id]
+        delta.messages += 1
+        if result is not None:
+            delta.add_result(result, get_day(message_date))
+
+    # The statistics are emptied rather than removed, so that their versions keep increasing.
+    empty = {'message_count': 0, 'analysed_count': 0, 'risk_histogram': [],
+             'sentiment_histogram': []} | {f'{field}_sum': 0 for field in SUMMED_FIELDS}
+    with _lock, transaction.atomic():
+        DocumentStatistics.objects.filter(document__in=documents).update(profile_count=0, **empty)
+        DocumentParticipant.objects.filter(document__in=documents).delete()
+        TopicMention.objects.filter(document__in=documents).delete()
+        ProfileStatistics.objects.filter(profile__in=profiles).update(risk_timeline={}, **empty)
+        update.apply()
+        # The documents of the profiles are set from their participants, as the participants of
+        # documents left out of the rebuild were not added again.
+        profile_documents = {}
+        for profile_id, document_id in (DocumentParticipant.objects.filter(profile__in=profiles)
+                                        .order_by('pk').values_list('profile_id', 'document_id')):
+            profile_documents.setdefault(profile_id, []).append(str(document_id))
+        for profile_id in profile_ids:
+            ProfileStatistics.objects.filter(profile_id=profile_id).update(
+                document_ids=profile_documents.get(profile_id, []))
+        # The participants were deleted and added again, which counted their relations twice.
+        relation.rebuild_relations()
+    return {'documents': len(document_ids), 'profiles': len(profile_ids)}
+
+def bump_versions(document_ids=(), profile_ids=()):
+    '''
+    Marks that the data of documents and profiles changed without changing their statistics,
+    e.g. as they were archived or analysed by OpenAI, so that their graphs are drawn again.
+    '''
+    documents = Document.objects.filter(pk__in=document_ids)
+    profiles = Profile.objects.filter(pk__in=profile_ids)
+    with _lock, transaction.atomic():
+        for document_id in documents.values_list('pk', flat=True):
+            DocumentStatistics.objects.get_or_create(document_id=document_id)
+        for profile_id in profiles.values_list('pk', flat=True):
+            ProfileStatistics.objects.get_or_create(profile_id=profile_id)
+        DocumentStatistics.objects.filter(document__in=document_ids).update(
+            version=F('version') + 1)
+        ProfileStatistics.objects.filter(profile__in=profile_ids).update(
+            version=F('version') + 1)
+
+def get_profile_statistics(profile: Profile) -> ProfileStatistics:
+    '''Gets the statistics of a profile, empty if it has not sent messages.'''
+    return (ProfileStatistics.objects.filter(profile=profile).first()
+            or ProfileStatistics(profile=profile))
+
+def get_risk_timeline(statistics: ProfileStatistics) -> tuple[np.ndarray, np.ndarray]:
+    '''
+    Gets the days of the timeline of a profile in order, as proleptic Gregorian ordinals, with
+    the mean risk of the messages of each day.
+    '''
+    days = sorted(statistics.risk_timeline)
+    counts = np.array([statistics.risk_timeline[day][0] for day in days], dtype=float)
+    sums = np.array([statistics.risk_timeline[day][1] for day in days], dtype=float)
+    return (np.array([date.fromisoformat(day).toordinal() for day in days], dtype=float),
+            np.divide(sums, counts, out=np.zeros_like(sums), where=counts > 0))
+
+def get_shared_topics(document_ids) -> list[tuple[str, UUID, str, int]]:
+    '''
+    Gets the topics mentioned in more than one of the documents, as tuples of the keyword, the
+    key of a document it was mentioned in, the name of the profile who mentioned it there and
+    in how many messages, ordered by keyword and document.
+    '''
+    document_ids = list(document_ids)
+    shared = (TopicMention.objects.filter(document__in=document_ids)
+              .values('keyword').annotate(documents=Count('document', distinct=True))
+              .filter(documents__gt=1).values('keyword'))
+    return list(TopicMention.objects.filter(document__in=document_ids, keyword__in=shared)
+                .order_by('keyword', 'document_id', 'pk')
+                .values_list('keyword', 'document_id', 'profile__name', 'message_count'))
@@ -0,0 +1,115 @@
+'''
+Transparent compression of the files kept in the media store.
+
+Uploaded originals and ingestion saves are compressed with gzip when MEDIA_GZIP is set, under the
+same names, so records do not change. Whether a file is compressed is detected from its content
+when it is read, so files stored either way can be read.
+'''
+import gzip
+import os
+import shutil
+import struct
+import tempfile
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+
+GZIP_MAGIC = b'\x1f\x8b'
+# These formats are already compressed, and are read by libraries which need the file itself.
+INCOMPRESSIBLE_EXTENSIONS = ('.docx', '.zip')
+COPY_BUFFER_SIZE = 1024 * 1024
+
+def is_compressed(path: str) -> bool:
+    '''Whether a stored file is compressed with gzip.'''
+    with open(path, 'rb') as file:
+        return file.read(2) == GZIP_MAGIC
+
+def is_compressible(path: str) -> bool:
+    '''Whether a file of this type is worth compressing.'''
+    return os.path.splitext(path)[1].lower() not in INCOMPRESSIBLE_EXTENSIONS
+
+def should_compress(path: str) -> bool:
+    '''Whether a file written to this path should be compressed.'''
+    return settings.MEDIA_GZIP and is_compressible(path)
+
+def open_stored(path: str, mode: str = 'rb', encoding: str|None = None):
+    '''Opens a stored file for reading, decompressing it if needed.'''
+    # pylint: disable=consider-using-with
+    if is_compressed(path):
+        return gzip.open(path, mode, encoding=encoding)
+    return open(path, mode, encoding=encoding)
+
+def open_for_write(path: str, mode: str = 'wb', encoding: str|None = None):
+    '''
+    Opens a stored file for writing, compressed if MEDIA_GZIP is set. Appending keeps the
+    compression of the existing file, gzip members can be concatenated.
+    '''
+    # pylint: disable=consider-using-with
+    if mode.startswith('a') and os.path.exists(path) and os.path.getsize(path):
+        compress = is_compressed(path)
+    else:
+        compress = should_compress(path)
+    if compress:
+        return gzip.open(path, mode, compresslevel=settings.MEDIA_GZIP_LEVEL, encoding=encoding)
+    return open(path, mode, encoding=encoding)
+
+def get_uncompressed_size(path: str) -> int:
+    '''
+    Gets the size of the content of a stored file. For compressed files this is read from the
+    gzip trailer, which holds the size modulo 2^32 of the last member only.
+    '''
+    if not is_compressed(path):
+        return os.path.getsize(path)
+    with open(path, 'rb') as file:
+        file.seek(-4, os.SEEK_END)
+        return struct.unpack('<I', file.read(4))[0]
+
+def rewrite(path: str, compress: bool):
+    '''Rewrites a stored file compressed or not, replacing it only once it is fully written.'''
+    directory = os.path.dirname(path)
+    with tempfile.NamedTemporaryFile(dir=directory, delete=False) as temp:
+        temp_path = temp.name
+    try:
+        with open_stored(path) as source, (
+                gzip.open(temp_path, 'wb', compresslevel=settings.MEDIA_GZIP_LEVEL)
+                if compress else open(temp_path, 'wb')) as target:
+            shutil.copyfileobj(source, target, COPY_BUFFER_SIZE)
+        shutil.copymode(path, temp_path)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+def compress_file(path: str) -> bool:
+    '''Compresses a stored file in place, gives whether it was compressed by this call.'''
+    if is_compressed(path) or not is_compressible(path):
+        return False
+    rewrite(path, True)
+    return True
+
+def decompress_file(path: str) -> bool:
+    '''Decompresses a stored file in place, gives whether it was decompressed by this call.'''
+    if not is_compressed(path):
+        return False
+    rewrite(path, False)
+    return True
+
+def store_file(source: str, path: str):
+    '''Copies a file into the media store, compressing it if MEDIA_GZIP is set.'''
+    with open(source, 'rb') as file, open_for_write(path) as target:
+        shutil.copyfileobj(file, target, COPY_BUFFER_SIZE)
+
+
+class CompressedFileSystemStorage(FileSystemStorage):
+    '''File storage for the media store, which compresses files as they are saved.'''
+
+    def _save(self, name, content):
+        name = super()._save(name, content)
+        if should_compress(name):
+            compress_file(self.path(name))
+        return name
+
+    def _open(self, name, mode='rb'):
+        if 'r' in mode and '+' not in mode:
+            return File(open_stored(self.path(name), mode), name)
+        return super()._open(name, mode)
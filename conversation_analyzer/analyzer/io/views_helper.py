@@ -1,51 +1,43 @@
 '''I/O helpers for view function.'''
-import os
 from os.path import join as directory_join
 import json
 from datetime import datetime
-from analyzer.models import Document, Message, Profile, SystemUser
+from django.urls import reverse
+from analyzer.models import Document, DocumentStatistics, Message, Profile, SystemUser
 from analyzer.io.messages import get_messages_by_uuid, get_owned_documents, NIL_UUID
-from analyzer.io.nlp import run_nlp_on_messages, wait_nlp_tasks
-from analyzer.io.common import PendingRecord
-from data_ingestion.file_handling import JSONFile
-from graph import plot
+from analyzer.io.nlp import run_nlp_on_messages
+from analyzer.io import dedup, response_times, statistics
+from analyzer.io.jobs import start_upload_job
+from graph import cache, downsample, plot
+from graph.snapshot import get_snapshot
 import pytz
 import openai
 from conversation_analyzer import settings
 
 
-def read_json_from_file(filename: str):
-    '''Reads a JSON file verbatim'''
-    file = JSONFile(filename)
-    file.read()
-    file.parse()
-    return file.parsed_data
-
-def delete_pending_documents(request):
-    '''Deletes all pending documents that do not have a corresponding accepted record.'''
-    system_user = SystemUser.objects.get(user=request.user)
-
-    if request.user.is_superuser:
-        all_documents = Document.objects.filter(is_ingestion_output=False)
-    else:
-        all_documents = Document.objects.filter(owner=system_user, is_ingestion_output=False)
-
-    # Get all documents that do not have a corresponding accepted record
-    all_accepted_documents = all_documents.filter(accepted=False)
-
-    for document in all_accepted_documents:
-        uuid, _ext = os.path.splitext(document.file.path.split("/")[-1])
-        record = PendingRecord(Document.objects.get(uuid=uuid))
-        record.reject()
+def start_upload(document: Document) -> dict:
+    '''
+    Starts parsing an uploaded document in the background, unless it is identical to an
+    accepted document, which is offered for reuse instead. Gives the fields of the response.
+    '''
+    original = dedup.find_duplicate(document)
+    if original is not None:
+        return {
+            "duplicate_of": {"uuid": original.uuid, "display_name": original.display_name},
+            "reuse_url": reverse('api_upload_reuse', args=[document.uuid])
+        }
+    job = start_upload_job(document)
+    return {"job_id": job.pk, "status_url": reverse('api_upload_status', args=[job.pk])}
 
-def populate_message(uuid, field_mapping, parsed_json):
-    '''Interprets the parsed JSON as messages.'''
+def build_messages(document: Document, field_mapping: dict, parsed_json) -> list[Message]:
+    '''Interprets the parsed JSON as unsaved messages of the document, with fingerprints.'''
+    profiles = {}
+    messages = []
     for row in parsed_json:
         if field_mapping.get("date") and field_mapping.get("time"):
-            row["timestamp"] = convert_to_timestamp(
-                row[field_mapping["date"]], row[field_mapping["time"]]
-            )
-            field_mapping["timestamp"] = "timestamp"
+            date = convert_to_timestamp(row[field_mapping["date"]], row[field_mapping["time"]])
+        else:
+            date = row[field_mapping["timestamp"]]
 
         body = row[field_mapping["body"]]
         if isinstance(body, dict):
@@ -53,15 +45,22 @@ def populate_message(uuid, field_mapping, parsed_json):
 
         # Problem: there is no support for different people with the same name.
         # How can we identify when this is the case?
-        message = Message(date=row[field_mapping["timestamp"]], body=body,
-                        source=Document.objects.get(uuid=uuid),
-                        owner=Profile.objects.get_or_create(
-                            name=row.get(field_mapping["sender"])
-                            if row.get(field_mapping["sender"]) is not None
-                            else "Unknown Sender"
-                        )[0])
+        name = (row.get(field_mapping["sender"])
+                if row.get(field_mapping["sender"]) is not None
+                else "Unknown Sender")
+        if name not in profiles:
+            profiles[name] = Profile.objects.get_or_create(name=name)[0]
+        messages.append(Message(date=date, body=body, source=document, owner=profiles[name],
+                                fingerprint=Message.get_fingerprint(date, str(name), str(body))))
+    return messages
 
-        message.save()
+def populate_message(uuid, field_mapping, parsed_json):
+    '''Interprets the parsed JSON as messages, which are inserted in bulk.'''
+    messages = build_messages(Document.objects.get(uuid=uuid), field_mapping, parsed_json)
+    messages = Message.objects.bulk_create(messages, batch_size=settings.MESSAGE_BATCH_SIZE)
+    statistics.record_messages(messages)
+    response_times.record_messages(messages)
+    return messages
 
 def parse_field_mapping(in_fields) -> dict:
     """Parses user selections for field mapping and returns a dictionary
@@ -87,37 +86,121 @@ def convert_to_timestamp(date_str, time_str) -> str:
         timestamp = "1970-01-01T00:00:00+00:00"
     return timestamp
 
-def graph_logic(user, document_uuid):
-    '''This method handles the
-    logic for single document or
-    multiple document graphs and the
-    progress bar'''
-    messages = get_messages_by_uuid(user, document_uuid)
-    if not messages.exists():
-        return plot.empty_graph_analysis(5)
-
-    run_nlp_on_messages(messages)
-    nlp_results, has_tasks_pending = wait_nlp_tasks(messages)
-    if has_tasks_pending:
-        return None
-
-    if document_uuid != NIL_UUID:
-        pop_dict = plot.populate_nlp_dict(nlp_results)
-        graphs,description = plot.singular_doc_analysis(messages, pop_dict)
-    else:
-        documents = get_owned_documents(user)
-        graphs, description = plot.all_doc_analysis(documents, messages)
-    return graphs, description
+def get_graph_versions(user, document_uuid):
+    '''Gets the versions of the statistics of the documents the dashboard is drawn from.'''
+    documents = (get_owned_documents(user) if document_uuid == NIL_UUID
+                 else Document.objects.filter(uuid=document_uuid))
+    return list(documents.order_by('uuid').values_list('uuid', 'statistics__version'))
+
+def get_dashboard_graphs(document_uuid) -> dict:
+    '''Gets the graphs of the dashboard for a document, or for every document with NIL_UUID.'''
+    return plot.ALL_DOCUMENTS_GRAPHS if document_uuid == NIL_UUID else plot.DOCUMENT_GRAPHS
+
+def get_dashboard_graph(user, document_uuid, name) -> str:
+    '''
+    Gets a graph of the dashboard by name as JSON, see plot.graph_to_json. The graph is cached
+    until the documents it is drawn from change, unless NLP results are pending.
+    '''
+    draw, description = get_dashboard_graphs(document_uuid)[name]
+    versions = get_graph_versions(user, document_uuid)
+
+    def render():
+        messages = get_messages_by_uuid(user, document_uuid)
+        if not messages.exists():
+            return plot.graph_to_json(plot.empty_graph(), description, False), False
+        run_nlp_on_messages(messages)
+        if document_uuid == NIL_UUID:
+            # Every graph of all documents is drawn from one pass over their messages.
+            figure, pending = draw(get_snapshot(get_owned_documents(user), versions))
+        else:
+            figure, pending = draw(messages)
+        range_url = (reverse('api_dashboard_graph_range', args=[document_uuid, name])
+                     if name in plot.DOCUMENT_GRAPH_SERIES else None)
+        return plot.graph_to_json(figure, description, pending, range_url), pending
+    body, _pending = cache.render_cached(f'dashboard:{document_uuid}:{name}', versions, render,
+                                         cacheable=lambda payload: not payload[1])
+    return body
+
+def get_series(key, versions, messages) -> dict:
+    '''
+    Gets the NLP results of messages at full resolution, by series of plot.get_messages_series,
+    as arrays. They are cached under key until versions change, and empty while NLP results
+    are pending.
+    '''
+    series, _pending = cache.render_cached(key, versions,
+                                           lambda: plot.get_messages_series(messages),
+                                           cacheable=lambda payload: not payload[1])
+    return series
+
+def get_series_range(series: dict, names, start: float, end: float) -> list[dict]:
+    '''
+    Gets the traces of the named series between start and end on the message ID, at full
+    resolution unless there are more than GRAPH_MAX_POINTS points.
+    '''
+    traces = []
+    for name in names:
+        x, y = downsample.get_range(series['ID'], series[name], start, end)
+        traces.append({'x': x.tolist(), 'y': y.tolist()})
+    return traces
+
+def get_dashboard_graph_range(user, document_uuid, name, start, end) -> list[dict]:
+    '''Gets the traces of a graph of the dashboard for a document between start and end.'''
+    series = get_series(f'series:{document_uuid}', get_graph_versions(user, document_uuid),
+                        get_messages_by_uuid(user, document_uuid))
+    return get_series_range(series, plot.DOCUMENT_GRAPH_SERIES[name], start, end)
+
+def get_profile_risk_range(profile, start, end) -> list[dict]:
+    '''
+    Gets the trace of the graph of the risk of a profile between start and end, days as
+    ordinals, from its statistics.
+    '''
+    x, y = downsample.get_range(
+        *statistics.get_risk_timeline(statistics.get_profile_statistics(profile)), start, end)
+    return [{'x': downsample.get_dates(x), 'y': y.tolist()}]
 
 def get_profile_risk_stat(profile):
-    '''Calculates the average risk for the given profile.'''
-    message_objs = Message.objects.filter(owner=profile)
-    nlp_results, _ = wait_nlp_tasks(message_objs)
-    populated_dict = plot.populate_nlp_dict(nlp_results)
-
-    risks = populated_dict['Risk']
-    average_risk = sum(risks) / len(risks) if any(risks) else 0
-    return average_risk
+    '''Gets the average risk for the given profile, from its statistics.'''
+    return statistics.get_profile_statistics(profile).get_mean('risk')
+
+def get_profile_summary(profile) -> dict:
+    '''
+    Gets the average risk of a profile, its gauge, the graph of its risk over time and the
+    documents it sent messages in, from its statistics rather than its messages. The graphs
+    are cached until the messages of the profile change.
+    '''
+    profile_statistics = statistics.get_profile_statistics(profile)
+    average_risk = profile_statistics.get_mean('risk')
+
+    def render():
+        return (plot.profile_risk_gauge(average_risk),
+                plot.profile_risk_graph(*statistics.get_risk_timeline(profile_statistics)))
+    risk_graph, message_risk_graph = cache.render_cached(
+        f'profile:{profile.pk}', profile_statistics.version, render)
+    return {
+        'average_risk': average_risk,
+        'risk_graph': risk_graph,
+        'message_risk_graph': message_risk_graph,
+        'associated_documents': Document.objects.filter(
+            pk__in=profile_statistics.document_ids).order_by('display_name'),
+    }
+
+def get_sentiment_risk_graph(document):
+    '''
+    Gets the graph of the risk and sentiment OpenAI rated the messages of a document with,
+    None if it was not rated. The graph is cached until the document changes.
+    '''
+    openai_data = document.openai_data
+    if not (openai_data and openai_data.get('risk_score_messages')
+            and openai_data.get('sentiment_messages')):
+        return None
+    version = (DocumentStatistics.objects.filter(document=document)
+               .values_list('version', flat=True).first())
+    return cache.render_cached(f'messages:{document.uuid}', version,
+                               lambda: plot.get_graph_risk_and_sentiment({
+        'ID': [index for index, _ in enumerate(openai_data['risk_score_messages'])],
+        'Risk': openai_data['risk_score_messages'],
+        'Sentiment': openai_data['sentiment_messages']
+    }))
 
 def chatbot_request(user_messages, parsed_file, mock=False):
     """Makes a request to the chatbot. If mock is True, returns a mock response."""
@@ -0,0 +1,72 @@
+'''Management command for archiving the messages of inactive documents.'''
+import statistics
+import time
+from django.core.management.base import BaseCommand, CommandError
+from analyzer.io import archive
+from analyzer.models import Document, Message, NLPTask
+
+def measure_active_tables(runs: int = 3) -> dict:
+    '''
+    Counts the rows of the message tables, and times the query for the messages of every
+    accepted document which the dashboard makes.
+    '''
+    documents = Document.objects.filter(accepted=True, is_ingestion_output=True)
+    latencies = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        list(Message.objects.filter(source__in=documents).values_list('pk', 'date', 'owner_id'))
+        latencies.append(time.perf_counter() - start)
+    return {
+        'messages': Message.objects.count(),
+        'nlp_tasks': NLPTask.objects.count(),
+        'latency': statistics.median(latencies),
+    }
+
+class Command(BaseCommand):
+    '''Archives the messages of documents which have not been opened for a while.'''
+    help = ('Moves the messages and NLP results of documents which have not been opened for '
+            'a while into compressed archives, reporting the size of the message tables and '
+            'the latency of the dashboard query before and after.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int,
+                            help='Archive documents not opened for this many days, '
+                                 'by default ARCHIVE_AFTER_DAYS.')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only list the documents which would be archived.')
+        parser.add_argument('--restore', metavar='UUID',
+                            help='Restore the messages of an archived document instead.')
+
+    def handle(self, *args, **options):
+        if options['restore']:
+            document = Document.objects.filter(uuid=options['restore']).first()
+            if document is None:
+                raise CommandError(f'Document {options["restore"]} does not exist.')
+            if not archive.restore_document(document):
+                raise CommandError(f'{document.display_name} is not archived.')
+            self.stdout.write(self.style.SUCCESS(f'Restored {document.display_name}.'))
+            return
+
+        documents = list(archive.get_inactive_documents(options['days']))
+        if options['dry_run']:
+            for document in documents:
+                self.stdout.write(f'{document.display_name} ({document.uuid}), '
+                                  f'last opened {document.last_accessed:%Y-%m-%d}')
+            self.stdout.write(f'{len(documents)} documents would be archived.')
+            return
+
+        before = measure_active_tables()
+        start = time.perf_counter()
+        archived_messages = 0
+        for document in documents:
+            archived_messages += archive.archive_document(document)['messages']
+        elapsed = time.perf_counter() - start
+        after = measure_active_tables()
+
+        self.stdout.write(f'Archived {archived_messages} messages of {len(documents)} documents '
+                          f'in {elapsed:.2f}s.')
+        for label, measurement in (('Before', before), ('After', after)):
+            self.stdout.write(
+                f'{label}: {measurement["messages"]} messages, {measurement["nlp_tasks"]} NLP '
+                f'tasks, dashboard query {measurement["latency"] * 1000:.1f}ms.'
+            )
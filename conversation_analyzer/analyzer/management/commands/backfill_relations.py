@@ -0,0 +1,16 @@
+'''Management command for computing the relations between existing profiles.'''
+import time
+from django.core.management.base import BaseCommand
+from analyzer.io.relation import rebuild_relations
+
+class Command(BaseCommand):
+    '''Computes the relations between profiles from the participants of every document.'''
+    help = ('Computes the relations between profiles who sent messages in the same documents, '
+            'weighted by the number of documents, e.g. for documents inserted before relations '
+            'were kept.')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        rebuilt = rebuild_relations()
+        self.stdout.write(f'Related {rebuilt["profiles"]} profiles by {rebuilt["relations"]} '
+                          f'relations in {time.perf_counter() - start:.2f}s.')
@@ -0,0 +1,16 @@
+'''Management command for computing the response times of existing messages.'''
+import time
+from django.core.management.base import BaseCommand
+from analyzer.io.response_times import backfill_response_times
+
+class Command(BaseCommand):
+    '''Computes the response time of every message which is not archived.'''
+    help = ('Computes the response time of every message which is not archived, e.g. for '
+            'messages inserted before response times were stored.')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        backfilled = backfill_response_times()
+        self.stdout.write(f'Updated the response times of {backfilled["messages"]} messages in '
+                          f'{backfilled["documents"]} documents in '
+                          f'{time.perf_counter() - start:.2f}s.')
@@ -0,0 +1,89 @@
+'''Management command for measuring the throughput and latency of the live feed.'''
+import os
+import statistics
+import time
+from datetime import datetime, timedelta, timezone
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from analyzer.io import feed, ingestion
+from analyzer.models import NLPTask, SystemUser
+
+SENDERS = ('Jamie Smith', 'Mia', 'Alex')
+BODIES = (
+    "Did you manage to get hold of her in Glasgow?",
+    "Not yet, I'll try calling again tonight.",
+    "Please send the money before Friday, it is really urgent.",
+    "I'm worried, this doesn't sound like her at all.",
+)
+
+class Command(BaseCommand):
+    '''Feeds synthetic messages into a new document, then waits for their NLP results.'''
+    help = ('Feeds synthetic messages through the live feed, reporting the ingestion '
+            'throughput and the latency from arrival to NLP result.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', required=True, help='Username of the owner.')
+        parser.add_argument('--messages', type=int, default=2000,
+                            help='Number of messages to feed.')
+        parser.add_argument('--batch', type=int, default=100, help='Messages in each batch.')
+        parser.add_argument('--rate', type=float, default=0,
+                            help='Messages per second to feed, 0 feeds as fast as possible.')
+        parser.add_argument('--timeout', type=float, default=600,
+                            help='Seconds to wait for the NLP results.')
+        parser.add_argument('--keep', action='store_true',
+                            help='Keep the document instead of deleting it afterwards.')
+
+    def handle(self, *args, **options):
+        try:
+            owner = SystemUser.objects.get(user__username=options['user'])
+        except SystemUser.DoesNotExist as e:
+            raise CommandError(f'User {options["user"]} does not exist.') from e
+
+        document = feed.create_feed_document(owner, 'Live feed benchmark')
+        try:
+            self.run(document, options)
+        finally:
+            if not options['keep']:
+                file_name = document.file.name
+                document.delete()
+                os.unlink(os.path.join(settings.MEDIA_ROOT, file_name))
+                os.unlink(ingestion.get_save_path(file_name))
+
+    def run(self, document, options):
+        '''Feeds the messages in batches, then reports once every result has arrived.'''
+        total = options['messages']
+        start_date = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        start = time.perf_counter()
+        for offset in range(0, total, options['batch']):
+            batch = [{
+                'sender': SENDERS[index % len(SENDERS)],
+                'timestamp': (start_date + timedelta(seconds=index)).isoformat(),
+                'body': f'{BODIES[index % len(BODIES)]} ({index})',
+            } for index in range(offset, min(offset + options['batch'], total))]
+            feed.feed_messages(document, batch)
+            if options['rate']:
+                time.sleep(max(0, start + (offset + len(batch)) / options['rate']
+                               - time.perf_counter()))
+        fed = time.perf_counter() - start
+        self.stdout.write(f'Fed {total} messages in {fed:.2f}s ({total / fed:.0f} messages/s).')
+
+        tasks = NLPTask.objects.filter(message__source=document)
+        deadline = time.perf_counter() + options['timeout']
+        while tasks.filter(result=None).exists():
+            if time.perf_counter() > deadline:
+                raise CommandError(f'{tasks.filter(result=None).count()} NLP results did not '
+                                   f'arrive within {options["timeout"]}s.')
+            time.sleep(0.5)
+
+        times = list(tasks.values_list('queued_at', 'completed_at'))
+        latencies = sorted((completed - queued).total_seconds() for queued, completed in times)
+        elapsed = max((max(completed for _, completed in times)
+                       - min(queued for queued, _ in times)).total_seconds(), 0.001)
+        self.stdout.write(f'Analysed {len(times)} messages in {elapsed:.2f}s '
+                          f'({len(times) / elapsed:.0f} messages/s sustained).')
+        self.stdout.write(
+            f'Latency from arrival to NLP result: '
+            f'p50 {statistics.median(latencies):.2f}s, '
+            f'p95 {latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]:.2f}s, '
+            f'max {latencies[-1]:.2f}s.'
+        )
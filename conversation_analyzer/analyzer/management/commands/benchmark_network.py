@@ -0,0 +1,42 @@
+'''Management command for measuring how long network graphs take to draw, and their size.'''
+import random
+import time
+from django.core.management.base import BaseCommand
+from graph import network, plot
+
+class Command(BaseCommand):
+    '''Draws a network graph of synthetic profiles and topics, reporting its time and size.'''
+    help = ('Draws a network graph of synthetic profiles and topics, as the relationship and '
+            'common topic graphs are drawn, reporting the time to lay it out and render it, '
+            'and the size of its JSON.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--nodes', type=int, default=10000,
+                            help='Number of nodes, half of them profiles and half topics.')
+        parser.add_argument('--edges', type=int, default=50000,
+                            help='Number of edges before duplicates are aggregated.')
+        parser.add_argument('--seed', type=int, default=0, help='Seed of the random edges.')
+
+    def handle(self, *args, **options):
+        generator = random.Random(options['seed'])
+        profiles = max(options['nodes'] // 2, 1)
+        topics = max(options['nodes'] - profiles, 1)
+
+        start = time.perf_counter()
+        graph = network.Network()
+        for _ in range(options['edges']):
+            graph.add_edge(f'Profile {generator.randrange(profiles)}',
+                           f'Topic {generator.randrange(topics)}')
+        built = time.perf_counter()
+        fig = network.network_figure(graph)
+        drawn = time.perf_counter()
+        payload = plot.graph_to_json(fig, '', False)
+        rendered = time.perf_counter()
+
+        left, right = graph.get_degrees()
+        self.stdout.write(f'{len(left) + len(right)} nodes and {len(graph.weights)} distinct '
+                          f'edges from {options["edges"]} edges, in {len(fig.data)} traces.')
+        self.stdout.write(f'Aggregated edges in {built - start:.2f}s, laid out and drew the '
+                          f'figure in {drawn - built:.2f}s, rendered it in '
+                          f'{rendered - drawn:.2f}s.')
+        self.stdout.write(f'Figure JSON is {len(payload) / 1024:.0f} KiB.')
@@ -0,0 +1,97 @@
+'''Management command for measuring how long response times take to compute and to read.'''
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import OuterRef, Subquery
+from analyzer.io import response_times
+from analyzer.models import Document, Message, Profile, SystemUser
+from graph import distribution
+
+def get_dates(start, count, generator) -> list[datetime]:
+    '''Gets count dates a random number of minutes apart, from start.'''
+    dates = []
+    for _ in range(count):
+        start += timedelta(minutes=generator.expovariate(1 / 30))
+        dates.append(start)
+    return dates
+
+class Command(BaseCommand):
+    '''Inserts synthetic documents of several sizes, timing their response times.'''
+    help = ('Inserts synthetic documents of each number of messages, reporting the time to '
+            'compute the response times of all their messages, to update them as messages '
+            'are appended, and to read their distribution.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', required=True, help='Username of the owner.')
+        parser.add_argument('--messages', type=int, nargs='+', default=[10000, 100000],
+                            help='Numbers of messages of the documents.')
+        parser.add_argument('--append', type=int, default=100,
+                            help='Number of messages appended to each document.')
+        parser.add_argument('--baseline', action='store_true',
+                            help='Also time finding the previous message of each message with '
+                                 'a correlated subquery, which takes quadratic time.')
+
+    def handle(self, *args, **options):
+        try:
+            owner = SystemUser.objects.get(user__username=options['user'])
+        except SystemUser.DoesNotExist as e:
+            raise CommandError(f'User {options["user"]} does not exist.') from e
+
+        profile, created = Profile.objects.get_or_create(name='Response time benchmark',
+                                                         defaults={'note': ''})
+        try:
+            for count in options['messages']:
+                document = Document.objects.create(
+                    display_name=f'Response time benchmark ({count})', owner=owner,
+                    accepted=False, is_ingestion_output=False)
+                try:
+                    self.run(document, profile, count, options)
+                finally:
+                    document.delete()
+        finally:
+            if created:
+                profile.delete()
+
+    def insert(self, document, profile, dates):
+        '''Inserts a message at each of dates.'''
+        messages = [Message(date=date, body=f'Message {index}', source=document, owner=profile)
+                    for index, date in enumerate(dates)]
+        Message.objects.bulk_create(messages, batch_size=settings.MESSAGE_BATCH_SIZE)
+        return messages
+
+    def run(self, document, profile, count, options):
+        '''Times the response times of a document of count messages.'''
+        generator = random.Random(count)
+        messages = self.insert(document, profile, get_dates(
+            datetime(2024, 1, 1, tzinfo=timezone.utc), count, generator))
+
+        start = time.perf_counter()
+        response_times.update_response_times(document.pk)
+        computed = time.perf_counter() - start
+
+        appended = self.insert(document, profile, get_dates(
+            messages[-1].date, options['append'], generator))
+        start = time.perf_counter()
+        response_times.record_messages(appended)
+        updated = time.perf_counter() - start
+
+        start = time.perf_counter()
+        values = [value / 60 for value in Message.objects.filter(source=document)
+                  .exclude(response_time=None).values_list('response_time', flat=True)]
+        distribution.get_distribution(values)
+        read = time.perf_counter() - start
+
+        self.stdout.write(f'{count} messages: computed every response time in {computed:.2f}s, '
+                          f'updated them for {options["append"]} appended messages in '
+                          f'{updated:.3f}s, read their distribution in {read:.3f}s.')
+
+        if options['baseline']:
+            start = time.perf_counter()
+            previous = (Message.objects.filter(source=document, date__lt=OuterRef('date'))
+                        .order_by('-date').values('date')[:1])
+            list(Message.objects.filter(source=document)
+                 .annotate(previous_date=Subquery(previous)).values_list('date', 'previous_date'))
+            self.stdout.write(f'{count} messages: a correlated subquery found the previous '
+                              f'messages in {time.perf_counter() - start:.2f}s.')
@@ -0,0 +1,81 @@
+'''Management command for measuring how long searches of message bodies take.'''
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from analyzer.io import search
+from analyzer.models import Document, Message, Profile
+
+# Words of the synthetic messages, drawn with Zipf-like frequencies so some are common.
+WORDS = [f'word{index}' for index in range(5000)]
+
+class Command(BaseCommand):
+    '''Inserts a synthetic document, timing searches of its messages.'''
+    help = ('Inserts a synthetic document of random words, reporting the time to index its '
+            'messages, to search them for words, phrases and prefixes, with filters and deep '
+            'in the results, and to scan them with a LIKE filter instead.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', required=True, help='Username of the owner.')
+        parser.add_argument('--messages', type=int, default=100000,
+                            help='Number of messages of the document.')
+        parser.add_argument('--pages', type=int, default=10,
+                            help='Number of pages of results to follow.')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist as e:
+            raise CommandError(f'User {options["user"]} does not exist.') from e
+
+        profile = Profile.objects.create(name='Search benchmark', note='')
+        document = Document.objects.create(display_name='Search benchmark',
+                                           owner=user.systemuser, accepted=True,
+                                           is_ingestion_output=True)
+        try:
+            self.run(user, document, profile, options)
+        finally:
+            document.delete()
+            profile.delete()
+
+    def time(self, description, function):
+        '''Runs function, reporting how long it took.'''
+        start = time.perf_counter()
+        result = function()
+        self.stdout.write(f'{description} in {(time.perf_counter() - start) * 1000:.1f}ms.')
+        return result
+
+    def run(self, user, document, profile, options):
+        '''Times searches of a document of synthetic messages.'''
+        generator = random.Random(options['messages'])
+        weights = [1 / (rank + 1) for rank in range(len(WORDS))]
+        start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        messages = [
+            Message(date=start + timedelta(minutes=index), source=document, owner=profile,
+                    body=' '.join(generator.choices(WORDS, weights, k=12)))
+            for index in range(options['messages'])]
+        self.time(f'Inserted and indexed {len(messages)} messages', lambda: (
+            Message.objects.bulk_create(messages, batch_size=settings.MESSAGE_BATCH_SIZE)))
+
+        filters = search.SearchFilters(document=str(document.pk), profile=profile.pk,
+                                       start=start, end=start + timedelta(days=7))
+        for description, text, query_filters in (
+                ('a common word', 'word1', None),
+                ('a rare word', 'word4999', None),
+                ('a phrase', '"word0 word1"', None),
+                ('a prefix', 'word12*', None),
+                ('a common word in a week of a profile of the document', 'word1', filters)):
+            self.time(f'Searched for {description}',
+                      lambda text=text, query_filters=query_filters: (
+                          search.search_messages(user, text, query_filters)))
+
+        page = {'next': None}
+        for _ in range(options['pages']):
+            page = search.search_messages(user, 'word1', after=page['next'])
+        self.time(f'Searched for the page after {options["pages"]} pages of a common word',
+                  lambda: search.search_messages(user, 'word1', after=page['next']))
+        self.time('Scanned for a rare word with LIKE', lambda: list(
+            Message.objects.filter(source=document, body__icontains='word4999')
+            .values_list('pk', flat=True)[:settings.SEARCH_PAGE_SIZE]))
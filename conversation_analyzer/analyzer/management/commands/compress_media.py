@@ -0,0 +1,81 @@
+'''Management command for compressing the files already in the media store.'''
+import os
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from analyzer.io import storage
+
+# Directories of the media store holding uploaded originals and ingestion saves.
+STORED_DIRECTORIES = ('uploaded_documents', 'ingestion_saves')
+
+def get_stored_files(directory: str) -> list[str]:
+    '''Gets the paths of the files in a directory of the media store.'''
+    path = os.path.join(settings.MEDIA_ROOT, directory)
+    if not os.path.isdir(path):
+        return []
+    return sorted(entry.path for entry in os.scandir(path)
+                  if entry.is_file() and not entry.name.startswith('.'))
+
+def format_size(size: float) -> str:
+    '''Formats a number of bytes for the report.'''
+    for unit in ('B', 'KiB', 'MiB', 'GiB'):
+        if size < 1024 or unit == 'GiB':
+            return f'{size:.1f} {unit}'
+        size /= 1024
+    return f'{size:.1f} GiB'
+
+class Command(BaseCommand):
+    '''Compresses, or decompresses, the originals and ingestion saves in the media store.'''
+    help = ('Compresses the uploaded originals and ingestion saves already in the media store, '
+            'then reports the disk used and the read throughput.')
+
+    def add_arguments(self, parser):
+        action = parser.add_mutually_exclusive_group()
+        action.add_argument('--report', action='store_true',
+                            help='Only report the disk used and read throughput.')
+        action.add_argument('--decompress', action='store_true',
+                            help='Decompress the files instead, e.g. before turning off '
+                            'MEDIA_GZIP.')
+
+    def handle(self, *args, **options):
+        for directory in STORED_DIRECTORIES:
+            paths = get_stored_files(directory)
+            if not options['report']:
+                self.migrate(directory, paths, options['decompress'])
+            self.report(directory, paths)
+
+    def migrate(self, directory: str, paths: list[str], decompress: bool):
+        '''Rewrites the files of a directory in place.'''
+        rewrite = storage.decompress_file if decompress else storage.compress_file
+        content_bytes = 0
+        rewritten = 0
+        start = time.perf_counter()
+        for path in paths:
+            size = storage.get_uncompressed_size(path)
+            if rewrite(path):
+                rewritten += 1
+                content_bytes += size
+        elapsed = max(time.perf_counter() - start, 0.001)
+        self.stdout.write(
+            f'{directory}: {"decompressed" if decompress else "compressed"} {rewritten} of '
+            f'{len(paths)} files in {elapsed:.2f}s '
+            f'({format_size(content_bytes / elapsed)}/s of content).'
+        )
+
+    def report(self, directory: str, paths: list[str]):
+        '''Reports the disk used by a directory, and how fast its content can be read.'''
+        stored_bytes = sum(os.path.getsize(path) for path in paths)
+        compressed = sum(storage.is_compressed(path) for path in paths)
+        content_bytes = 0
+        start = time.perf_counter()
+        for path in paths:
+            with storage.open_stored(path) as file:
+                while chunk := file.read(storage.COPY_BUFFER_SIZE):
+                    content_bytes += len(chunk)
+        elapsed = max(time.perf_counter() - start, 0.001)
+        ratio = content_bytes / stored_bytes if stored_bytes else 1
+        self.stdout.write(
+            f'{directory}: {len(paths)} files, {compressed} compressed, '
+            f'{format_size(stored_bytes)} on disk for {format_size(content_bytes)} of content '
+            f'({ratio:.1f}x), read at {format_size(content_bytes / elapsed)}/s.'
+        )
@@ -0,0 +1,16 @@
+'''Management command for running housekeeping, e.g. from cron.'''
+import time
+from django.core.management.base import BaseCommand
+from analyzer.io.janitor import run_housekeeping
+
+class Command(BaseCommand):
+    '''Runs every housekeeping task once.'''
+    help = ('Removes abandoned uploads, stale NLP tasks, old ingestion jobs and media files '
+            'which no record refers to.')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        report = run_housekeeping()
+        for name, removed in report.items():
+            self.stdout.write(f'{name}: {removed} removed')
+        self.stdout.write(f'Housekeeping finished in {time.perf_counter() - start:.2f}s.')
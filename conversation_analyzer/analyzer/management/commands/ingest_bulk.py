@@ -0,0 +1,52 @@
+'''Management command for ingesting a zip archive or directory of conversations.'''
+import json
+import time
+from django.core.management.base import BaseCommand, CommandError
+from analyzer.io.bulk import ingest_bulk
+from analyzer.io.views_helper import parse_field_mapping
+from analyzer.models import FieldMapping, SystemUser
+
+class Command(BaseCommand):
+    '''Ingests every supported file in a zip archive or directory.'''
+    help = 'Ingests every supported file in a zip archive or directory with one field mapping.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', help='Zip archive or directory of conversations.')
+        parser.add_argument('--user', required=True, help='Username of the owner.')
+        mapping = parser.add_mutually_exclusive_group(required=True)
+        mapping.add_argument('--mapping', help='Name of a field mapping saved by the owner.')
+        mapping.add_argument('--field-mapping',
+                             help='Field mapping as JSON, e.g. {"sender": "name", ...}.')
+        parser.add_argument('--workers', type=int, help='Number of parsing processes.')
+
+    def handle(self, *args, **options):
+        try:
+            owner = SystemUser.objects.get(user__username=options['user'])
+        except SystemUser.DoesNotExist as e:
+            raise CommandError(f'User {options["user"]} does not exist.') from e
+
+        if options['mapping']:
+            try:
+                field_mapping = FieldMapping.objects.get(owner=owner,
+                                                         name=options['mapping']).mapping
+            except FieldMapping.DoesNotExist as e:
+                raise CommandError(f'Field mapping {options["mapping"]} does not exist.') from e
+        else:
+            field_mapping = json.loads(options['field_mapping'])
+            if isinstance(field_mapping, list):
+                field_mapping = parse_field_mapping(field_mapping)
+
+        start = time.perf_counter()
+        reports = ingest_bulk(owner, options['source'], field_mapping, options['workers'])
+        elapsed = time.perf_counter() - start
+
+        for report in reports:
+            if report['success']:
+                self.stdout.write(self.style.SUCCESS(
+                    f'{report["file"]}: {report["messages"]} messages, {report["document"]}'))
+            else:
+                self.stdout.write(self.style.ERROR(f'{report["file"]}: {report["error"]}'))
+        succeeded = sum(report['success'] for report in reports)
+        rate = len(reports) * 60 / elapsed if elapsed else 0
+        self.stdout.write(f'{succeeded}/{len(reports)} files ingested in {elapsed:.1f}s '
+                          f'({rate:.0f} files per minute).')
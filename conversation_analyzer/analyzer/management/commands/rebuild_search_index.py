@@ -0,0 +1,16 @@
+'''Management command for indexing every message for search again.'''
+import time
+from django.core.management.base import BaseCommand
+from analyzer.io.search import create_search_index, rebuild_search_index
+
+class Command(BaseCommand):
+    '''Creates the search index of message bodies if it does not exist, and rebuilds it.'''
+    help = ('Creates the full-text search index of message bodies and its triggers if they do '
+            'not exist, and indexes every message again, e.g. for messages inserted before the '
+            'index existed.')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        create_search_index()
+        rebuild_search_index()
+        self.stdout.write(f'Rebuilt the search index in {time.perf_counter() - start:.2f}s.')
@@ -0,0 +1,16 @@
+'''Management command for computing the statistics of documents and profiles again.'''
+import time
+from django.core.management.base import BaseCommand
+from analyzer.io.statistics import rebuild_statistics
+
+class Command(BaseCommand):
+    '''Computes the statistics of every document and profile from their messages.'''
+    help = ('Computes the statistics of every document and profile from their messages, e.g. '
+            'for messages inserted before statistics were kept, or after changing '
+            'STATISTICS_HISTOGRAM_BINS.')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        rebuilt = rebuild_statistics()
+        self.stdout.write(f'Rebuilt the statistics of {rebuilt["documents"]} documents and '
+                          f'{rebuilt["profiles"]} profiles in {time.perf_counter() - start:.2f}s.')
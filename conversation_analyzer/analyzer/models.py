@@ -1,10 +1,15 @@
 '''ORM models for Django.'''
 
+import hashlib
+import os
 import uuid
+from datetime import timezone as dt_timezone
 
+from django.conf import settings
 from django.contrib.auth.models import User
 from django.db import models
 from django.urls import reverse
+from django.utils import timezone
 
 
 class Profile(models.Model):
@@ -12,7 +17,8 @@ class Profile(models.Model):
     name = models.CharField(max_length=256)
     note = models.TextField()
 
-    related_profiles = models.ManyToManyField('self')
+    related_profiles: 'models.ManyToManyField[Profile, ProfileRelation]' = \
+        models.ManyToManyField('self', through='ProfileRelation')
 
     @staticmethod
     def get_mock():
@@ -60,6 +66,17 @@ class Document(models.Model):
 
     openai_data = models.JSONField(null=True)
 
+    # SHA-256 of the uploaded file, identical uploads share the files of the first one.
+    content_hash = models.CharField(max_length=64, null=True, db_index=True)
+    reused_from = models.ForeignKey('self', null=True, blank=True, on_delete=models.SET_NULL,
+                                    related_name='reuses')
+
+    # Documents which have not been opened for a while have their messages archived, see
+    # analyzer.io.archive. A summary of the messages is kept while they are archived.
+    last_accessed = models.DateTimeField(default=timezone.now, db_index=True)
+    archived_at = models.DateTimeField(null=True, blank=True)
+    archive_summary = models.JSONField(null=True, blank=True)
+
     @staticmethod
     def get_mock():
         '''Creates or gets a mock Document.'''
@@ -97,6 +114,29 @@ class Message(models.Model):
     source = models.ForeignKey(Document, on_delete=models.CASCADE)
     owner = models.ForeignKey(Profile, on_delete=models.CASCADE)
 
+    # Identifies the same message in a later export of the conversation, see get_fingerprint.
+    fingerprint = models.CharField(max_length=64, null=True, db_index=True)
+
+    # Seconds since the previous message of the document, None for the first message, see
+    # analyzer.io.response_times.
+    response_time = models.FloatField(null=True)
+
+    class Meta:
+        '''Metadata for Message.'''
+        indexes = [models.Index(fields=['source', 'date'])]
+
+    @staticmethod
+    def get_fingerprint(date, sender: str, body: str) -> str:
+        '''
+        Gets the SHA-256 of the timestamp, sender and body of a message.
+        The date may be a datetime or a string, it is compared in UTC.
+        '''
+        date = models.DateTimeField().to_python(date)
+        if timezone.is_naive(date):
+            date = timezone.make_aware(date, timezone.get_default_timezone())
+        key = '\0'.join((date.astimezone(dt_timezone.utc).isoformat(), sender, body))
+        return hashlib.sha256(key.encode('utf8')).hexdigest()
+
     @staticmethod
     def get_mock():
         '''Creates or gets a mock Message.'''
@@ -114,6 +154,8 @@ class NLPTask(models.Model):
     '''Represents a background NLP task that completes in the future.'''
     message = models.OneToOneField(Message, on_delete=models.CASCADE)
     result = models.TextField(null=True)
+    queued_at = models.DateTimeField(default=timezone.now)
+    completed_at = models.DateTimeField(null=True)
 
     @staticmethod
     def get_mock():
@@ -122,3 +164,195 @@ class NLPTask(models.Model):
 
     def __str__(self):
         return str(self.result)
+
+
+class Statistics(models.Model):
+    '''
+    Running counts, sums and histograms of messages and their NLP results, maintained by
+    analyzer.io.statistics as messages are inserted and analysed.
+    '''
+    message_count = models.IntegerField(default=0)
+    analysed_count = models.IntegerField(default=0)
+    risk_sum = models.FloatField(default=0)
+    sentiment_sum = models.FloatField(default=0)
+    joy_sum = models.FloatField(default=0)
+    sad_sum = models.FloatField(default=0)
+    anger_sum = models.FloatField(default=0)
+    fear_sum = models.FloatField(default=0)
+
+    # Counts of the analysed messages in STATISTICS_HISTOGRAM_BINS equal bins over [-1, 1].
+    risk_histogram = models.JSONField(default=list)
+    sentiment_histogram = models.JSONField(default=list)
+
+    # Bumped whenever the messages, their NLP results or the analysis change, rendered graphs
+    # are cached by it, see graph.cache.
+    version = models.IntegerField(default=0)
+
+    class Meta:
+        '''Metadata for Statistics.'''
+        abstract = True
+
+    def get_mean(self, field: str) -> float:
+        '''Gets the mean of a field of the NLP results, e.g. risk, 0 if none are analysed.'''
+        if not self.analysed_count:
+            return 0
+        return getattr(self, f'{field}_sum') / self.analysed_count
+
+
+class DocumentStatistics(Statistics):
+    '''Represents the statistics of the messages of a document.'''
+    document = models.OneToOneField(Document, on_delete=models.CASCADE,
+                                    related_name='statistics')
+    profile_count = models.IntegerField(default=0)
+
+    def get_average_messages_per_profile(self) -> float:
+        '''Gets the average number of messages sent by each profile.'''
+        return self.message_count / self.profile_count if self.profile_count else 0
+
+    def __str__(self):
+        return f'Statistics of {self.document.display_name}'
+
+
+class ProfileStatistics(Statistics):
+    '''Represents the statistics of the messages a profile sent, across documents.'''
+    profile = models.OneToOneField(Profile, on_delete=models.CASCADE, related_name='statistics')
+
+    # Counts and risk sums of the analysed messages of each day, by ISO date in UTC, and the keys
+    # of the documents the profile sent messages in, so the profile page is drawn from this row.
+    risk_timeline = models.JSONField(default=dict)
+    document_ids = models.JSONField(default=list)
+
+    def __str__(self):
+        return f'Statistics of {self.profile.name}'
+
+
+class DocumentParticipant(models.Model):
+    '''Represents a profile who sent messages in a document.'''
+    document = models.ForeignKey(Document, on_delete=models.CASCADE)
+    profile = models.ForeignKey(Profile, on_delete=models.CASCADE)
+    message_count = models.IntegerField(default=0)
+
+    class Meta:
+        '''Metadata for DocumentParticipant.'''
+        unique_together = ('document', 'profile')
+
+    def __str__(self):
+        return f'{self.profile.name} in {self.document.display_name}'
+
+
+class ProfileRelation(models.Model):
+    '''
+    Represents two profiles who sent messages in the same documents, with the number of
+    documents. Stored in both directions, maintained by analyzer.io.relation.
+    '''
+    from_profile = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name='relations')
+    to_profile = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name='+')
+    document_count = models.IntegerField(default=0)
+
+    class Meta:
+        '''Metadata for ProfileRelation.'''
+        unique_together = ('from_profile', 'to_profile')
+
+    def __str__(self):
+        return f'{self.from_profile.name} and {self.to_profile.name}'
+
+
+class TopicMention(models.Model):
+    '''
+    Represents a topic mentioned by a profile in a document, with the number of messages it was
+    mentioned in. Maintained by analyzer.io.statistics as NLP results land.
+    '''
+    keyword = models.CharField(max_length=4096)
+    document = models.ForeignKey(Document, on_delete=models.CASCADE)
+    profile = models.ForeignKey(Profile, on_delete=models.CASCADE)
+    message_count = models.IntegerField(default=0)
+
+    class Meta:
+        '''Metadata for TopicMention.'''
+        unique_together = ('keyword', 'document', 'profile')
+        indexes = [models.Index(fields=['document', 'keyword'])]
+
+    def __str__(self):
+        return f'{self.profile.name} mentioned {self.keyword} in {self.document.display_name}'
+
+
+class IngestionJob(models.Model):
+    '''Represents a background parse of an uploaded document.'''
+    PHASES = (
+        ('queued', 'Queued'),
+        ('parsing', 'Parsing'),
+        ('saving', 'Saving'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    )
+
+    uuid = models.UUIDField(default=uuid.uuid4, primary_key=True)
+    document = models.ForeignKey(Document, on_delete=models.CASCADE)
+    phase = models.CharField(max_length=16, choices=PHASES, default='queued')
+    rows_parsed = models.IntegerField(default=0)
+    preview_ready = models.BooleanField(default=False)
+    preview = models.JSONField(null=True)
+    file_name = models.CharField(max_length=4096, null=True)
+    error = models.TextField(null=True)
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'Ingestion of {self.document.display_name} ({self.phase})'
+
+
+class BulkIngestionJob(models.Model):
+    '''
+    Represents a background ingestion of a zip archive of conversations which share a field
+    mapping, see analyzer.io.bulk. The archive is kept until the job finishes.
+    '''
+    uuid = models.UUIDField(default=uuid.uuid4, primary_key=True)
+    owner = models.ForeignKey(SystemUser, on_delete=models.CASCADE)
+    field_mapping = models.JSONField()
+    phase = models.CharField(max_length=16, choices=IngestionJob.PHASES, default='queued')
+    files_total = models.IntegerField(default=0)
+    files_done = models.IntegerField(default=0)
+    reports = models.JSONField(default=list)
+    error = models.TextField(null=True)
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    def get_archive_path(self):
+        '''Returns the path of the uploaded archive.'''
+        return os.path.join(settings.MEDIA_ROOT, 'bulk_uploads', f'{self.uuid}.zip')
+
+    def __str__(self):
+        return f'Bulk ingestion of {self.files_total} files ({self.phase})'
+
+
+class UploadSession(models.Model):
+    '''Represents a chunked upload, chunks are appended to a temporary file until complete.'''
+    uuid = models.UUIDField(default=uuid.uuid4, primary_key=True)
+    owner = models.ForeignKey(SystemUser, on_delete=models.CASCADE)
+    display_name = models.CharField(max_length=4096)
+    total_size = models.BigIntegerField()
+    chunk_size = models.IntegerField()
+    received = models.BigIntegerField(default=0)
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    def get_temp_path(self):
+        '''Returns the path of the partially received file.'''
+        return os.path.join(settings.MEDIA_ROOT, 'upload_sessions', f'{self.uuid}.part')
+
+    def __str__(self):
+        return f'Upload of {self.display_name} ({self.received}/{self.total_size} bytes)'
+
+
+class FieldMapping(models.Model):
+    '''Represents a field mapping saved by a user, to be applied to similar files.'''
+    owner = models.ForeignKey(SystemUser, on_delete=models.CASCADE)
+    name = models.CharField(max_length=256)
+    mapping = models.JSONField()
+
+    class Meta:
+        '''Metadata for FieldMapping.'''
+        unique_together = ('owner', 'name')
+
+    def __str__(self):
+        return str(self.name)
@@ -1,14 +1,19 @@
 """Tests file for analyzer module."""
 # pylint: disable=missing-function-docstring,missing-class-docstring
+import hashlib
+import io
 import json
+import os
 from os.path import join as directory_path
 from django.conf import settings
-from django.test import TestCase, Client
+from django.test import TestCase, Client, override_settings
 from django.core.files.base import ContentFile
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.urls import reverse
-from analyzer.models import Document, NLPTask, Profile, SystemUser, User, Message
-from analyzer.io import views_helper
+from analyzer.models import (Document, IngestionJob, NLPTask, Profile, SystemUser, UploadSession,
+                             User, Message)
+from analyzer.io import append, chunked_upload, dedup, ingestion, views_helper
+from analyzer.io.common import PendingRecord
 from data_ingestion.file_handling import FileProcessor
 
 VALID_FILE_DATA = "2021-09-25T15:36:30, Jamie Smith: True that, Mia. Let's not freak out though. Lemme try calling her again" # pylint: disable=line-too-long
@@ -202,6 +207,7 @@ class UploadFileTestCase(TestCase):
         self.client.login(username='testuser', password='testpassword')
         self.url = reverse('api_upload_file')
 
+    @override_settings(INGESTION_BACKGROUND=False)
     def test_upload_valid_file(self):
         # Make a POST request to the API endpoint
         # Note: Do not use unformatted data here,
@@ -213,7 +219,14 @@ class UploadFileTestCase(TestCase):
         # Check if the response is successful
         self.assertEqual(response.status_code, 200)
         self.assertTrue(response.json()['success'], response.json())
-        filename = response.json()['file_name']
+
+        # Check the job reports the parsed preview
+        status = self.client.get(response.json()['status_url']).json()
+        self.assertEqual(status['phase'], 'done')
+        self.assertTrue(status['preview_ready'])
+        self.assertEqual(status['rows_parsed'], 1)
+        self.assertEqual(status['preview'][0]['name'], 'Jamie Smith')
+        filename = status['file_name']
 
         # Check if the file record is created in the database
         document = Document.objects.get(file=filename)
@@ -222,6 +235,27 @@ class UploadFileTestCase(TestCase):
         # Clean up the test file
         document.file.delete()
 
+    @override_settings(INGESTION_BACKGROUND=False)
+    def test_upload_status_other_user(self):
+        file = SimpleUploadedFile("test_upload.txt", VALID_FILE_DATA.encode(), "text/plain")
+        status_url = self.client.post(self.url, {'file': file}).json()['status_url']
+
+        SystemUser.objects.create(
+            user=User.objects.create_user(username='otheruser', password='otherpassword'))
+        self.client.login(username='otheruser', password='otherpassword')
+        response = self.client.get(status_url)
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(response.json()['success'])
+
+    def test_upload_unsupported_file(self):
+        file = SimpleUploadedFile("test_upload.pdf", VALID_FILE_DATA.encode(), "application/pdf")
+
+        response = self.client.post(self.url, {'file': file})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.json()['success'])
+        self.assertFalse(IngestionJob.objects.exists())
+
     def test_upload_invalid_file(self):
         # Create an invalid file
 
@@ -253,6 +287,200 @@ class UploadFileTestCase(TestCase):
         self.assertFalse(response.json()['success'])
         self.assertTrue(response.json()['error'])
 
+@override_settings(UPLOAD_CHUNK_SIZE=32, INGESTION_BACKGROUND=False)
+class ChunkedUploadTestCase(TestCase):
+    def setUp(self):
+        self.client = Client()
+        SystemUser.objects.get_or_create(
+            user=User.objects.create_user(username='testuser', password='testpassword')
+        )
+        self.client.login(username='testuser', password='testpassword')
+        self.data = VALID_FILE_DATA.encode()
+        response = self.client.post(reverse('api_chunked_upload_start'), json.dumps({
+            'file_name': 'test_chunked.txt', 'size': len(self.data)
+        }), content_type='application/json')
+        self.upload_url = response.json()['upload_url']
+
+    def put_chunk(self, offset):
+        return self.client.put(self.upload_url, self.data[offset:offset + 32],
+                               content_type='application/octet-stream',
+                               headers={'X-Upload-Offset': str(offset)})
+
+    def checksum(self):
+        digests = ''.join(hashlib.sha256(self.data[offset:offset + 32]).hexdigest()
+                          for offset in range(0, len(self.data), 32))
+        return hashlib.sha256(digests.encode()).hexdigest()
+
+    def test_chunked_upload_resumes(self):
+        self.assertEqual(self.put_chunk(0).json()['offset'], 32)
+        # A chunk at the wrong offset is refused with the offset to resume from.
+        response = self.put_chunk(64)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['offset'], 32)
+        self.assertEqual(self.client.get(self.upload_url).json()['offset'], 32)
+        for offset in range(32, len(self.data), 32):
+            self.put_chunk(offset)
+
+        response = self.client.post(f'{self.upload_url}/complete', json.dumps({
+            'checksum': self.checksum()
+        }), content_type='application/json')
+        self.assertTrue(response.json()['success'], response.json())
+        status = self.client.get(response.json()['status_url']).json()
+        self.assertEqual(status['preview'][0]['name'], 'Jamie Smith')
+        self.assertFalse(UploadSession.objects.exists())
+        Document.objects.get(display_name='test_chunked.txt').file.delete()
+
+    def test_concurrent_chunks_are_written_once(self):
+        # Both requests loaded the session before either chunk was written.
+        first, second = UploadSession.objects.get(), UploadSession.objects.get()
+        chunked_upload.append_chunk(first, 0, 32, io.BytesIO(self.data[:32]))
+        with self.assertRaises(chunked_upload.ChunkError):
+            chunked_upload.append_chunk(second, 0, 32, io.BytesIO(self.data[:32]))
+        self.assertEqual(second.received, 32)
+        self.assertEqual(os.path.getsize(second.get_temp_path()), 32)
+
+    def test_chunked_upload_bad_checksum(self):
+        for offset in range(0, len(self.data), 32):
+            self.put_chunk(offset)
+        response = self.client.post(f'{self.upload_url}/complete', json.dumps({
+            'checksum': hashlib.sha256(self.data).hexdigest()
+        }), content_type='application/json')
+        self.assertFalse(response.json()['success'])
+        self.assertEqual(response.json()['offset'], 0)
+        self.assertFalse(Document.objects.filter(display_name='test_chunked.txt').exists())
+
+@override_settings(INGESTION_BACKGROUND=False)
+class DeduplicationTestCase(TestCase):
+    def setUp(self):
+        self.client = Client()
+        SystemUser.objects.get_or_create(
+            user=User.objects.create_user(username='testuser', password='testpassword')
+        )
+        self.client.login(username='testuser', password='testpassword')
+
+    def upload(self):
+        file = SimpleUploadedFile("test_dedup.txt", VALID_FILE_DATA.encode(), "text/plain")
+        return self.client.post(reverse('api_upload_file'), {'file': file}).json()
+
+    def test_identical_upload_reuses_analysis(self):
+        status = self.client.get(self.upload()['status_url']).json()
+        self.client.post(reverse('api_accept_file'), json.dumps({
+            "file_name": status['file_name'],
+            "field_mapping": [{"field": "sender", "value": "name"},
+                              {"field": "body", "value": "body"},
+                              {"field": "date", "value": "date"},
+                              {"field": "time", "value": "time"}]
+        }), content_type='application/json')
+        original = Document.objects.get(accepted=True)
+        message = Message.objects.get(source=original)
+        NLPTask.objects.create(message=message, result='{"risk": 0.5}')
+
+        response = self.upload()
+        self.assertEqual(response['duplicate_of']['display_name'], 'test_dedup.txt')
+        self.assertNotIn('status_url', response)
+        # Names are chosen by users, so they are escaped in the message.
+        Document.objects.filter(pk=original.pk).update(display_name='<i>test_dedup</i>.txt')
+        response = self.client.post(response['reuse_url'], json.dumps({'reuse': True}),
+                                    content_type='application/json').json()
+        self.assertTrue(response['success'], response)
+        self.assertIn('&lt;i&gt;test_dedup&lt;/i&gt;.txt', response['message'])
+
+        copy = Document.objects.get(reused_from=original)
+        self.assertTrue(copy.accepted)
+        self.assertEqual(copy.file.name, original.file.name)
+        self.assertEqual(NLPTask.objects.get(message__source=copy).result, '{"risk": 0.5}')
+        self.assertEqual(Message.objects.get(source=copy).body, message.body)
+        self.assertFalse(IngestionJob.objects.filter(document=copy).exists())
+        self.assertGreater(dedup.get_storage_saved()['bytes'], len(VALID_FILE_DATA))
+
+        # Rejecting a document must leave the files of an identical document alone.
+        PendingRecord(copy).reject()
+        self.assertTrue(os.path.exists(original.file.path))
+        PendingRecord(original).reject()
+
+    def test_identical_upload_processed_again(self):
+        self.upload()
+        first = IngestionJob.objects.get().document
+        first.accepted = True
+        first.save()
+        response = self.upload()
+        response = self.client.post(response['reuse_url'], json.dumps({'reuse': False}),
+                                    content_type='application/json').json()
+        status = self.client.get(response['status_url']).json()
+        self.assertEqual(status['phase'], 'done')
+        self.assertFalse(Document.objects.filter(reused_from=first).exists())
+        for document in Document.objects.filter(display_name='test_dedup.txt'):
+            document.file.delete()
+
+@override_settings(INGESTION_BACKGROUND=False)
+class AppendIngestionTestCase(TestCase):
+    FIELD_MAPPING = [{"field": "sender", "value": "name"}, {"field": "body", "value": "body"},
+                     {"field": "date", "value": "date"}, {"field": "time", "value": "time"}]
+
+    def setUp(self):
+        self.client = Client()
+        SystemUser.objects.get_or_create(
+            user=User.objects.create_user(username='testuser', password='testpassword')
+        )
+        self.client.login(username='testuser', password='testpassword')
+
+    def upload_and_accept(self, name, data, **options):
+        file = SimpleUploadedFile(name, data.encode(), "text/plain")
+        status_url = self.client.post(reverse('api_upload_file'), {'file': file}).json()[
+            'status_url']
+        return self.client.post(reverse('api_accept_file'), json.dumps({
+            "file_name": self.client.get(status_url).json()['file_name'],
+            "field_mapping": self.FIELD_MAPPING, **options
+        }), content_type='application/json').json()
+
+    def test_append_inserts_only_new_messages(self):
+        self.upload_and_accept("first.txt", VALID_FILE_DATA)
+        document = Document.objects.get(display_name='first.txt')
+        NLPTask.objects.create(message=Message.objects.get(source=document), result='{}')
+        Document.objects.filter(pk=document.pk).update(display_name='<i>first</i>.txt')
+
+        later_export = VALID_FILE_DATA + "\n2021-09-25T15:40:00, Mia: She picked up!"
+        response = self.upload_and_accept("second.txt", later_export,
+                                          append_to=str(document.uuid))
+        self.assertTrue(response['success'], response)
+        self.assertIn('1 new messages were added to &lt;i&gt;first&lt;/i&gt;.txt',
+                      response['message'])
+
+        messages = Message.objects.filter(source=document).order_by('date')
+        self.assertEqual([message.body for message in messages],
+                         [Message.objects.first().body, 'She picked up!'])
+        self.assertEqual(NLPTask.objects.filter(message__source=document).count(), 2)
+        self.assertFalse(Document.objects.filter(display_name='second.txt').exists())
+        saved_rows = ingestion.read_save(ingestion.get_save_path(response['file_name']))
+        self.assertEqual(len(saved_rows), 2)
+
+        # Appending the same export again adds nothing.
+        response = self.upload_and_accept("third.txt", later_export,
+                                          append_to=str(document.uuid))
+        self.assertIn('0 new messages', response['message'])
+        self.assertEqual(Message.objects.filter(source=document).count(), 2)
+        PendingRecord(document).reject()
+
+    def test_merge_openai_data(self):
+        previous = {'summary': 'Old', 'risk_score_messages': [0.1, 0.2],
+                    'locations': [{'message': 1, 'location': 'Leeds'}],
+                    'dangerous_behaviour': {'escalating': True, 'escalating_messages': [1]},
+                    'motives': ['money']}
+        delta = {'summary': 'New', 'risk_score_messages': [0.9],
+                 'locations': [{'message': 0, 'location': 'York'}],
+                 'dangerous_behaviour': {'escalating': False, 'escalating_messages': [0],
+                                         'manipulative': True},
+                 'motives': ['money', 'revenge']}
+        merged = append.merge_openai_data(previous, delta, 2)
+        self.assertEqual(merged['summary'], 'New')
+        self.assertEqual(merged['risk_score_messages'], [0.1, 0.2, 0.9])
+        self.assertEqual(merged['locations'][1], {'message': 2, 'location': 'York'})
+        self.assertEqual(merged['dangerous_behaviour']['escalating_messages'], [1, 2])
+        self.assertTrue(merged['dangerous_behaviour']['escalating'])
+        self.assertTrue(merged['dangerous_behaviour']['manipulative'])
+        self.assertEqual(merged['motives'], ['money', 'revenge'])
+        self.assertEqual(append.merge_openai_data(previous, [], 2), previous)
+
 class LoginTestCase(TestCase):
 
     def setUp(self):
@@ -0,0 +1,432 @@
+"""Tests for the dashboard graphs and the data behind them."""
+# pylint: disable=missing-function-docstring,missing-class-docstring
+import io
+import json
+from unittest import mock
+from django.core.management import call_command
+from django.test import TestCase, Client, override_settings
+from django.urls import reverse
+import numpy as np
+from analyzer.models import Document, NLPTask, Profile, SystemUser, User, Message
+from analyzer.io import response_times, statistics, views_helper
+from analyzer.io.messages import NIL_UUID
+from analyzer.io.nlp import NLPTaskRecordManager
+from graph import cache, distribution, downsample, frame, metrics, network, plot
+from graph import snapshot as graph_snapshot
+from graph.snapshot import DashboardSnapshot, get_snapshot
+
+class DashboardSnapshotTestCase(TestCase):
+    def setUp(self):
+        self.user = SystemUser.objects.create(
+            user=User.objects.create_user(username='testuser', password='testpassword'))
+        self.profiles = [Profile.objects.create(name=name, note='') for name in ('Mia', 'Alex')]
+
+    def create_document(self, name, minutes):
+        document = Document.objects.create(file=f'uploaded_documents/{name}', display_name=name,
+                                           owner=self.user, accepted=True,
+                                           is_ingestion_output=True)
+        for index, minute in enumerate(minutes):
+            message = Message.objects.create(
+                date=f'2024-01-01T12:{minute:02}:00Z', body=f'Message {index}',
+                source=document, owner=self.profiles[index % 2])
+            NLPTask.objects.create(message=message, result=json.dumps({
+                'risk': 0.1 * index, 'sentiment': 0.5,
+                'topics': [['Glasgow', 'LOC']] if index == 0 else [],
+            }))
+        statistics.rebuild_statistics()
+        response_times.update_response_times(document.pk)
+        return document
+
+    def test_snapshot(self):
+        self.create_document('first.txt', [0, 5, 15])
+        self.create_document('empty.txt', [])
+        snapshot = DashboardSnapshot(Document.objects.order_by('display_name'))
+        self.assertFalse(snapshot.pending)
+        self.assertEqual([document.name for document in snapshot.get_documents_with_messages()],
+                         ['first.txt'])
+        first = snapshot.get_documents_with_messages()[0]
+        self.assertEqual(first.get_message_count(), 3)
+        self.assertEqual(first.get_profile_count(), 2)
+        self.assertEqual(first.get_average_messages_per_profile(), 1.5)
+        self.assertEqual(first.response_times.tolist(), [5, 10])
+        self.assertEqual(first.topics, ['Glasgow'])
+        self.assertAlmostEqual(first.get_average_profile_risk(), 0.1)
+        self.assertEqual(snapshot.shared_topics, [])
+
+        for draw, description in plot.ALL_DOCUMENTS_GRAPHS.values():
+            figure, pending = draw(snapshot)
+            self.assertFalse(pending)
+            graph = json.loads(plot.graph_to_json(figure, description, pending))
+            self.assertNotIn('template', graph['figure']['layout'])
+
+    def test_common_topics(self):
+        self.create_document('first.txt', [0, 5])
+        self.create_document('second.txt', [0])
+        self.create_document('third.txt', [])
+        figure, pending = plot.common_topics(DashboardSnapshot(Document.objects.all()))
+        self.assertFalse(pending)
+        self.assertEqual(sorted(figure.data[1].hovertext), [
+            'Mia mentioned Glasgow in first.txt', 'Mia mentioned Glasgow in second.txt'])
+
+    def test_snapshot_is_shared(self):
+        self.create_document('first.txt', [0, 1])
+        documents = Document.objects.all()
+        snapshot = get_snapshot(documents, [('first', 1)])
+        self.assertIs(get_snapshot(documents, [('first', 1)]), snapshot)
+        self.assertIsNot(get_snapshot(documents, [('first', 2)]), snapshot)
+
+    def test_snapshot_is_taken_outside_cache_lock(self):
+        # Requests for other documents can read the cache while a snapshot is taken.
+        def take_snapshot(documents):
+            # pylint: disable-next=protected-access
+            self.assertFalse(graph_snapshot._snapshots_lock.locked())
+            return DashboardSnapshot(documents)
+        with mock.patch.object(graph_snapshot, 'DashboardSnapshot', take_snapshot):
+            snapshot = get_snapshot(Document.objects.all(), [('first', 3)])
+        self.assertIs(get_snapshot(Document.objects.all(), [('first', 3)]), snapshot)
+
+    def test_query_count_does_not_grow(self):
+        self.create_document('first.txt', [0, 1])
+        with self.assertNumQueries(5):
+            DashboardSnapshot(Document.objects.all())
+        for index in range(5):
+            self.create_document(f'{index}.txt', [0, 1, 2])
+        with self.assertNumQueries(5):
+            snapshot = DashboardSnapshot(Document.objects.all())
+        self.assertEqual(len(snapshot.get_documents_with_messages()), 6)
+
+    def test_pending_results(self):
+        document = self.create_document('first.txt', [0])
+        NLPTask.objects.filter(message__source=document).update(result=None)
+        self.assertTrue(DashboardSnapshot([document]).pending)
+
+class ResultsFrameTestCase(TestCase):
+    def setUp(self):
+        self.user = SystemUser.objects.create(
+            user=User.objects.create_user(username='testuser', password='testpassword'))
+        self.profiles = [Profile.objects.create(name=name, note='') for name in ('Mia', 'Alex')]
+        self.documents = [Document.objects.create(
+            file=f'uploaded_documents/{name}', display_name=name, owner=self.user,
+            accepted=True, is_ingestion_output=True) for name in ('first.txt', 'second.txt')]
+
+    def create_message(self, document, row):
+        # A row holds the owner, minute and risk of the message, and optionally its topics.
+        message = Message.objects.create(date=f'2024-01-01T12:{row["minute"]:02}:00Z',
+                                         body=f'Message {row["minute"]}', source=document,
+                                         owner=row['owner'])
+        risk = row['risk']
+        NLPTask.objects.create(message=message, result=None if risk is None else json.dumps({
+            'risk': risk, 'sentiment': -risk, 'joy_extreme': 0.5, 'sad_extreme': 0,
+            'anger_extreme': 0, 'fear_extreme': 0,
+            'topics': [list(topic) for topic in row.get('topics', ())]}))
+        return message
+
+    def test_read_frame(self):
+        mia, alex = self.profiles
+        first, second = self.documents
+        self.create_message(first, {'owner': mia, 'minute': 5, 'risk': 0.2,
+                                    'topics': [('Glasgow', 'LOC'), ('Mia', 'PERSON')]})
+        self.create_message(first, {'owner': alex, 'minute': 0, 'risk': 0.4,
+                                    'topics': [('Glasgow', 'LOC')]})
+        self.create_message(second, {'owner': mia, 'minute': 1, 'risk': 0.6,
+                                     'topics': [('Glasgow', 'LOC')]})
+        results = frame.read_frame(Message.objects.all())
+
+        self.assertEqual(len(results), 3)
+        self.assertFalse(results.is_pending())
+        self.assertEqual(results.owner_values, ['Alex', 'Mia'])
+        self.assertEqual(results.topic_values, [('Glasgow', 'LOC'), ('Mia', 'PERSON')])
+        series = results.get_series()
+        self.assertEqual(series['ID'].tolist(), [1, 2, 3])
+        self.assertEqual(series['Risk'].tolist(), [0.4, 0.6, 0.2])
+        self.assertEqual(series['Sentiment'].tolist(), [-0.4, -0.6, -0.2])
+
+        owners, means = results.group_mean('risk', 'owners')
+        self.assertEqual(owners, ['Alex', 'Mia'])
+        np.testing.assert_allclose(means, [0.4, 0.4])
+        pairs = results.get_topic_pairs('owners')
+        self.assertEqual([pair[:3] for pair in pairs], [
+            ('Alex', ('Glasgow', 'LOC'), 1), ('Mia', ('Glasgow', 'LOC'), 2),
+            ('Mia', ('Mia', 'PERSON'), 1)])
+        self.assertAlmostEqual(pairs[1][3], 0.8)
+        self.assertEqual({document: times.tolist() for document, times in
+                          results.split(results.message_ids).items()},
+                         {first.uuid: [2, 1], second.uuid: [3]})
+
+    def test_pending_results(self):
+        self.create_message(self.documents[0], {'owner': self.profiles[0], 'minute': 0,
+                                                'risk': 0.2})
+        self.create_message(self.documents[0], {'owner': self.profiles[1], 'minute': 1,
+                                                'risk': None})
+        results = frame.read_frame(Message.objects.all())
+        self.assertTrue(results.is_pending())
+        self.assertEqual(results.get_series()['Risk'].tolist(), [0.2])
+        self.assertTrue(np.isnan(results.scores['risk'][1]))
+        series, pending = plot.get_messages_series(Message.objects.all())
+        self.assertTrue(pending)
+        self.assertEqual(len(series['Risk']), 0)
+
+    def test_empty(self):
+        results = frame.read_frame(Message.objects.none())
+        self.assertEqual(len(results), 0)
+        self.assertFalse(results.is_pending())
+        owners, means = results.group_mean('risk')
+        self.assertEqual((owners, len(means)), ([], 0))
+        self.assertEqual(results.get_topic_pairs(), [])
+
+    def test_document_graphs(self):
+        mia, alex = self.profiles
+        for minute in range(4):
+            self.create_message(self.documents[0], {'owner': (mia, alex)[minute % 2],
+                                                    'minute': minute, 'risk': minute / 10,
+                                                    'topics': [('Glasgow', 'LOC')]})
+        messages = Message.objects.filter(source=self.documents[0])
+        figure, pending = plot.profile_risk_bar_graph(messages)
+        self.assertFalse(pending)
+        self.assertEqual([(trace.x[0], round(trace.y[0], 2)) for trace in figure.data],
+                         [('Mia', 0.1), ('Alex', 0.2)])
+        figure, pending = plot.relationship_graph(messages)
+        self.assertFalse(pending)
+        self.assertIn('Mia mentioned Glasgow in 2 messages, average risk 0.10',
+                      figure.data[1].hovertext)
+
+class GraphCacheTestCase(TestCase):
+    def setUp(self):
+        cache.clear_cache()
+        self.user = SystemUser.objects.create(
+            user=User.objects.create_user(username='testuser', password='testpassword'))
+        self.document = Document.objects.create(
+            file='uploaded_documents/cached.txt', display_name='cached.txt', owner=self.user,
+            accepted=True, is_ingestion_output=True)
+        profile = Profile.objects.create(name='Mia', note='')
+        self.messages = Message.objects.bulk_create([
+            Message(date=f'2024-01-01T12:0{index}:00Z', body=f'Message {index}',
+                    source=self.document, owner=profile) for index in range(2)])
+        statistics.record_messages(self.messages)
+
+    def tearDown(self):
+        cache.clear_cache()
+
+    @override_settings(GRAPH_CACHE_MAX_BYTES=10)
+    def test_eviction(self):
+        cache.cache_rendered('first', 'abcd')
+        cache.cache_rendered('second', 'efgh')
+        self.assertEqual(cache.get_rendered('first'), (True, 'abcd'))
+        cache.cache_rendered('third', 'abcd')
+        self.assertEqual(cache.get_rendered('second'), (False, None))
+        cache.cache_rendered('too large', 'a' * 11)
+        self.assertEqual(cache.get_rendered('too large'), (False, None))
+        self.assertEqual(cache.get_cache_stats() | {'hit_rate': None}, {
+            'hits': 1, 'misses': 2, 'evictions': 1, 'hit_rate': None, 'entries': 2,
+            'bytes': 8, 'max_bytes': 10})
+
+    def test_pending_graphs_are_not_cached(self):
+        NLPTask.objects.bulk_create([NLPTask(message=message) for message in self.messages])
+        graph = json.loads(views_helper.get_dashboard_graph(
+            self.user.user, str(self.document.uuid), 'sentiment-risk'))
+        self.assertTrue(graph['pending'])
+        self.assertEqual(cache.get_cache_stats()['entries'], 0)
+
+    def analyse(self):
+        for message in self.messages:
+            NLPTask.objects.create(message=message)
+            runner = NLPTaskRecordManager(message.pk)
+            runner.fulfill(runner.selector(), json.dumps({
+                'risk': 0.1, 'sentiment': 0.5, 'joy_extreme': 0, 'sad_extreme': 0,
+                'anger_extreme': 0, 'fear_extreme': 0, 'topics': []})).save()
+
+    def test_graphs_are_drawn_again_when_data_changes(self):
+        self.analyse()
+        uuid = str(self.document.uuid)
+        graph = views_helper.get_dashboard_graph(self.user.user, uuid, 'emotions')
+        self.assertIs(views_helper.get_dashboard_graph(self.user.user, uuid, 'emotions'), graph)
+        self.assertEqual(cache.get_cache_stats()['hits'], 1)
+
+        statistics.bump_versions([self.document.pk])
+        self.assertIsNot(views_helper.get_dashboard_graph(self.user.user, uuid, 'emotions'),
+                         graph)
+        self.assertEqual(cache.get_cache_stats()['misses'], 2)
+
+    def test_graph_endpoints(self):
+        self.analyse()
+        client = Client()
+        client.force_login(self.user.user)
+        response = client.get(reverse('dashboard'))
+        self.assertEqual(len(response.context['graph_urls']), 5)
+        for url in response.context['graph_urls']:
+            graph = client.get(url).json()
+            self.assertFalse(graph['pending'])
+            self.assertIn('data', graph['figure'])
+            self.assertTrue(graph['description'])
+
+        for document_id in (self.document.uuid, NIL_UUID):
+            for name in views_helper.get_dashboard_graphs(str(document_id)):
+                response = client.get(reverse('api_dashboard_graph', args=[document_id, name]))
+                self.assertEqual(response.status_code, 200)
+        self.assertEqual(client.get(reverse('api_dashboard_graph', args=[
+            self.document.uuid, 'common-topics'])).status_code, 404)
+        other = Client()
+        other.force_login(User.objects.create_user(username='other', password='password'))
+        SystemUser.objects.create(user=User.objects.get(username='other'))
+        self.assertEqual(other.get(reverse('api_dashboard_graph', args=[
+            self.document.uuid, 'emotions'])).status_code, 404)
+
+    def test_load_metrics(self):
+        metrics.clear_loads()
+        client = Client()
+        client.force_login(self.user.user)
+        for time_to_first_graph in (100, 300):
+            response = client.post(reverse('api_dashboard_metrics'), {
+                'time_to_first_graph': time_to_first_graph, 'total_time': 500,
+                'payload_bytes': 2048, 'graphs': 5}, content_type='application/json')
+            self.assertTrue(response.json()['success'])
+        self.assertEqual(client.post(reverse('api_dashboard_metrics'), {'graphs': 'five'},
+                                     content_type='application/json').status_code, 400)
+        self.assertEqual(metrics.get_load_stats(), {
+            'loads': 2, 'time_to_first_graph': 200, 'total_time': 500, 'payload_bytes': 2048})
+
+    def test_profile_page_graphs_are_cached(self):
+        self.analyse()
+        client = Client()
+        client.force_login(self.user.user)
+        profile = self.messages[0].owner
+        for _ in range(2):
+            response = client.get(reverse('profile', args=[profile.pk]))
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(cache.get_cache_stats()['hits'], 1)
+
+class NetworkGraphTestCase(TestCase):
+    def test_layout(self):
+        points = network.phyllotaxis_layout(500)
+        self.assertTrue((network.phyllotaxis_layout(500) == points).all())
+        distances = np.linalg.norm(points[:, None] - points[None], axis=2)
+        np.fill_diagonal(distances, np.inf)
+        self.assertGreater(distances.min(), 0.5)
+
+        nodes, _ = network.layout_nodes({'a': 1, 'b': 3, 'c': 1})
+        self.assertEqual(nodes, ['b', 'a', 'c'])
+
+    def test_edges_are_aggregated(self):
+        graph = network.Network()
+        for _ in range(3):
+            graph.add_edge('Mia', 'money', text='Mia')
+        graph.add_edge('Alex', 'money', 2)
+        self.assertEqual(dict(graph.weights), {('Mia', 'money'): 3, ('Alex', 'money'): 2})
+        self.assertEqual(graph.texts[('Mia', 'money')], ['Mia'])
+
+        fig = network.network_figure(graph)
+        self.assertEqual(len(fig.data), 4)
+        self.assertEqual(len(fig.data[0].x), 6)
+        self.assertEqual(list(fig.data[1].hovertext), ['Mia - money: 3', 'Alex - money: 2'])
+        self.assertEqual(list(fig.data[3].text), ['money'])
+
+    def test_many_nodes(self):
+        graph = network.Network()
+        for index in range(5000):
+            graph.add_edge(f'Profile {index}', f'Topic {index % 3000}')
+        fig = network.network_figure(graph)
+        self.assertEqual(len(fig.data), 4)
+        self.assertIsNone(fig.data[2].text)
+        self.assertEqual(len(fig.data[2].hovertext) + len(fig.data[3].hovertext), 8000)
+
+    def test_benchmark_command(self):
+        output = io.StringIO()
+        call_command('benchmark_network', nodes=200, edges=1000, stdout=output)
+        self.assertIn('200 nodes', output.getvalue())
+
+class DistributionTestCase(TestCase):
+    def test_distribution(self):
+        values = np.random.default_rng(0).normal(2, 0.5, 100000)
+        estimate = distribution.get_distribution(values, 100)
+        self.assertEqual(len(estimate.grid), 100)
+        self.assertAlmostEqual(np.trapz(estimate.density, estimate.grid), 1, places=2)
+        self.assertAlmostEqual(estimate.grid[np.argmax(estimate.density)], 2, delta=0.1)
+        self.assertAlmostEqual(estimate.quartiles[1], 2, places=1)
+        self.assertAlmostEqual(estimate.quartiles[2] - estimate.quartiles[0], 0.674, places=1)
+        self.assertEqual(estimate.size, 100000)
+
+        constant = distribution.get_distribution([3, 3, 3], 50)
+        self.assertEqual(constant.quartiles, [3, 3, 3])
+        self.assertTrue(np.isfinite(constant.density).all())
+
+    def test_histogram_distribution(self):
+        edges = statistics.get_bin_edges()
+        counts = [0] * 20
+        counts[5], counts[15] = 10, 30
+        estimate = distribution.get_histogram_distribution(counts, edges, points=80)
+        self.assertEqual(len(estimate.grid), 80)
+        self.assertEqual((estimate.grid[0], estimate.grid[-1]), (-1, 1))
+        self.assertAlmostEqual(estimate.mean, 0.3)
+        self.assertEqual(estimate.size, 40)
+        self.assertGreater(estimate.quartiles[1], 0.5)
+        self.assertGreater(estimate.density[60], estimate.density[20])
+
+    def test_ridges_do_not_grow_with_values(self):
+        sizes = []
+        for count in (100, 10000):
+            fig = distribution.ridge_figure([('Risk', distribution.get_distribution(
+                np.random.default_rng(0).random(count), 50))])
+            self.assertEqual(len(fig.data), 3)
+            sizes.append(len(plot.graph_to_json(fig, '', False)))
+        self.assertLess(abs(sizes[0] - sizes[1]), 100)
+
+class DownsampleTestCase(TestCase):
+    def test_lttb_keeps_peaks(self):
+        x = np.arange(100000)
+        y = np.sin(x / 1000)
+        y[31337] = 5
+        y[77777] = -5
+        sampled_x, sampled_y = downsample.downsample(x, y, 500)
+        self.assertEqual(len(sampled_x), 500)
+        self.assertEqual((sampled_x[0], sampled_x[-1]), (0, 99999))
+        self.assertTrue((np.diff(sampled_x) > 0).all())
+        self.assertIn(31337, sampled_x)
+        self.assertIn(77777, sampled_x)
+        self.assertEqual((sampled_y.max(), sampled_y.min()), (5, -5))
+
+        self.assertEqual(len(downsample.downsample(x[:10], y[:10], 500)[0]), 10)
+        self.assertEqual(list(downsample.lttb(x, y, 2)), [0, 99999])
+
+    def test_range(self):
+        x = np.arange(1, 1001)
+        range_x, range_y = downsample.get_range(x, x * 2, 100.5, 200, 1000)
+        self.assertEqual((range_x[0], range_x[-1]), (100, 201))
+        self.assertEqual(list(range_y), list(range_x * 2))
+        self.assertEqual(len(downsample.get_range(x, x, 0, 1000, 50)[0]), 50)
+
+    @override_settings(GRAPH_MAX_POINTS=10)
+    def test_graphs_are_downsampled(self):
+        cache.clear_cache()
+        user = SystemUser.objects.create(
+            user=User.objects.create_user(username='testuser', password='testpassword'))
+        document = Document.objects.create(
+            file='uploaded_documents/chat.txt', display_name='chat.txt', owner=user,
+            accepted=True, is_ingestion_output=True)
+        profile = Profile.objects.create(name='Mia', note='')
+        messages = Message.objects.bulk_create([
+            Message(date=f'2024-01-01T12:{index:02}:00Z', body=f'Message {index}',
+                    source=document, owner=profile) for index in range(40)])
+        statistics.record_messages(messages)
+        for index, message in enumerate(messages):
+            NLPTask.objects.create(message=message)
+            runner = NLPTaskRecordManager(message.pk)
+            runner.fulfill(runner.selector(), json.dumps({
+                'risk': index / 40, 'sentiment': 0.5, 'joy_extreme': 0.2, 'sad_extreme': 0,
+                'anger_extreme': 0, 'fear_extreme': 0, 'topics': []})).save()
+
+        graph = json.loads(views_helper.get_dashboard_graph(
+            user.user, str(document.uuid), 'emotions'))
+        self.assertEqual([len(trace['x']) for trace in graph['figure']['data']], [10] * 4)
+        client = Client()
+        client.force_login(user.user)
+        response = client.get(graph['range_url'], {'start': 5, 'end': 12})
+        traces = response.json()['traces']
+        self.assertEqual(len(traces), 4)
+        self.assertEqual(traces[0]['x'], list(range(4, 14)))
+
+        self.assertEqual(client.get(graph['range_url'], {'start': 5}).status_code, 400)
+        self.assertEqual(client.get(graph['range_url'], {'start': 5, 'end': 1}).status_code,
+                         400)
+        self.assertEqual(client.get(reverse('api_dashboard_graph_range', args=[
+            document.uuid, 'relationships']), {'start': 0, 'end': 1}).status_code, 404)
+        cache.clear_cache()
@@ -0,0 +1,430 @@
+"""Tests for the live feed, archives, bulk uploads and the housekeeping of stored files."""
+# pylint: disable=missing-function-docstring,missing-class-docstring
+import hashlib
+import io
+import json
+import os
+import tempfile
+import zipfile
+from datetime import timedelta
+from os.path import join as directory_path
+from django.conf import settings
+from django.core.management import call_command
+from django.db import transaction
+from django.test import TestCase, Client, override_settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.urls import reverse
+from django.utils import timezone
+from analyzer.models import (BulkIngestionJob, Document, FieldMapping, IngestionJob, NLPTask,
+                             Profile, SystemUser, UploadSession, User, Message, uuid_path)
+from analyzer.io import archive, bulk, feed, ingestion, preview, storage
+from analyzer.io.common import PendingRecord
+from analyzer.tests import VALID_FILE_DATA
+
+class FeedTestCase(TestCase):
+    def setUp(self):
+        self.client = Client()
+        SystemUser.objects.get_or_create(
+            user=User.objects.create_user(username='testuser', password='testpassword')
+        )
+        self.client.login(username='testuser', password='testpassword')
+        response = self.client.post(reverse('api_feed_document'), json.dumps({
+            'display_name': 'Live chat'
+        }), content_type='application/json').json()
+        self.document = Document.objects.get(uuid=response['document_id'])
+        self.feed_url = response['feed_url']
+
+    def tearDown(self):
+        PendingRecord(self.document).reject()
+
+    def post(self, messages):
+        # The save is written once the messages are committed.
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(self.feed_url, json.dumps({'messages': messages}),
+                                    content_type='application/json')
+
+    def test_save_is_not_written_if_batch_is_rolled_back(self):
+        batch = [{'sender': 'Mia', 'timestamp': '2024-01-01T10:00:00+00:00', 'body': 'Hi'}]
+        with self.captureOnCommitCallbacks(execute=True), self.assertRaises(RuntimeError), \
+                transaction.atomic():
+            feed.feed_messages(self.document, batch)
+            raise RuntimeError
+        self.assertFalse(Message.objects.filter(source=self.document).exists())
+        self.assertEqual(ingestion.count_save_rows(
+            ingestion.get_save_path(self.document.file.name)), 0)
+
+    def test_feed_inserts_and_analyses_batch(self):
+        batch = [{'sender': 'Mia', 'timestamp': '2024-01-01T10:00:00+00:00', 'body': 'Hi'},
+                 {'sender': 'Jamie', 'timestamp': '2024-01-01T10:00:05+00:00', 'body': 'Hey'}]
+        inserted = self.post(batch).json()['inserted']
+        self.assertEqual(len(inserted), 2)
+        tasks = NLPTask.objects.filter(message__source=self.document)
+        self.assertFalse(tasks.filter(completed_at=None).exists())
+        self.assertTrue(all(task.completed_at >= task.queued_at for task in tasks))
+
+        # A batch sent again is not inserted twice.
+        self.assertEqual(self.post(batch).json()['inserted'], [])
+        self.assertEqual(Message.objects.filter(source=self.document).count(), 2)
+        self.assertEqual(ingestion.count_save_rows(
+            ingestion.get_save_path(self.document.file.name)), 2)
+
+    def test_response_times(self):
+        self.post([{'sender': 'Mia', 'timestamp': '2024-01-01T10:00:00+00:00', 'body': 'Hi'},
+                   {'sender': 'Jamie', 'timestamp': '2024-01-01T10:05:00+00:00', 'body': 'Hey'}])
+        # A message which arrives late is dated between the others.
+        self.post([{'sender': 'Mia', 'timestamp': '2024-01-01T10:10:00+00:00', 'body': 'Well'},
+                   {'sender': 'Mia', 'timestamp': '2024-01-01T10:01:00+00:00', 'body': 'Late'}])
+        self.assertEqual(list(Message.objects.filter(source=self.document).order_by('date')
+                              .values_list('body', 'response_time')),
+                         [('Hi', None), ('Late', 60), ('Hey', 240), ('Well', 300)])
+
+    def test_empty_feed_can_be_viewed(self):
+        response = self.client.get(reverse('messages_view', args=[self.document.uuid]))
+        self.assertEqual(response.status_code, 200)
+
+    def test_feed_rejects_invalid_batch(self):
+        response = self.post([{'sender': 'Mia', 'body': 'No timestamp'}])
+        self.assertEqual(response.status_code, 400)
+        response = self.post([{'sender': 'Mia', 'timestamp': 'yesterday', 'body': 'Hi'}])
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Message.objects.filter(source=self.document).exists())
+
+    def test_benchmark_command(self):
+        output = io.StringIO()
+        call_command('benchmark_feed', user='testuser', messages=30, batch=10, stdout=output)
+        self.assertIn('Fed 30 messages', output.getvalue())
+        self.assertIn('Latency from arrival to NLP result', output.getvalue())
+        self.assertEqual(Document.objects.count(), 1)
+
+class IngestionSaveTestCase(TestCase):
+    ROWS = [{'name': 'Mia', 'body': f'Message {index}'} for index in range(5)]
+
+    def setUp(self):
+        self.path = directory_path(settings.MEDIA_ROOT, 'ingestion_saves', 'test_save.txt')
+
+    def tearDown(self):
+        os.unlink(self.path)
+
+    @override_settings(MEDIA_GZIP=False)
+    def test_save_is_json_lines(self):
+        ingestion.write_save(self.path, self.ROWS)
+        with open(self.path, encoding='utf8') as file:
+            self.assertEqual(file.readline(), '{"name":"Mia","body":"Message 0"}\n')
+        self.assertEqual(ingestion.read_save_range(self.path, 1, 3), self.ROWS[1:3])
+        self.assertEqual(ingestion.read_save_range(self.path, 4, 10), self.ROWS[4:])
+        self.assertEqual(ingestion.count_save_rows(self.path), 5)
+
+        self.assertEqual(ingestion.read_save(self.path), self.ROWS)
+        self.assertEqual(ingestion.append_save(self.path, [{'name': 'Jamie'}]), 5)
+        self.assertEqual(ingestion.read_save(self.path), self.ROWS + [{'name': 'Jamie'}])
+        self.assertEqual(list(ingestion.iter_save_rows(self.path, 5)), [{'name': 'Jamie'}])
+
+    @override_settings(MEDIA_GZIP=True)
+    def test_compressed_save(self):
+        ingestion.write_save(self.path, self.ROWS)
+        self.assertTrue(storage.is_compressed(self.path))
+        ingestion.append_save(self.path, [{'name': 'Jamie'}])
+        self.assertEqual(ingestion.read_save_range(self.path, 4, 6),
+                         [self.ROWS[4], {'name': 'Jamie'}])
+
+    def test_json_array_save_is_read(self):
+        with open(self.path, 'w', encoding='utf8') as file:
+            json.dump(self.ROWS, file, indent=4)
+        self.assertEqual(ingestion.read_save_range(self.path, 0, 2), self.ROWS[:2])
+        self.assertEqual(ingestion.append_save(self.path, [{'name': 'Jamie'}]), 5)
+        self.assertEqual(ingestion.count_save_rows(self.path), 6)
+
+class ArchiveTestCase(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.TemporaryDirectory() # pylint: disable=consider-using-with
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root.name)
+        self.settings_override.enable()
+        self.user = SystemUser.objects.create(
+            user=User.objects.create_user(username='testuser', password='testpassword'))
+        self.document = Document.objects.create(
+            file='uploaded_documents/old.txt', display_name='old.txt', owner=self.user,
+            accepted=True, is_ingestion_output=True,
+            last_accessed=timezone.now() - timedelta(days=400))
+        profile = Profile.objects.create(name='Jamie Smith', note='')
+        self.messages = [Message.objects.create(
+            date=f'2021-09-25T15:3{index}:00Z', body=f'Message {index}', source=self.document,
+            owner=profile, fingerprint=f'{index}') for index in range(3)]
+        NLPTask.objects.create(message=self.messages[0], result='{"risk": 0.5}',
+                               completed_at=timezone.now())
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.media_root.cleanup()
+
+    def test_archive_and_restore(self):
+        recent = Document.objects.create(file='uploaded_documents/recent.txt',
+                                         display_name='recent.txt', owner=self.user,
+                                         accepted=True, is_ingestion_output=True)
+        output = io.StringIO()
+        call_command('archive_documents', stdout=output)
+        self.assertIn('Archived 3 messages of 1 documents', output.getvalue())
+        self.assertIn('After: 0 messages, 0 NLP tasks', output.getvalue())
+
+        self.document.refresh_from_db()
+        self.assertIsNotNone(self.document.archived_at)
+        self.assertEqual(self.document.archive_summary['messages'], 3)
+        self.assertEqual(self.document.archive_summary['analysed'], 1)
+        self.assertEqual(self.document.archive_summary['senders'], {'Jamie Smith': 3})
+        self.assertTrue(os.path.exists(archive.get_archive_path(self.document)))
+        self.assertFalse(Message.objects.exists())
+        recent.refresh_from_db()
+        self.assertIsNone(recent.archived_at)
+
+        archive.open_document(self.document)
+        restored = list(Message.objects.filter(source=self.document).order_by('pk'))
+        self.assertEqual([message.pk for message in restored],
+                         [message.pk for message in self.messages])
+        self.assertEqual([message.fingerprint for message in restored], ['0', '1', '2'])
+        self.assertEqual(NLPTask.objects.get(message=restored[0]).result, '{"risk": 0.5}')
+        self.document.refresh_from_db()
+        self.assertIsNone(self.document.archived_at)
+        self.assertGreater(self.document.last_accessed, timezone.now() - timedelta(minutes=1))
+
+    def test_restore_recreates_deleted_profile(self):
+        archive.archive_document(self.document)
+        Profile.objects.all().delete()
+        self.assertTrue(archive.restore_document(self.document))
+        self.assertEqual(Message.objects.filter(source=self.document).count(), 3)
+        self.assertEqual(Message.objects.first().owner.name, 'Jamie Smith')
+        self.assertEqual(Message.objects.first().owner.statistics.message_count, 3)
+        self.assertFalse(archive.restore_document(self.document))
+
+class BulkUploadTestCase(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user, _ = SystemUser.objects.get_or_create(
+            user=User.objects.create_user(username='testuser', password='testpassword'))
+        self.client.login(username='testuser', password='testpassword')
+
+    def archive(self):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w') as zip_file:
+            zip_file.writestr('chats/first.csv', 'name,body,date\nAlice,Hi,2022-01-01\n'
+                             'Bob,Hello,2022-01-02')
+            zip_file.writestr('second.csv', 'name,text,date\nAlice,Bye,2022-01-03')
+            zip_file.writestr('notes.md', 'Not a conversation.')
+        return SimpleUploadedFile('chats.zip', buffer.getvalue())
+
+    def test_bulk_upload_with_saved_mapping(self):
+        FieldMapping.objects.create(owner=self.user, name='csv', mapping={
+            'sender': 'name', 'body': 'body', 'timestamp': 'date'
+        })
+        response = self.client.post(reverse('api_upload_bulk'), {
+            'file': self.archive(), 'mapping_name': 'csv'
+        })
+        self.assertTrue(response.json()['success'])
+        status = self.client.get(response.json()['status_url']).json()
+        self.assertEqual((status['phase'], status['files_done'], status['files_total']),
+                         ('done', 2, 2))
+        first, second = status['files']
+        self.assertEqual(first['file'], 'chats/first.csv')
+        self.assertEqual(first['messages'], 2)
+        self.assertFalse(second['success'])
+        self.assertIn('body', second['error'])
+
+        document = Document.objects.get(uuid=first['document'])
+        self.assertTrue(document.accepted)
+        self.assertEqual(list(Message.objects.filter(source=document).order_by('date')
+                              .values_list('body', flat=True)), ['Hi', 'Hello'])
+        self.assertEqual(Document.objects.count(), 1)
+        self.assertFalse(os.listdir(os.path.join(settings.MEDIA_ROOT, 'bulk_uploads')))
+        document.file.delete()
+
+    @override_settings(BULK_MAX_FILES=2)
+    def test_bulk_upload_refuses_large_archives(self):
+        response = self.client.post(reverse('api_upload_bulk'), {
+            'file': self.archive(), 'field_mapping': json.dumps([])
+        })
+        self.assertFalse(response.json()['success'])
+        self.assertIn('more than 2 files', response.json()['error'])
+        with (override_settings(BULK_MAX_FILES=10, BULK_MAX_BYTES=64),
+              zipfile.ZipFile(self.archive().file) as zip_file):
+            with self.assertRaises(bulk.BulkIngestionError):
+                bulk.check_archive(zip_file)
+        self.assertFalse(BulkIngestionJob.objects.exists())
+        self.assertFalse(Document.objects.exists())
+
+    def test_ingest_bulk_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with zipfile.ZipFile(self.archive().file) as zip_file:
+                zip_file.extractall(directory)
+            output = io.StringIO()
+            call_command('ingest_bulk', directory, user='testuser', workers=2, stdout=output,
+                         field_mapping=json.dumps({'sender': 'name', 'body': 'body',
+                                                   'timestamp': 'date'}))
+        self.assertIn('1/2 files ingested', output.getvalue())
+        Document.objects.get().file.delete()
+
+    def test_bulk_upload_unknown_mapping(self):
+        response = self.client.post(reverse('api_upload_bulk'), {
+            'file': self.archive(), 'mapping_name': 'missing'
+        })
+        self.assertFalse(response.json()['success'])
+        self.assertFalse(Document.objects.exists())
+
+class HousekeepingTestCase(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.TemporaryDirectory() # pylint: disable=consider-using-with
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root.name)
+        self.settings_override.enable()
+        for directory in ('uploaded_documents', 'ingestion_saves', 'upload_sessions'):
+            os.mkdir(os.path.join(self.media_root.name, directory))
+        self.user = SystemUser.objects.create(
+            user=User.objects.create_user(username='testuser', password='testpassword'))
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.media_root.cleanup()
+
+    def write_media(self, name, age_hours=0):
+        path = os.path.join(self.media_root.name, name)
+        with open(path, 'w', encoding='utf8') as file:
+            file.write(VALID_FILE_DATA)
+        modified = timezone.now().timestamp() - age_hours * 3600
+        os.utime(path, (modified, modified))
+        return path
+
+    def test_housekeeping(self):
+        old = timezone.now() - timedelta(days=2)
+        abandoned = Document(display_name='abandoned.txt', owner=self.user, last_accessed=old)
+        abandoned.file.name = uuid_path(abandoned, 'abandoned.txt')
+        abandoned.save()
+        abandoned_files = [self.write_media(abandoned.file.name),
+                           self.write_media(f'ingestion_saves/{abandoned.uuid}.txt')]
+        parsing = Document.objects.create(file='uploaded_documents/parsing.txt',
+                                          display_name='parsing.txt', owner=self.user,
+                                          last_accessed=old)
+        IngestionJob.objects.create(document=parsing, phase='parsing')
+        recent = Document.objects.create(file='uploaded_documents/recent.txt',
+                                         display_name='recent.txt', owner=self.user)
+        kept_file = self.write_media('uploaded_documents/recent.txt', age_hours=48)
+        orphan = self.write_media('ingestion_saves/orphan.txt', age_hours=48)
+        new_orphan = self.write_media('ingestion_saves/new_orphan.txt')
+
+        profile = Profile.objects.create(name='Mia', note='')
+        message = Message.objects.create(date='2021-09-25T15:36:30Z', body='Hi', source=recent,
+                                         owner=profile)
+        NLPTask.objects.create(message=message, queued_at=old)
+        session = UploadSession.objects.create(owner=self.user, display_name='big.txt',
+                                               total_size=10, chunk_size=5)
+        UploadSession.objects.filter(pk=session.pk).update(
+            updated=timezone.now() - timedelta(days=4))
+        self.write_media(f'upload_sessions/{session.uuid}.part')
+
+        output = io.StringIO()
+        call_command('housekeeping', stdout=output)
+        self.assertIn('pending documents: 1 removed', output.getvalue())
+        self.assertIn('stale NLP tasks: 1 removed', output.getvalue())
+        self.assertIn('stale upload sessions: 1 removed', output.getvalue())
+        self.assertIn('orphaned media files: 1 removed', output.getvalue())
+
+        self.assertFalse(Document.objects.filter(pk=abandoned.pk).exists())
+        self.assertFalse(any(os.path.exists(path) for path in abandoned_files))
+        self.assertTrue(Document.objects.filter(pk=parsing.pk).exists())
+        self.assertTrue(Document.objects.filter(pk=recent.pk).exists())
+        self.assertTrue(os.path.exists(kept_file))
+        self.assertFalse(os.path.exists(orphan))
+        self.assertTrue(os.path.exists(new_orphan))
+        self.assertFalse(NLPTask.objects.exists())
+        self.assertFalse(UploadSession.objects.exists())
+
+class StorageTestCase(TestCase):
+    @override_settings(INGESTION_BACKGROUND=False, MEDIA_GZIP=True)
+    def test_upload_is_compressed(self):
+        SystemUser.objects.create(
+            user=User.objects.create_user(username='testuser', password='testpassword'))
+        client = Client()
+        client.login(username='testuser', password='testpassword')
+        file = SimpleUploadedFile('compressed.txt', VALID_FILE_DATA.encode(), 'text/plain')
+        status = client.get(client.post(reverse('api_upload_file'),
+                                        {'file': file}).json()['status_url']).json()
+        self.assertEqual(status['preview'][0]['name'], 'Jamie Smith')
+
+        document = Document.objects.get(display_name='compressed.txt')
+        self.assertTrue(storage.is_compressed(document.file.path))
+        self.assertTrue(storage.is_compressed(ingestion.get_save_path(document.file.name)))
+        self.assertEqual(document.content_hash,
+                         hashlib.sha256(VALID_FILE_DATA.encode()).hexdigest())
+        with document.file.open() as stored:
+            self.assertEqual(stored.read(), VALID_FILE_DATA.encode())
+        document.file.delete()
+        os.unlink(ingestion.get_save_path(status['file_name']))
+
+    def test_compress_media_command(self):
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            os.mkdir(os.path.join(media_root, 'uploaded_documents'))
+            os.mkdir(os.path.join(media_root, 'ingestion_saves'))
+            original = os.path.join(media_root, 'uploaded_documents', 'old.txt')
+            docx = os.path.join(media_root, 'uploaded_documents', 'old.docx')
+            with open(original, 'w', encoding='utf8') as file:
+                file.write(VALID_FILE_DATA * 100)
+            with open(docx, 'wb') as file:
+                file.write(b'PK not compressed again')
+
+            output = io.StringIO()
+            call_command('compress_media', stdout=output)
+            self.assertIn('uploaded_documents: compressed 1 of 2 files', output.getvalue())
+            self.assertTrue(storage.is_compressed(original))
+            self.assertFalse(storage.is_compressed(docx))
+            self.assertEqual(storage.get_uncompressed_size(original), len(VALID_FILE_DATA) * 100)
+            with storage.open_stored(original, 'rt', encoding='utf8') as file:
+                self.assertEqual(file.read(), VALID_FILE_DATA * 100)
+
+            call_command('compress_media', '--decompress', stdout=io.StringIO())
+            self.assertFalse(storage.is_compressed(original))
+
+@override_settings(UPLOAD_PREVIEW_HEAD_ROWS=5, UPLOAD_PREVIEW_SAMPLE_ROWS=10)
+class PreviewTestCase(TestCase):
+    def setUp(self):
+        self.rows = [{'index': index, 'name': f'User {index % 3}',
+                      'timestamp': f'2024-01-01T00:00:{index % 60:02}',
+                      'note': '' if index % 2 else 'text'} for index in range(1000)]
+
+    def test_sample_rows(self):
+        for rows in (self.rows, iter(self.rows)):
+            sampled, total = preview.sample_rows(rows, 5, 10)
+            self.assertEqual(total, 1000)
+            self.assertEqual(len(sampled), 15)
+            indices = [row['index'] for row in sampled]
+            self.assertEqual(indices[:5], [0, 1, 2, 3, 4])
+            self.assertEqual(indices, sorted(set(indices)))
+
+        sampled, total = preview.sample_rows(self.rows[:8], 5, 10)
+        self.assertEqual((len(sampled), total), (8, 8))
+
+    def test_build_preview(self):
+        result = preview.build_preview(self.rows)
+        self.assertEqual(len(result['rows']), 15)
+        self.assertTrue(result['sampled'])
+        self.assertEqual(result['fields'], ['index', 'name', 'timestamp', 'note'])
+        self.assertEqual(result['field_stats']['index']['types'], {'number': 15})
+        self.assertEqual(result['field_stats']['timestamp']['types'], {'datetime': 15})
+        self.assertEqual(result['field_stats']['name']['fill_rate'], 1)
+        self.assertLess(result['field_stats']['note']['fill_rate'], 1)
+
+    @override_settings(INGESTION_BACKGROUND=False)
+    def test_upload_preview_is_bounded(self):
+        SystemUser.objects.create(
+            user=User.objects.create_user(username='testuser', password='testpassword'))
+        client = Client()
+        client.login(username='testuser', password='testpassword')
+        data = 'date,time,name,body\n' + '\n'.join(
+            f'2024-01-01,12:{index // 60 % 60:02}:{index % 60:02},User {index % 3},Message {index}'
+            for index in range(200))
+        file = SimpleUploadedFile('large.csv', data.encode(), 'text/csv')
+        status = client.get(client.post(reverse('api_upload_file'),
+                                        {'file': file}).json()['status_url']).json()
+
+        self.assertEqual(status['rows_parsed'], 200)
+        self.assertEqual(len(status['preview']), 15)
+        self.assertEqual(status['preview'][0]['body'], 'Message 0')
+        self.assertEqual(status['preview_fields'], ['date', 'time', 'name', 'body'])
+        self.assertEqual(status['field_stats']['body']['filled'], 15)
+        self.assertTrue(status['preview_sampled'])
+        self.assertTrue(status['preview_complete'])
+        Document.objects.get(display_name='large.csv').file.delete()
@@ -0,0 +1,337 @@
+"""Tests for the statistics, relations and search of messages."""
+# pylint: disable=missing-function-docstring,missing-class-docstring
+import io
+import json
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, Client
+from django.urls import reverse
+from analyzer.models import (Document, DocumentStatistics, NLPTask, Profile, ProfileRelation,
+                             ProfileStatistics, SystemUser, TopicMention, User, Message)
+from analyzer.io import dedup, relation, response_times, search, statistics, views_helper
+from analyzer.io.nlp import NLPTaskRecordManager
+from graph import downsample
+
+class ResponseTimesTestCase(TestCase):
+    def setUp(self):
+        self.user = SystemUser.objects.create(
+            user=User.objects.create_user(username='testuser', password='testpassword'))
+        self.document = Document.objects.create(
+            file='uploaded_documents/chat.txt', display_name='chat.txt', owner=self.user,
+            accepted=True, is_ingestion_output=True)
+        self.profile = Profile.objects.create(name='Mia', note='')
+
+    def test_backfill(self):
+        Message.objects.bulk_create([
+            Message(date=f'2024-01-01T12:{minute:02}:00Z', body=f'Message {minute}',
+                    source=self.document, owner=self.profile) for minute in (30, 0, 10, 10)])
+        output = io.StringIO()
+        call_command('backfill_response_times', stdout=output)
+        self.assertIn('Updated the response times of 3 messages', output.getvalue())
+        self.assertEqual(sorted(Message.objects.values_list('response_time', flat=True),
+                                key=lambda time: -1 if time is None else time),
+                         [None, 0, 600, 1200])
+        self.assertEqual(response_times.update_response_times(self.document.pk), 0)
+
+    def test_benchmark_command(self):
+        output = io.StringIO()
+        call_command('benchmark_response_times', user='testuser', messages=[50, 100], append=5,
+                     baseline=True, stdout=output)
+        self.assertIn('100 messages: computed every response time', output.getvalue())
+        self.assertIn('correlated subquery', output.getvalue())
+        self.assertEqual(Document.objects.count(), 1)
+        self.assertEqual(Profile.objects.count(), 1)
+
+class StatisticsTestCase(TestCase):
+    def setUp(self):
+        self.user = SystemUser.objects.create(
+            user=User.objects.create_user(username='testuser', password='testpassword'))
+        self.document = Document.objects.create(
+            file='uploaded_documents/chat.txt', display_name='chat.txt', owner=self.user,
+            accepted=True, is_ingestion_output=True)
+        self.profiles = [Profile.objects.create(name=name, note='') for name in ('Mia', 'Alex')]
+        self.messages = Message.objects.bulk_create([
+            Message(date=f'2024-01-01T12:0{index}:00Z', body=f'Message {index}',
+                    source=self.document, owner=self.profiles[index % 2])
+            for index in range(3)])
+        statistics.record_messages(self.messages)
+
+    def fulfill(self, message, risk, topics=()):
+        NLPTask.objects.get_or_create(message=message)
+        runner = NLPTaskRecordManager(message.pk)
+        runner.fulfill(runner.selector(), json.dumps({
+            'risk': risk, 'sentiment': 0.5, 'joy_extreme': 0.2, 'sad_extreme': 0,
+            'anger_extreme': 0, 'fear_extreme': 0,
+            'topics': [[keyword, 'LOC'] for keyword in topics]})).save()
+
+    def test_messages_are_counted(self):
+        document_statistics = DocumentStatistics.objects.get(document=self.document)
+        self.assertEqual(document_statistics.message_count, 3)
+        self.assertEqual(document_statistics.profile_count, 2)
+        self.assertEqual(document_statistics.get_average_messages_per_profile(), 1.5)
+        self.assertEqual(self.profiles[0].statistics.message_count, 2)
+        self.assertEqual(document_statistics.get_mean('risk'), 0)
+
+    def test_results_are_added_once(self):
+        for message, risk in zip(self.messages, (-1, 0.5, 0.9)):
+            self.fulfill(message, risk)
+        self.fulfill(self.messages[0], -1)
+        document_statistics = DocumentStatistics.objects.get(document=self.document)
+        self.assertEqual(document_statistics.analysed_count, 3)
+        self.assertAlmostEqual(document_statistics.get_mean('risk'), 0.4 / 3)
+        self.assertAlmostEqual(document_statistics.get_mean('joy'), 0.2)
+        self.assertEqual(document_statistics.risk_histogram[0], 1)
+        self.assertEqual(document_statistics.risk_histogram[statistics.get_bin(0.9)], 1)
+        self.assertEqual(sum(document_statistics.sentiment_histogram), 3)
+        self.assertAlmostEqual(views_helper.get_profile_risk_stat(self.profiles[0]), -0.05)
+        self.assertAlmostEqual(views_helper.get_profile_risk_stat(self.profiles[1]), 0.5)
+
+        output = io.StringIO()
+        call_command('rebuild_statistics', stdout=output)
+        self.assertIn('1 documents and 2 profiles', output.getvalue())
+        rebuilt = DocumentStatistics.objects.get(document=self.document)
+        self.assertEqual(rebuilt.message_count, 3)
+        self.assertEqual(rebuilt.profile_count, 2)
+        self.assertEqual(rebuilt.risk_histogram, document_statistics.risk_histogram)
+        self.assertAlmostEqual(rebuilt.risk_sum, document_statistics.risk_sum)
+
+    def test_reused_document_has_statistics(self):
+        self.fulfill(self.messages[0], 0.5)
+        copy = Document.objects.create(file='uploaded_documents/chat.txt',
+                                       display_name='copy.txt', owner=self.user)
+        dedup.reuse_document(copy, self.document)
+        copy_statistics = DocumentStatistics.objects.get(document=copy)
+        self.assertEqual(copy_statistics.message_count, 3)
+        self.assertEqual(copy_statistics.analysed_count, 1)
+        self.assertEqual(ProfileStatistics.objects.get(profile=self.profiles[0]).message_count, 4)
+
+    def test_topic_mentions(self):
+        self.fulfill(self.messages[0], 0, ['Glasgow', 'Glasgow'])
+        self.fulfill(self.messages[1], 0, ['Glasgow', 'Leith'])
+        self.fulfill(self.messages[2], 0, ['Glasgow'])
+        mentions = sorted(TopicMention.objects.values_list('keyword', 'profile__name',
+                                                           'message_count'))
+        self.assertEqual(mentions, [('Glasgow', 'Alex', 1), ('Glasgow', 'Mia', 2),
+                                    ('Leith', 'Alex', 1)])
+        self.assertEqual(statistics.get_shared_topics([self.document.pk]), [])
+
+        copy = Document.objects.create(file='uploaded_documents/chat.txt',
+                                       display_name='copy.txt', owner=self.user)
+        dedup.reuse_document(copy, self.document)
+        other = Document.objects.create(file='uploaded_documents/other.txt',
+                                        display_name='other.txt', owner=self.user)
+        shared = statistics.get_shared_topics([self.document.pk, other.pk, copy.pk])
+        self.assertEqual(sorted(shared), sorted(
+            (keyword, document, profile, count) for document in (self.document.pk, copy.pk)
+            for keyword, profile, count in mentions))
+
+        statistics.rebuild_statistics()
+        self.assertEqual(sorted(TopicMention.objects.filter(document=self.document)
+                                .values_list('keyword', 'profile__name', 'message_count')),
+                         mentions)
+
+    def test_profile_summary(self):
+        for message, risk in zip(self.messages, (-1, 0.5, 0.9)):
+            self.fulfill(message, risk)
+        Message.objects.filter(pk=self.messages[2].pk).update(date='2024-01-03T12:00:00Z')
+        statistics.rebuild_statistics()
+        summary = ProfileStatistics.objects.get(profile=self.profiles[0])
+        self.assertEqual(summary.document_ids, [str(self.document.pk)])
+        days, risks = statistics.get_risk_timeline(summary)
+        self.assertEqual(downsample.get_dates(days), ['2024-01-01', '2024-01-03'])
+        self.assertEqual(risks.tolist(), [-1, 0.9])
+
+        client = Client()
+        client.force_login(self.user.user)
+        response = client.get(reverse('profile', args=[self.profiles[0].pk]))
+        self.assertContains(response, 'chat.txt')
+        url = reverse('api_profile_risk_range', args=[self.profiles[0].pk])
+        response = client.get(url, {'start': '2024-01-02 06:00:00.5', 'end': '2024-01-04'})
+        self.assertEqual(response.json()['traces'], [
+            {'x': ['2024-01-01', '2024-01-03'], 'y': [-1, 0.9]}])
+        self.assertEqual(client.get(url, {'start': 5, 'end': 6}).status_code, 400)
+        self.assertEqual(client.get(url, {'start': '2024-01-04', 'end': '2024-01-02'})
+                         .status_code, 400)
+
+    def test_profile_without_messages(self):
+        profile = Profile.objects.create(name='Sam', note='')
+        self.assertEqual(views_helper.get_profile_risk_stat(profile), 0)
+
+class ProfileRelationTestCase(TestCase):
+    def setUp(self):
+        self.user = SystemUser.objects.create(
+            user=User.objects.create_user(username='testuser', password='testpassword'))
+        self.profiles = [Profile.objects.create(name=name, note='')
+                         for name in ('Mia', 'Alex', 'Sam')]
+
+    def insert(self, name, profiles):
+        document = Document.objects.create(file=f'uploaded_documents/{name}', display_name=name,
+                                           owner=self.user, accepted=True,
+                                           is_ingestion_output=True)
+        messages = Message.objects.bulk_create([
+            Message(date=f'2024-01-01T12:{index:02}:00Z', body=f'Message {index}',
+                    source=document, owner=profile) for index, profile in enumerate(profiles)])
+        statistics.record_messages(messages)
+        return document
+
+    def get_relations(self):
+        return sorted(ProfileRelation.objects.values_list(
+            'from_profile__name', 'to_profile__name', 'document_count'))
+
+    def test_relations_are_counted(self):
+        mia, alex, sam = self.profiles
+        first = self.insert('first.txt', [mia, alex, mia])
+        self.insert('second.txt', [mia, alex, sam])
+        # A profile is only related again once it sends its first message in a document.
+        statistics.record_messages(Message.objects.bulk_create([
+            Message(date='2024-01-02T12:00:00Z', body='Again', source=first, owner=alex)]))
+        relations = [('Alex', 'Mia', 2), ('Alex', 'Sam', 1), ('Mia', 'Alex', 2),
+                     ('Mia', 'Sam', 1), ('Sam', 'Alex', 1), ('Sam', 'Mia', 1)]
+        self.assertEqual(self.get_relations(), relations)
+        self.assertEqual([(related.to_profile.name, related.document_count)
+                          for related in relation.get_related_profiles(mia)],
+                         [('Alex', 2), ('Sam', 1)])
+
+        client = Client()
+        client.force_login(self.user.user)
+        response = client.get(reverse('profile', args=[mia.pk]))
+        self.assertContains(response, '2 shared documents')
+        self.assertEqual(self.get_relations(), relations)
+
+        statistics.rebuild_statistics()
+        self.assertEqual(self.get_relations(), relations)
+
+    def test_backfill(self):
+        mia, alex, sam = self.profiles
+        self.insert('first.txt', [mia, alex, sam])
+        ProfileRelation.objects.all().delete()
+        output = io.StringIO()
+        call_command('backfill_relations', stdout=output)
+        self.assertIn('Related 3 profiles by 3 relations', output.getvalue())
+        self.assertEqual(len(self.get_relations()), 6)
+
+class MessageSearchTestCase(TestCase):
+    def setUp(self):
+        self.user = SystemUser.objects.create(
+            user=User.objects.create_user(username='testuser', password='testpassword'))
+        self.mia = Profile.objects.create(name='Mia', note='')
+        self.alex = Profile.objects.create(name='Alex', note='')
+        self.document = self.insert('chat.txt', self.user, [
+            ('2024-01-01T12:00:00Z', self.mia, 'The café is closed today'),
+            ('2024-01-02T12:00:00Z', self.alex, 'Meet me at the cafe'),
+            ('2024-01-03T12:00:00Z', self.mia, 'Closed the deal at the <b>bank</b>'),
+            ('2024-01-04T12:00:00Z', self.alex, 'Banking hours are over, the cafe is closed'),
+        ])
+        self.client = Client()
+        self.client.force_login(self.user.user)
+
+    def insert(self, name, owner, messages):
+        document = Document.objects.create(file=f'uploaded_documents/{name}', display_name=name,
+                                           owner=owner, accepted=True, is_ingestion_output=True)
+        Message.objects.bulk_create([Message(date=date, body=body, source=document, owner=profile)
+                                     for date, profile, body in messages])
+        return document
+
+    def search(self, text, filters=None, **kwargs):
+        page = search.search_messages(self.user.user, text, filters, **kwargs)
+        return [result['id'] for result in page['results']]
+
+    def get_keys(self, *bodies):
+        return {Message.objects.get(body=body).pk for body in bodies}
+
+    def test_queries(self):
+        self.assertEqual(set(self.search('cafe')), self.get_keys(
+            'The café is closed today', 'Meet me at the cafe',
+            'Banking hours are over, the cafe is closed'))
+        self.assertEqual(set(self.search('"cafe is closed"')), self.get_keys(
+            'The café is closed today', 'Banking hours are over, the cafe is closed'))
+        self.assertEqual(set(self.search('bank*')), self.get_keys(
+            'Closed the deal at the <b>bank</b>', 'Banking hours are over, the cafe is closed'))
+        self.assertEqual(self.search('bank'), list(self.get_keys(
+            'Closed the deal at the <b>bank</b>')))
+        # FTS5 syntax is treated as words, rather than failing.
+        self.assertEqual(len(self.search('cafe) -"closed')), 2)
+        with self.assertRaises(ValueError):
+            self.search('" * "')
+
+    def test_filters(self):
+        self.assertEqual(set(self.search('cafe', search.SearchFilters(profile=self.alex.pk))),
+                         self.get_keys('Meet me at the cafe',
+                                       'Banking hours are over, the cafe is closed'))
+        start = datetime(2024, 1, 2, tzinfo=dt_timezone.utc)
+        filters = search.SearchFilters(start=start, end=start + timedelta(days=1))
+        self.assertEqual(set(self.search('cafe', filters)), self.get_keys('Meet me at the cafe'))
+        other = self.insert('other.txt', self.user, [
+            ('2024-01-01T12:00:00Z', self.mia, 'Another cafe')])
+        self.assertEqual(len(self.search('cafe')), 4)
+        self.assertEqual(set(self.search('cafe', search.SearchFilters(document=str(other.pk)))),
+                         self.get_keys('Another cafe'))
+
+    def test_ranked_pages(self):
+        self.insert('cafes.txt', self.user, [
+            ('2024-01-05T12:00:00Z', self.mia, 'cafe cafe cafe')])
+        page = search.search_messages(self.user.user, 'cafe', limit=2)
+        ranks = [result['rank'] for result in page['results']]
+        self.assertEqual(page['results'][0]['id'], Message.objects.get(body='cafe cafe cafe').pk)
+        keys = [result['id'] for result in page['results']]
+        while page['next'] is not None:
+            page = search.search_messages(self.user.user, 'cafe', after=page['next'], limit=2)
+            ranks.extend(result['rank'] for result in page['results'])
+            keys.extend(result['id'] for result in page['results'])
+        self.assertEqual(ranks, sorted(ranks))
+        self.assertEqual(sorted(keys), sorted(self.search('cafe')))
+        self.assertEqual(len(keys), 4)
+        with self.assertRaises(ValueError):
+            self.search('cafe', after='invalid')
+
+    def test_index_is_kept_in_sync(self):
+        message = Message.objects.get(body='Meet me at the cafe')
+        message.body = 'Meet me at the library'
+        message.save()
+        self.assertEqual(self.search('library'), [message.pk])
+        self.assertNotIn(message.pk, self.search('cafe'))
+        Message.objects.filter(owner=self.alex).delete()
+        self.assertEqual(self.search('library'), [])
+        search.rebuild_search_index()
+        self.assertEqual(len(self.search('cafe')), 1)
+
+    def test_index_waits_for_messages_table(self):
+        # post_migrate is sent for every app, also before the analyzer tables are created.
+        with mock.patch.object(connection.introspection, 'table_names', return_value=[]), \
+                self.assertNumQueries(0):
+            search.create_search_index()
+        search.create_search_index()
+
+    def test_documents_of_other_users_are_not_searched(self):
+        other = SystemUser.objects.create(
+            user=User.objects.create_user(username='other', password='testpassword'))
+        self.insert('other.txt', other, [('2024-01-01T12:00:00Z', self.mia, 'Secret cafe')])
+        self.assertEqual(len(self.search('cafe')), 3)
+        self.assertEqual(len(self.search('cafe', search.SearchFilters(profile=self.mia.pk))), 1)
+        Document.objects.filter(pk=self.document.pk).update(accepted=False)
+        self.assertEqual(self.search('cafe'), [])
+
+    def test_views(self):
+        response = self.client.get(reverse('api_message_search'),
+                                   {'q': 'bank', 'end': '2024-01-03'})
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0]['snippet'],
+                         'Closed the deal at the &lt;b&gt;<mark>bank</mark>&lt;/b&gt;')
+        self.assertEqual(results[0]['profile']['name'], 'Mia')
+        self.assertIsNone(response.json()['next'])
+        response = self.client.get(reverse('api_message_search'),
+                                   {'q': 'bank', 'end': '2024-01-02T23:00:00'})
+        self.assertEqual(response.json()['results'], [])
+        for parameters in ({'q': ''}, {'q': 'bank', 'start': 'yesterday'},
+                           {'q': 'bank', 'document': 'chat.txt'}, {'q': 'bank', 'after': '1'}):
+            response = self.client.get(reverse('api_message_search'), parameters)
+            self.assertEqual(response.status_code, 400)
+            self.assertFalse(response.json()['success'])
+
+        response = self.client.get(reverse('message_search'), {'q': 'closed', 'profile': 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '<mark>closed</mark>')
@@ -3,9 +3,8 @@
 from http import HTTPStatus
 import json
 import os
-import threading
+import zipfile
 import django
-from django.conf import settings
 from django.contrib.auth import authenticate, login as django_login, logout as django_logout
 from django.contrib.auth.decorators import login_required
 from django.core.exceptions import ValidationError
@@ -13,18 +12,25 @@ from django.shortcuts import get_object_or_404, redirect, render
 from django.views.decorators.csrf import csrf_protect
 from django.http import JsonResponse
 from django.urls import reverse
+from django.utils.html import format_html
 from django.contrib.auth.forms import PasswordChangeForm
 from django.contrib import messages
 from analyzer.forms import DocumentUploadForm, UserProfileForm
-from analyzer.io.common import PendingRecord, generic_openai_request, write_unhandled_error
+from analyzer.io.common import (PendingRecord, generic_openai_request, run_in_background,
+                                 write_unhandled_error)
+from analyzer.io import (append, archive, bulk, chunked_upload, dedup, ingestion, search)
+from analyzer.io.jobs import start_upload_job
 from analyzer.io.messages import get_messages_by_uuid, get_owned_documents, NIL_UUID
 from analyzer.io.nlp import (get_messages_nlp_progress, get_profile_from_topic,
-                             run_nlp_on_messages, wait_nlp_tasks)
-from analyzer.io.relation import set_profile_relation
-from analyzer.models import Document, Message, NLPTask, Profile, RecentActivity, SystemUser
+                             run_nlp_on_messages)
+from analyzer.io.relation import get_related_profiles
+from analyzer.models import (BulkIngestionJob, Document, FieldMapping, IngestionJob, Message,
+                             NLPTask, Profile, RecentActivity, SystemUser, UploadSession)
+from analyzer.api_views import get_search_filters
 from analyzer.io import views_helper
 from data_ingestion import file_handling
 from graph import plot
+from nlp.nlp import INTERACTIVE_PRIORITY
 
 def not_found(request, exception):
     '''Stub for not found page as redirect target.'''
@@ -68,17 +74,6 @@ def profile(request, profile_id):
     requester = SystemUser.objects.get(user=request.user)
 
     profile_data = get_object_or_404(Profile, pk=profile_id)
-    # Fetch documents where the profile has sent a message
-    associated_documents = Document.objects.filter(message__owner=profile_data).distinct()
-    average_risk = views_helper.get_profile_risk_stat(profile_data)
-    profile_risk_graph = plot.profile_risk_gauge(average_risk)
-
-    message_objs = Message.objects.filter(owner=profile_data)
-    nlp_results, _ = wait_nlp_tasks(message_objs)
-    populated_dict = plot.populate_nlp_dict(nlp_results)
-
-    message_risk_graph = plot.profile_risk_graph(populated_dict)
-    set_profile_relation(profile_data)
 
     if requester.query_tracking_enabled:
         user_activity = (RecentActivity.objects
@@ -87,52 +82,40 @@ def profile(request, profile_id):
 
     return render(request, 'profile.html', {
         'profile': profile_data,
-        'related_profiles': profile_data.related_profiles.all(),
-        'associated_documents': associated_documents,
-        'risk_graph': profile_risk_graph,
-        'message_risk_graph' : message_risk_graph,
-        'average_risk' : average_risk
-    })
+        'related_profiles': get_related_profiles(profile_data),
+    } | views_helper.get_profile_summary(profile_data))
 
 @login_required
 def upload(request):
     '''Returns the rendered file upload page.'''
     return render(request, 'upload.html', context={
         'form': DocumentUploadForm(),
+        'documents': get_owned_documents(request.user).order_by('display_name'),
         'show_error': False if not request.GET.get('error', False) else request.GET.get('error')
     })
 
 @login_required
 @csrf_protect
 def api_upload_file(request):
-    '''API endpoint for uploading files'''
+    '''API endpoint for uploading files, parsing continues in the background.'''
     if request.method == 'POST':
         form = DocumentUploadForm(request.POST, request.FILES)
         if form.is_valid():
-            try:
-                uploader = SystemUser.objects.get(user=request.user)
-                file_record = form.save(commit=False)
-                file_record.display_name = request.FILES['file'].name
-                file_record.owner = uploader
-                file_record.save()
-                processor = file_handling.FileProcessor(file_record.file.path)
-                processor.process()
-                if processor.is_valid():
-                    preview = processor.file.get_data()
-                    file_name = processor.file.save(uploader)
-                    return JsonResponse({
-                    "form": form.as_ul(), "preview": preview, "success":True, "file_name": file_name
-                    })
-                return JsonResponse({
-                    "success": False, "error": "Could not parse this file."
-                })
-            except file_handling.InvalidFileException:
+            if not file_handling.FileProcessor.is_supported(request.FILES['file'].name):
                 return JsonResponse({
                     "success": False,
                     "error": "Could not parse this file. Check that this is a valid file type."
-                 })
-
+                })
 
+            uploader = SystemUser.objects.get(user=request.user)
+            file_record = form.save(commit=False)
+            file_record.display_name = request.FILES['file'].name
+            file_record.owner = uploader
+            file_record.save()
+            return JsonResponse({
+                "form": form.as_ul(), "success": True,
+                **views_helper.start_upload(file_record)
+            })
 
         print(form.errors)
         return JsonResponse({
@@ -143,6 +126,175 @@ def api_upload_file(request):
         "error": "This endpoint only accepts POST requests.", "success":False
         })
 
+@login_required
+@csrf_protect
+def api_chunked_upload_start(request):
+    '''API endpoint for starting a chunked upload.'''
+    if request.method != 'POST':
+        return JsonResponse({
+            "error": "This endpoint only accepts POST requests.", "success":False
+        })
+    try:
+        data = json.loads(request.body)
+        file_name = os.path.basename(data['file_name'])
+        size = int(data['size'])
+    except (KeyError, TypeError, ValueError):
+        return JsonResponse({
+            "success": False, "error": "Your request is missing required fields."
+        })
+    if not file_handling.FileProcessor.is_supported(file_name):
+        return JsonResponse({
+            "success": False,
+            "error": "Could not parse this file. Check that this is a valid file type."
+        })
+    if size <= 0:
+        return JsonResponse({"success": False, "error": "The submitted file is empty."})
+
+    session = chunked_upload.start_session(
+        SystemUser.objects.get(user=request.user), file_name, size)
+    return JsonResponse({
+        "success": True, "upload_id": session.pk, "chunk_size": session.chunk_size,
+        "offset": session.received,
+        "upload_url": reverse('api_chunked_upload', args=[session.pk])
+    })
+
+@login_required
+@csrf_protect
+def api_chunked_upload(request, upload_id):
+    '''
+    API endpoint for a chunked upload. GET gives the acknowledged offset to resume from,
+    PUT appends the chunk in the body at the offset given by the X-Upload-Offset header.
+    '''
+    session = UploadSession.objects.filter(
+        pk=upload_id, owner__user=request.user).first()
+    if session is None:
+        return JsonResponse({
+            "success": False, "error": "This upload was not found."
+        }, status=HTTPStatus.NOT_FOUND)
+
+    if request.method == 'PUT':
+        try:
+            offset = int(request.headers['X-Upload-Offset'])
+            length = int(request.headers['Content-Length'])
+            chunked_upload.append_chunk(session, offset, length, request,
+                                        request.headers.get('X-Chunk-SHA256'))
+        except (KeyError, ValueError):
+            return JsonResponse({
+                "success": False, "error": "The chunk offset and length are required."
+            }, status=HTTPStatus.BAD_REQUEST)
+        except chunked_upload.ChunkError as e:
+            return JsonResponse({
+                "success": False, "error": str(e), "offset": session.received
+            }, status=HTTPStatus.CONFLICT)
+    elif request.method != 'GET':
+        return JsonResponse({
+            "error": "This endpoint only accepts GET and PUT requests.", "success":False
+        })
+
+    return JsonResponse({
+        "success": True, "offset": session.received, "chunk_size": session.chunk_size,
+        "total_size": session.total_size
+    })
+
+@login_required
+@csrf_protect
+def api_chunked_upload_complete(request, upload_id):
+    '''API endpoint for finishing a chunked upload, which is then parsed in the background.'''
+    if request.method != 'POST':
+        return JsonResponse({
+            "error": "This endpoint only accepts POST requests.", "success":False
+        })
+    session = UploadSession.objects.filter(
+        pk=upload_id, owner__user=request.user).first()
+    if session is None:
+        return JsonResponse({
+            "success": False, "error": "This upload was not found."
+        }, status=HTTPStatus.NOT_FOUND)
+    try:
+        document = chunked_upload.complete_session(session, json.loads(request.body)['checksum'])
+    except (KeyError, json.JSONDecodeError):
+        return JsonResponse({
+            "success": False, "error": "The checksum of the file is required."
+        })
+    except chunked_upload.ChunkError as e:
+        return JsonResponse({"success": False, "error": str(e), "offset": session.received})
+
+    return JsonResponse({"success": True, **views_helper.start_upload(document)})
+
+@login_required
+@csrf_protect
+def api_upload_reuse(request, document_id):
+    '''
+    API endpoint for answering the offer to reuse an identical document.
+    The upload either becomes a copy of the accepted document, or is parsed as usual.
+    '''
+    if request.method != 'POST':
+        return JsonResponse({
+            "error": "This endpoint only accepts POST requests.", "success":False
+        })
+    document = Document.objects.filter(
+        pk=document_id, owner__user=request.user, accepted=False).first()
+    if document is None:
+        return JsonResponse({
+            "success": False, "error": "This upload was not found."
+        }, status=HTTPStatus.NOT_FOUND)
+    try:
+        reuse = json.loads(request.body)["reuse"]
+    except (KeyError, json.JSONDecodeError):
+        return JsonResponse({"success": False, "error": "No choice was provided."})
+
+    original = dedup.get_reusable(document) if reuse else None
+    if original is None:
+        job = start_upload_job(document)
+        return JsonResponse({
+            "success": True, "job_id": job.pk,
+            "status_url": reverse('api_upload_status', args=[job.pk])
+        })
+
+    dedup.reuse_document(document, original)
+    return JsonResponse({
+        "success": True,
+        "message": format_html(
+            '''
+            Your file has been accepted using the analysis of {}.
+            <a href="{}">See it here</a>
+            ''',
+            original.display_name, reverse('messages_view', args=[document.uuid]))
+    })
+
+@login_required
+def api_upload_status(request, job_id):
+    '''API endpoint for the progress of a background upload.'''
+    requester = SystemUser.objects.get(user=request.user)
+    try:
+        job = IngestionJob.objects.select_related('document').get(pk=job_id)
+    except IngestionJob.DoesNotExist:
+        return JsonResponse({
+            "success": False, "error": "This upload was not found."
+        }, status=HTTPStatus.NOT_FOUND)
+    if not request.user.is_superuser and job.document.owner != requester:
+        return JsonResponse({
+            "success": False, "error": "You do not have permission to view this upload."
+        }, status=HTTPStatus.FORBIDDEN)
+
+    status = {
+        "success": job.phase != 'failed',
+        "phase": job.phase,
+        "rows_parsed": job.rows_parsed,
+        "preview_ready": job.preview_ready,
+    }
+    if job.phase == 'failed':
+        status["error"] = job.error
+    if job.preview_ready:
+        # The preview is bounded, only the head and a sample of the rows are sent.
+        status["file_name"] = job.file_name
+        status["preview"] = job.preview["rows"]
+        status["preview_fields"] = job.preview["fields"]
+        status["field_stats"] = job.preview["field_stats"]
+        status["preview_sampled"] = job.preview["sampled"]
+        status["preview_complete"] = job.preview["complete"]
+    return JsonResponse(status)
+
 @login_required
 @csrf_protect
 def api_accept_file(request):
@@ -152,29 +304,48 @@ def api_accept_file(request):
         try:
             request_data = json.loads(request.body)
             filename = request_data["file_name"]
-            uuid, ext = os.path.splitext(filename.split("/")[-1])
+            uuid, _ext = os.path.splitext(filename.split("/")[-1])
             record = PendingRecord(Document.objects.get(uuid=uuid))
-            path_parsed = os.path.join(settings.MEDIA_ROOT, 'ingestion_saves', uuid)
-            path_parsed += ext
-            parsed_file = views_helper.read_json_from_file(path_parsed)
+            parsed_file = ingestion.read_save(ingestion.get_save_path(filename))
             fields = views_helper.parse_field_mapping(request_data["field_mapping"])
-            views_helper.populate_message(uuid, fields, parsed_file)
-
-            record.accept()
-
-            # Get OpenAI data in the background, it will be saved and display when ready.
-            openai_request_thread = threading.Thread(
-                target=record.get_openai_data, args=(parsed_file,)
-            )
-            openai_request_thread.start()
+            if request_data.get("save_mapping_as"):
+                FieldMapping.objects.update_or_create(
+                    owner=SystemUser.objects.get(user=request.user),
+                    name=request_data["save_mapping_as"], defaults={"mapping": fields}
+                )
 
-            return_value = JsonResponse({
-                "success": True,
-                "message": f'''
-                    Your file has been accepted.
-                    <a href="{reverse('messages_view', args=[uuid])}">See it here</a>
-                '''
-            })
+            if request_data.get("append_to"):
+                # Only the new messages of a later export are added to the existing document.
+                target = Document.objects.get(uuid=request_data["append_to"],
+                                              owner__user=request.user, accepted=True)
+                new_messages = append.append_rows(target, fields, parsed_file)
+                record.reject()
+                target.refresh_from_db()
+                return_value = JsonResponse({
+                    "success": True,
+                    "file_name": target.file.name,
+                    "message": format_html(
+                        '''
+                        {} new messages were added to {}.
+                        <a href="{}">See it here</a>
+                        ''',
+                        len(new_messages), target.display_name,
+                        reverse('messages_view', args=[target.uuid]))
+                })
+            else:
+                views_helper.populate_message(uuid, fields, parsed_file)
+                record.accept()
+
+                # Get OpenAI data in the background, it will be saved and display when ready.
+                run_in_background(record.get_openai_data, parsed_file)
+
+                return_value = JsonResponse({
+                    "success": True,
+                    "message": f'''
+                        Your file has been accepted.
+                        <a href="{reverse('messages_view', args=[uuid])}">See it here</a>
+                    '''
+                })
 
         except KeyError:
             return_value =  JsonResponse({
@@ -211,6 +382,54 @@ def api_accept_file(request):
         "error": "This endpoint only accepts POST requests.", "success":False
     })
 
+@login_required
+@csrf_protect
+def api_upload_bulk(request):
+    '''
+    API endpoint for uploading a zip archive of conversations which share a field mapping.
+    The archive is ingested in the background, giving a job to poll for a report of each file.
+    '''
+    if request.method != 'POST':
+        return JsonResponse({
+            "error": "This endpoint only accepts POST requests.", "success": False
+        })
+
+    owner = SystemUser.objects.get(user=request.user)
+    archive_file = request.FILES.get("file")
+    try:
+        if archive_file is None or os.path.splitext(archive_file.name)[1].lower() != '.zip':
+            raise bulk.BulkIngestionError("Please upload a zip archive.")
+        job = bulk.start_bulk_job(owner, archive_file.chunks(),
+                                  bulk.get_field_mapping(owner, request.POST))
+    except zipfile.BadZipFile:
+        return JsonResponse({"success": False, "error": "This zip archive could not be read."})
+    except bulk.BulkIngestionError as e:
+        return JsonResponse({"success": False, "error": str(e)})
+
+    return JsonResponse({"success": True, "job_id": job.pk,
+                         "status_url": reverse('api_upload_bulk_status', args=[job.pk])})
+
+@login_required
+def api_upload_bulk_status(request, job_id):
+    '''API endpoint for the progress of a bulk upload, with a report for each file once done.'''
+    job = BulkIngestionJob.objects.filter(pk=job_id).first()
+    if job is None or not (request.user.is_superuser or job.owner.user == request.user):
+        return JsonResponse({
+            "success": False, "error": "This upload was not found."
+        }, status=HTTPStatus.NOT_FOUND)
+
+    status = {
+        "success": job.phase != 'failed',
+        "phase": job.phase,
+        "files_done": job.files_done,
+        "files_total": job.files_total,
+    }
+    if job.phase == 'failed':
+        status["error"] = job.error
+    if job.phase == 'done':
+        status["files"] = job.reports
+    return JsonResponse(status)
+
 @login_required
 @csrf_protect
 def api_reject_file(request):
@@ -257,7 +476,7 @@ def api_reject_file(request):
 def api_message(request, message_id):
     '''Returns the rendered message view page.'''
     message_obj = get_object_or_404(Message, pk=message_id)
-    run_nlp_on_messages([message_obj])
+    run_nlp_on_messages([message_obj], INTERACTIVE_PRIORITY)
 
     requester = SystemUser.objects.get(user=request.user)
     if not request.user.is_superuser and message_obj.source.owner != requester:
@@ -330,22 +549,16 @@ def signup(request):
 
 @login_required
 def dashboard(request):
-    '''Returns the dashboard page.'''
-
-    has_tasks_pending = False
+    '''Returns the dashboard page, its graphs are fetched separately by dashboard.js.'''
     selected_uuid = NIL_UUID
 
     if request.method == 'POST':
         selected_uuid = request.POST.get('selected_document')
+        if selected_uuid != NIL_UUID:
+            archive.open_document(get_object_or_404(
+                get_owned_documents(request.user), uuid=selected_uuid))
 
     messages_query = get_messages_by_uuid(request.user, selected_uuid)
-    graphs_desc_pair = views_helper.graph_logic(request.user, selected_uuid)
-    if graphs_desc_pair is None:
-        has_tasks_pending = True
-        graphs, description = plot.empty_graph_analysis(5)
-    else: graphs, description = graphs_desc_pair
-
-
 
     activities = RecentActivity.objects.filter(
     user=views_helper.get_user(request)).order_by('-activity_time')
@@ -370,16 +583,17 @@ def dashboard(request):
         'recent_profiles': Profile.objects.filter(pk__in=activities
             .exclude(profile=None)[:3].values_list('profile')),
         'recent_tracking_disabled': not views_helper.get_user(request).query_tracking_enabled,
-        'should_refresh': 'true' if has_tasks_pending else 'false',
         'initial_progress': get_messages_nlp_progress(messages_query),
         'documents': dropdown_documents,
         'selected': selected_document_name,
         'chatbot_documents': owned_documents,
         'document_id': owned_documents.first().uuid if owned_documents.exists() else None,
         'chatbot_show_document_list': len(owned_documents) > 1,
-        'hide_chatbot': not owned_documents.exists()
-    } | {f'graph_{i + 1}': graph[0] for i, graph in enumerate(graphs)}  |
-      {f'graph_{i +1}_meaning': meaning for i,meaning in enumerate(description)})
+        'hide_chatbot': not owned_documents.exists(),
+        'graph_urls': [reverse('api_dashboard_graph', args=[selected_uuid, name])
+                       for name in views_helper.get_dashboard_graphs(selected_uuid)],
+        'plotly_template': plot.get_template(),
+    })
 
 @login_required
 def logout(request):
@@ -413,27 +627,22 @@ def api_chatbot(request):
             if not file_name:
                 raise FileNotFoundError("The file you are trying to access does not exist.")
 
-            _, ext = os.path.splitext(file_name)
-            with open(os.path.join(
-                settings.MEDIA_ROOT, 'ingestion_saves', data['document_id'] + ext),
-                'r', encoding='utf8'
-            ) as f:
-                response = generic_openai_request(
-                    views_helper.chatbot_request,
-                    user_messages,
-                    f.read()
-                )
+            response = generic_openai_request(
+                views_helper.chatbot_request,
+                user_messages,
+                ingestion.read_save(ingestion.get_save_path(file_name))
+            )
 
-                response['content'] = response['content'].replace('```html', '').replace('```', '')
+            response['content'] = response['content'].replace('```html', '').replace('```', '')
 
-                if response:
-                    user_messages.append(response)
-                else:
-                    return JsonResponse({
-                        "error": "Unable to make this request. Please try again.", "success":False
-                    })
+            if response:
+                user_messages.append(response)
+            else:
+                return JsonResponse({
+                    "error": "Unable to make this request. Please try again.", "success":False
+                })
 
-                return JsonResponse({"messages": user_messages, "success":True})
+            return JsonResponse({"messages": user_messages, "success":True})
 
         except FileNotFoundError:
             error = "The file you are trying to access does not exist."
@@ -457,31 +666,25 @@ def messages_view(request, document_id):
     except(django.core.exceptions.ObjectDoesNotExist, django.core.exceptions.ValidationError):
         return redirect('unspecified_message')
 
+    if not request.user.is_superuser and document.owner != requester:
+        return redirect(f"{reverse('upload')}?error=noperms")
+
+    # Archived messages are restored as the document is opened.
+    archive.open_document(document)
+
     if requester.query_tracking_enabled:
         user_activity = RecentActivity.objects.get_or_create(user=requester, document=document)[0]
         user_activity.save()
 
     document_messages = Message.objects.filter(source=document).order_by('date')
 
-    first_message_owner = document_messages.first().owner
-
-    if not request.user.is_superuser and document.owner != requester:
-        return redirect(f"{reverse('upload')}?error=noperms")
+    # Documents fed over the API may not have any messages yet.
+    first_message = document_messages.first()
+    first_message_owner = first_message.owner if first_message else None
 
     # create risk and sentiment graphs
     openai_data = document.openai_data
-
-    if (openai_data and
-        openai_data.get('risk_score_messages') and
-        openai_data.get('sentiment_messages')):
-
-        sentiment_risk_graph = plot.get_graph_risk_and_sentiment({
-            'ID': [index for index, _ in enumerate(openai_data['risk_score_messages'])],
-            'Risk': openai_data['risk_score_messages'],
-            'Sentiment': openai_data['sentiment_messages']
-        })
-    else:
-        sentiment_risk_graph = None
+    sentiment_risk_graph = views_helper.get_sentiment_risk_graph(document)
 
     sorted_document_messages_by_risk = None
     if openai_data and openai_data.get('risk_score_messages'):
@@ -490,8 +693,6 @@ def messages_view(request, document_id):
             key=lambda x: x[1], reverse=True
         )
 
-    views_helper.delete_pending_documents(request)
-
     return render(request, 'messages_view.html', context={
         'chatbot_show_document_list': len(all_documents) > 1,
         'documents': all_documents,
@@ -540,6 +741,19 @@ def profile_search(request):
 
     return render(request, 'profile_search_results.html', {'profiles': profiles})
 
+@login_required
+def message_search(request):
+    '''Searches the bodies of the messages of the documents of the user.'''
+    context = {'query': request.GET.get('q', ''), 'filters': request.GET, 'results': None}
+    if context['query']:
+        try:
+            context.update(search.search_messages(request.user, context['query'],
+                                                  get_search_filters(request),
+                                                  request.GET.get('after')))
+        except ValueError as error:
+            context['error'] = str(error)
+    return render(request, 'message_search_results.html', context)
+
 @login_required
 def api_document_search(request):
     '''API endpoint for searching for documents.'''
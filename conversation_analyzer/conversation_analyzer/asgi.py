@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'conversation_analyzer.settings')
 
 application = get_asgi_application()
+
+# pylint: disable-next=wrong-import-position
+from analyzer.io.janitor import start_scheduler
+
+start_scheduler()
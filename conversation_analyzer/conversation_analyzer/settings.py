@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
 import os
+import sys
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -129,9 +130,122 @@ STATIC_URL = 'static/'
 MEDIA_ROOT = MEDIA_DIR
 MEDIA_URL = 'media/'
 
+STORAGES = {
+    'default': {'BACKEND': 'analyzer.io.storage.CompressedFileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 LOGIN_URL = 'login'
+
+# Data ingestion
+
+# Unstructured files are parsed by OpenAI in windows of roughly this many tokens,
+# consecutive windows share a few lines so that entries on a boundary are not lost.
+OPENAI_PARSE_WINDOW_TOKENS = 1500
+OPENAI_PARSE_OVERLAP_LINES = 2
+OPENAI_PARSE_WORKERS = 4
+
+# Whether the tests are running, background work is then done in the calling thread, as other
+# threads cannot write while a test holds the test database.
+TESTING = sys.argv[1:2] == ['test']
+
+# Uploads are parsed by this many background workers, set INGESTION_BACKGROUND to False
+# to parse within the upload request instead.
+INGESTION_WORKERS = 2
+INGESTION_BACKGROUND = not TESTING
+
+# The preview of an upload holds the first UPLOAD_PREVIEW_HEAD_ROWS rows and a random sample
+# of UPLOAD_PREVIEW_SAMPLE_ROWS of the rest, however large the file is.
+UPLOAD_PREVIEW_HEAD_ROWS = 20
+UPLOAD_PREVIEW_SAMPLE_ROWS = 30
+
+# Large files are uploaded in chunks of this many bytes, which can be resumed.
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+
+# Messages are inserted in batches of this size.
+MESSAGE_BATCH_SIZE = 500
+
+# Files ingested in bulk by manage.py ingest_bulk are parsed by a pool of this many processes,
+# bulk uploads are parsed by the background workers of uploads instead.
+BULK_INGESTION_WORKERS = os.cpu_count() or 2
+
+# Archives ingested in bulk are refused if they have more than BULK_MAX_FILES members, or would
+# take more than BULK_MAX_BYTES once extracted.
+BULK_MAX_FILES = 1000
+BULK_MAX_BYTES = 1024 * 1024 * 1024
+
+# The parsed rows of this many recently read ingestion saves are kept in memory.
+INGESTION_SAVE_CACHE_SIZE = 16
+
+# Uploaded originals and ingestion saves are compressed with gzip at this level when stored,
+# they are decompressed as they are read. Files stored either way can be read.
+MEDIA_GZIP = True
+MEDIA_GZIP_LEVEL = 6
+
+# The messages of documents which have not been opened for this many days are archived.
+ARCHIVE_AFTER_DAYS = 365
+
+# Housekeeping
+
+# Housekeeping runs in a background thread of the web server every JANITOR_INTERVAL seconds,
+# 0 turns it off, e.g. to run manage.py housekeeping from cron instead. Records are removed
+# in batches of JANITOR_BATCH_SIZE.
+JANITOR_INTERVAL = 15 * 60
+JANITOR_BATCH_SIZE = 100
+
+# Records are removed after these many hours: uploads which were not accepted, chunked uploads
+# which stopped receiving chunks, NLP tasks which never completed, and finished ingestion jobs.
+PENDING_DOCUMENT_MAX_AGE_HOURS = 24
+UPLOAD_SESSION_MAX_AGE_HOURS = 72
+NLP_TASK_TIMEOUT_HOURS = 1
+INGESTION_JOB_MAX_AGE_HOURS = 72
+
+# Files in the media store which no record refers to are removed once this many hours old.
+ORPHANED_MEDIA_MIN_AGE_HOURS = 24
+
+# NLP analysis
+
+# Queued messages are analysed by this many threads, each model predicts up to
+# NLP_BATCH_SIZE messages at once. With 0, messages are analysed as they are queued, as the
+# tests do. A message which fails is queued again up to NLP_MAX_ATTEMPTS times.
+NLP_WORKERS = 0 if TESTING else 4
+NLP_BATCH_SIZE = 32
+NLP_MAX_ATTEMPTS = 3
+
+# The statistics of documents and profiles hold histograms of risk and sentiment with this
+# many bins, see analyzer.io.statistics.
+STATISTICS_HISTOGRAM_BINS = 20
+
+# Rendered graphs are cached until their data changes, up to this many bytes in each process,
+# see graph.cache. 0 turns the cache off.
+GRAPH_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+# The graphs of the dashboard for every document are drawn from a snapshot of the documents,
+# snapshots of this many sets of documents are kept for the graphs requested after the first.
+DASHBOARD_SNAPSHOT_CACHE_SIZE = 4
+
+# The load times of the dashboard reported by browsers are kept for this many loads.
+DASHBOARD_METRICS_WINDOW = 1000
+
+# Nodes of network graphs are labelled if there are at most this many, otherwise their names
+# are shown on hover, see graph.network.
+NETWORK_LABEL_LIMIT = 200
+
+# Series of graphs over messages are downsampled to this many points, the full resolution of a
+# range is loaded as the graph is zoomed into, see graph.downsample.
+GRAPH_MAX_POINTS = 2000
+
+# Distributions in ridge plots are drawn from their density at this many points, estimated on
+# the server, see graph.distribution.
+DISTRIBUTION_POINTS = 200
+
+# The live feed accepts at most this many messages in a request.
+FEED_MAX_BATCH = 1000
+
+# Message searches give this many results in a page, see analyzer.io.search.
+SEARCH_PAGE_SIZE = 50
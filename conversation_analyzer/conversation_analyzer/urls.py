@@ -18,7 +18,7 @@ from django.conf import settings
 from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import path
-from analyzer import views
+from analyzer import views, api_views
 
 handler404 = 'analyzer.views.not_found'
 
@@ -41,15 +41,39 @@ urlpatterns = [
     path('api/upload-file', views.api_upload_file, name="api_upload_file"),
     path('api/upload-file/accept', views.api_accept_file, name="api_accept_file"),
     path('api/upload-file/reject', views.api_reject_file, name="api_reject_file"),
+    path('api/upload-file/reuse/<uuid:document_id>', views.api_upload_reuse,
+         name="api_upload_reuse"),
+    path('api/upload-file/bulk', views.api_upload_bulk, name="api_upload_bulk"),
+    path('api/upload-file/bulk/<uuid:job_id>', views.api_upload_bulk_status,
+         name="api_upload_bulk_status"),
+    path('api/upload-file/status/<uuid:job_id>', views.api_upload_status,
+         name="api_upload_status"),
+    path('api/upload-file/chunked', views.api_chunked_upload_start,
+         name="api_chunked_upload_start"),
+    path('api/upload-file/chunked/<uuid:upload_id>', views.api_chunked_upload,
+         name="api_chunked_upload"),
+    path('api/upload-file/chunked/<uuid:upload_id>/complete', views.api_chunked_upload_complete,
+         name="api_chunked_upload_complete"),
     path('api/message/<int:message_id>/', views.api_message, name='api_message'),
+    path('api/profile/<int:profile_id>/risk/range', api_views.api_profile_risk_range,
+         name='api_profile_risk_range'),
+    path('api/feed', api_views.api_feed_document, name='api_feed_document'),
+    path('api/feed/<uuid:document_id>', api_views.api_feed_messages, name='api_feed_messages'),
     path('api/login', views.api_login, name='api_login'),
     path('api/nlp-process', views.api_nlp_process, name='nlp_process'),
+    path('api/dashboard/<uuid:document_id>/<str:graph>', api_views.api_dashboard_graph,
+         name='api_dashboard_graph'),
+    path('api/dashboard/<uuid:document_id>/<str:graph>/range', api_views.api_dashboard_graph_range,
+         name='api_dashboard_graph_range'),
+    path('api/dashboard/metrics', api_views.api_dashboard_metrics, name='api_dashboard_metrics'),
     path('api/chatbot', views.api_chatbot, name='api_chatbot'),
     path('api/document-search', views.api_document_search, name='api_document_search'),
+    path('api/message-search', api_views.api_message_search, name='api_message_search'),
 
     path('admin/', admin.site.urls),
 
     path('update_query_tracking/', views.update_query_tracking, name='update_query_tracking'),
 
     path('profile_search/', views.profile_search, name='profile_search'),
+    path('message_search/', views.message_search, name='message_search'),
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'conversation_analyzer.settings')
 
 application = get_wsgi_application()
+
+# pylint: disable-next=wrong-import-position
+from analyzer.io.janitor import start_scheduler
+
+start_scheduler()
@@ -0,0 +1,148 @@
+'''Chunked, concurrent parsing of unstructured conversations using OpenAI.'''
+import copy
+import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import openai
+from django.conf import settings
+from analyzer.io import ingestion
+from analyzer.io.common import generic_openai_request
+
+CHARACTERS_PER_TOKEN = 4
+
+def estimate_tokens(text: str) -> int:
+    '''Roughly estimates the number of tokens in a string without a tokenizer.'''
+    return len(text) // CHARACTERS_PER_TOKEN + 1
+
+def split_windows(lines: list[str], token_budget: int, overlap: int) -> list[list[str]]:
+    '''
+    Splits lines into windows of at most token_budget tokens on line boundaries.
+    Consecutive windows share overlap lines, so entries at a boundary are seen whole.
+    A single line over the budget is given a window of its own.
+    '''
+    lines = [line for line in lines if line.strip()]
+    windows = []
+    start = 0
+    while start < len(lines):
+        end = start
+        used_tokens = 0
+        while end < len(lines):
+            line_tokens = estimate_tokens(lines[end])
+            if end > start and used_tokens + line_tokens > token_budget:
+                break
+            used_tokens += line_tokens
+            end += 1
+        windows.append(lines[start:end])
+        if end == len(lines):
+            break
+        start = max(end - overlap, start + 1)
+    return windows
+
+class WindowParseError(Exception):
+    '''Raised when windows of a file could not be parsed by OpenAI.'''
+
+def normalise(text: str) -> str:
+    '''Collapses whitespace and case, so text is compared as OpenAI may reformat it.'''
+    return ' '.join(str(text).split()).lower()
+
+def entry_key(entry: dict) -> tuple[str, str]:
+    '''Normalised sender and body of a parsed entry, used to match entries across windows.'''
+    body = entry.get('body', entry.get('message', ''))
+    if isinstance(body, dict):
+        body = body.get('raw_content', json.dumps(body, sort_keys=True))
+    return (normalise(entry.get('name', entry.get('username', ''))), normalise(body))
+
+def count_overlap_entries(entries: list[dict], overlap_lines: list[str]) -> int:
+    '''
+    Counts the entries at the head of a window which were parsed from its overlap lines, the
+    lines it shares with the previous window, by finding their bodies in those lines in order.
+    '''
+    text = normalise(' '.join(overlap_lines))
+    position = count = 0
+    for entry in entries:
+        body = entry_key(entry)[1]
+        found = text.find(body, position) if body else -1
+        if found < 0:
+            break
+        position = found + len(body)
+        count += 1
+    return count
+
+def overlap_length(previous: list[dict], entries: list[dict], max_overlap: int) -> int:
+    '''Gets the length of the longest tail of previous which is repeated at the head of entries.'''
+    previous_keys = [entry_key(entry) for entry in previous[len(previous) - max_overlap:]]
+    next_keys = [entry_key(entry) for entry in entries[:max_overlap]]
+    for length in range(min(len(previous_keys), len(next_keys)), 0, -1):
+        if previous_keys[-length:] == next_keys[:length]:
+            return length
+    return 0
+
+def stitch_windows(windows: list[list[str]], window_results: list[list[dict]],
+                   overlap: int) -> list[dict]:
+    '''
+    Joins the results of each window in order, dropping the entries parsed from the overlap
+    lines of a window which repeat the end of the previous one. Entries after the overlap are
+    always kept, so a message which is genuinely repeated is not lost.
+    '''
+    stitched: list[dict] = []
+    for index, (window, entries) in enumerate(zip(windows, window_results)):
+        if index == 0:
+            stitched.extend(entries)
+            continue
+        max_overlap = count_overlap_entries(entries, window[:overlap])
+        stitched.extend(entries[overlap_length(stitched, entries, max_overlap):])
+    return stitched
+
+
+class ChunkedAIParser:
+    '''Parses unstructured lines by sending token-budgeted windows to OpenAI concurrently.'''
+
+    def __init__(self, token_budget=None, overlap=None, workers=None):
+        self.token_budget = token_budget or settings.OPENAI_PARSE_WINDOW_TOKENS
+        self.overlap = settings.OPENAI_PARSE_OVERLAP_LINES if overlap is None else overlap
+        self.workers = workers or settings.OPENAI_PARSE_WORKERS
+        self.request_config = ingestion.get_openai_request_config()
+
+    def parse_window(self, window: list[str]) -> list[dict]:
+        '''Parses a single window, raises WindowParseError if the request cannot be made.'''
+        def openai_parse(window):
+            request = copy.deepcopy(self.request_config)
+            request['messages'].append({
+                'role': 'user',
+                'content': '\n'.join(window)
+            })
+            response = openai.ChatCompletion.create(**request)
+            parsed_data = json.loads(
+                response["choices"][0]["message"]["tool_calls"][0]["function"]["arguments"]
+            )
+            # Wrapped, as a failed request gives an empty list, as may an empty window.
+            return [parsed_data["conversation"]]
+
+        parsed = generic_openai_request(openai_parse, window)
+        if not parsed:
+            raise WindowParseError('OpenAI could not parse a part of this file.')
+        return parsed[0]
+
+    def parse(self, lines: list[str], progress=None) -> list[dict]:
+        '''
+        Parses all lines, the entries are returned in the order of the input.
+        progress is called with the number of entries parsed so far as windows complete.
+        Raises WindowParseError if any window could not be parsed, rather than leave a gap.
+        '''
+        windows = split_windows(lines, self.token_budget, self.overlap)
+        if not windows:
+            return []
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(windows))) as executor:
+            futures = [executor.submit(self.parse_window, window) for window in windows]
+            entries_parsed = 0
+            for future in as_completed(futures):
+                if future.exception() is None:
+                    entries_parsed += len(future.result())
+                if progress is not None:
+                    progress(entries_parsed)
+        failed = [index + 1 for index, future in enumerate(futures)
+                  if isinstance(future.exception(), WindowParseError)]
+        if failed:
+            raise WindowParseError(
+                f'OpenAI could not parse part{"s" if len(failed) > 1 else ""} '
+                f'{", ".join(map(str, failed))} of the {len(windows)} parts of this file.')
+        return stitch_windows(windows, [future.result() for future in futures], self.overlap)
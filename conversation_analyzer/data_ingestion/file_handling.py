@@ -1,15 +1,17 @@
 '''This module contains classes for reading and parsing files of various types'''
+import itertools
 import json
 import os
 import openai
 from docx import Document
 import xmltodict
 from dotenv import load_dotenv
-from analyzer.io import ingestion
-from analyzer.io.common import generic_openai_request
+from analyzer.io import ingestion, storage
+from data_ingestion.ai_parsing import ChunkedAIParser
 load_dotenv()
 
 openai.api_key = os.getenv("OPENAI_API_KEY")
+openai.api_base = os.getenv("OPENAI_API_BASE", openai.api_base)
 
 class File:
     '''Base class for all file types'''
@@ -18,6 +20,7 @@ class File:
         self.filename = filename
         self.data = []
         self.parsed_data = []
+        self.progress = None
 
     def get_data(self):
         '''Returns the parsed data if it exists, otherwise returns the raw data'''
@@ -33,13 +36,23 @@ class File:
     def save(self, uploading_user):
         '''Saves the file in the media store, returns its name in the media store.'''
         filename = os.path.basename(self.filename)
-        file, record = ingestion.get_saves_write_handle(f'{filename}.json', uploading_user)
-        media_store_name = file.name
-        with file:
-            file.write(json.dumps(self.get_data(), indent=4))
+        media_store_name, record = ingestion.get_save_record(f'{filename}.json', uploading_user)
+        ingestion.write_save(media_store_name, self.get_data())
         record.confirm()
         return media_store_name
 
+    def parse_head(self, limit): # pylint: disable=unused-argument
+        '''
+        Parses only the first entries of the file, for an early preview. Gives an empty list
+        if the type of file cannot be parsed without reading all of it.
+        '''
+        return []
+
+    def read_head_lines(self, limit):
+        '''Reads at most limit lines from the start of the file.'''
+        with storage.open_stored(self.filename, 'rt', encoding="utf-8") as f:
+            return [line.rstrip('\n') for line in itertools.islice(f, limit)]
+
 
 class UnstructuredTextBasedFile(File):
     '''Base class for unstructured text-based file types, e.g. TXT, DOCX'''
@@ -57,23 +70,29 @@ class UnstructuredTextBasedFile(File):
             return self.data[0]
         return None
 
+    @staticmethod
+    def parse_default_format(lines):
+        '''Parses lines in the format provided by SAS, raises ValueError for other formats'''
+        parsed_data = []
+        for line in lines:
+            date_time, message = line.split(',', 1)
+            date, time = date_time.split('T')
+            name, body = message.split(':', 1)
+
+            parsed_data.append({
+                "date": date.strip(),
+                "time": time.strip(),
+                "name": name.strip(),
+                "body": body.strip()
+            })
+        return parsed_data
+
     def parse(self):
         '''Parses the data in the file'''
         if self.default_formatting:
         # Parse the data using the format provided by SAS
             try:
-                self.parsed_data = []
-                for line in self.data:
-                    date_time, message = line.split(',', 1)
-                    date, time = date_time.split('T')
-                    name, body = message.split(':', 1)
-
-                    self.parsed_data.append({
-                        "date": date.strip(),
-                        "time": time.strip(),
-                        "name": name.strip(),
-                        "body": body.strip()
-                    })
+                self.parsed_data = self.parse_default_format(self.data)
             except ValueError:
                 # If the data is not in the format provided by SAS, use the AI to parse the data
                 self.__parse_using_ai()
@@ -82,55 +101,58 @@ class UnstructuredTextBasedFile(File):
             self.__parse_using_ai()
 
     def __parse_using_ai(self):
-        '''Parses the data using the AI'''
-        self.parsed_data = []
-        def openai_parse(parsed_data):
-            openai_request_data = ingestion.get_openai_request_config()
-
-            openai_request_data['messages'].append({
-                'role': 'user',
-                'content': '\n'.join(self.data)
-            })
-
-            response = openai.ChatCompletion.create(**openai_request_data)
-            parsed_data = json.loads(
-                response["choices"][0]["message"]["tool_calls"][0]["function"]["arguments"]
-            )
-            return parsed_data["conversation"]
-
-        self.parsed_data = generic_openai_request(openai_parse, self.parsed_data)
+        '''Parses the data using the AI, in windows that are sent concurrently'''
+        self.parsed_data = ChunkedAIParser().parse(self.data, self.progress)
 
 class TXTFile(UnstructuredTextBasedFile):
     '''Class for reading and parsing TXT files'''
 
     def read(self):
         '''Reads the data from the file'''
-        with open(self.filename, 'r', encoding="utf-8") as f:
+        with storage.open_stored(self.filename, 'rt', encoding="utf-8") as f:
             self.data = f.read().split('\n')
 
+    def parse_head(self, limit):
+        '''Parses the first lines, files which need to be parsed using the AI are skipped'''
+        if not self.default_formatting:
+            return []
+        try:
+            return self.parse_default_format(
+                [line for line in self.read_head_lines(limit) if line.strip()])
+        except ValueError:
+            return []
+
 
 class CSVFile(File):
     '''Class for reading and parsing CSV files'''
 
     def read(self):
         '''Reads the data from the file'''
-        with open(self.filename, 'r', encoding="utf-8") as f:
+        with storage.open_stored(self.filename, 'rt', encoding="utf-8") as f:
             self.data = f.read().split('\n')
 
+    @staticmethod
+    def parse_rows(lines):
+        '''Parses lines of the file, the first of which holds the column names'''
+        column_names = lines[0].split(',')
+        return [dict(zip(column_names, row.split(','))) for row in lines[1:]]
+
     def parse(self):
         '''Parses the data in the file'''
-        column_names = self.data[0].split(',')
+        self.parsed_data = self.parse_rows(self.data)
         self.data = self.data[1:]
-        self.parsed_data = []
-        for row in self.data:
-            self.parsed_data.append(dict(zip(column_names, row.split(','))))
+
+    def parse_head(self, limit):
+        '''Parses the first rows, after the column names'''
+        lines = self.read_head_lines(limit + 1)
+        return self.parse_rows(lines) if lines else []
 
 class SRTFile(File):
     '''Class for reading and parsing SRT files'''
 
     def read(self):
         '''Reads the data from the file'''
-        with open(self.filename, 'r', encoding="utf-8") as f:
+        with storage.open_stored(self.filename, 'rt', encoding="utf-8") as f:
             self.data = f.read().split('\n\n')
 
     def parse(self):
@@ -149,7 +171,7 @@ class JSONFile(File):
 
     def read(self):
         '''Reads the data from the file'''
-        with open(self.filename, 'r', encoding="utf-8") as f:
+        with storage.open_stored(self.filename, 'rt', encoding="utf-8") as f:
             self.data = f.read()
 
     def parse(self):
@@ -164,7 +186,7 @@ class XMLFile(File):
 
     def read(self):
         '''Reads the data from the file'''
-        with open(self.filename, 'r', encoding="utf-8") as f:
+        with storage.open_stored(self.filename, 'rt', encoding="utf-8") as f:
             self.data = f.read()
 
     def parse(self):
@@ -196,38 +218,50 @@ class InvalidFileException(Exception):
 
 class FileProcessor:
     '''Class for processing files of various types'''
-    def __init__(self, filename):
+    def __init__(self, filename, progress=None):
         self.filename = filename
         self.file = None
+        self.progress = progress
 
     def process(self):
         '''Processes the file and returns the file object'''
         self.file = self.get_file_object(self.filename)
+        self.file.progress = self.progress
         self.file.read()
         self.file.parse()
+        if self.progress is not None:
+            self.progress(len(self.file.get_data()))
         return self.file
 
+    def parse_head(self, limit):
+        '''Parses only the first entries of the file, without reading all of it.'''
+        return self.get_file_object(self.filename).parse_head(limit)
+
     def is_valid(self):
         """Checks if file has been parsed."""
         if self.file.get_data():
             return True
         return False
 
+    @staticmethod
+    def is_supported(filename):
+        '''Checks if the type of the file can be processed, from its extension.'''
+        return os.path.splitext(filename)[1] in FILE_TYPES
+
     def get_file_object(self, filename):
         '''Factory for creating File objects'''
         self.filename = f"{filename}"
         _, ext = os.path.splitext(self.filename)
 
-        if ext == '.csv':
-            return CSVFile(self.filename)
-        if ext == '.txt':
-            return TXTFile(self.filename)
-        if ext == '.docx':
-            return DOCXFile(self.filename)
-        if ext == '.json':
-            return JSONFile(self.filename)
-        if ext == '.xml':
-            return XMLFile(self.filename)
-        if ext == '.srt':
-            return SRTFile(self.filename)
-        raise InvalidFileException('Unsupported file type')
+        if ext not in FILE_TYPES:
+            raise InvalidFileException('Unsupported file type')
+        return FILE_TYPES[ext](self.filename)
+
+FILE_TYPES = {
+    '.csv': CSVFile,
+    '.txt': TXTFile,
+    '.docx': DOCXFile,
+    '.json': JSONFile,
+    '.xml': XMLFile,
+    '.srt': SRTFile,
+}
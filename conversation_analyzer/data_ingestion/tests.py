@@ -1,11 +1,16 @@
 '''Tests for data ingestion module.'''
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
 import os
+import threading
+
+import openai
 
 from django.conf import settings
 from django.test import TestCase
 from django.contrib.auth.models import User
 from analyzer.models import Document, SystemUser
-from data_ingestion import file_handling
+from data_ingestion import ai_parsing, file_handling
 
 ROOT_DIR = os.path.join(settings.BASE_DIR, 'data_ingestion')
 
@@ -14,7 +19,7 @@ class FileSaveTests(TestCase):
 
     def test_file_save_successful(self):
         '''Main function for testing'''
-        processor = file_handling.FileProcessor(f'{ROOT_DIR}/test/files/unformatted2.txt')
+        processor = file_handling.FileProcessor(f'{ROOT_DIR}/test/files/test.txt')
         file = processor.process()
         user = User.objects.get_or_create(username='testuser')[0]
         uploader = SystemUser.objects.get_or_create(user=user)[0]
@@ -22,7 +27,7 @@ class FileSaveTests(TestCase):
         common_path = os.path.commonpath((media_store_name, settings.MEDIA_ROOT))
         self.assertEqual(len(common_path), len(settings.MEDIA_ROOT))
         document = Document.objects.get(file=media_store_name)
-        self.assertEqual(document.display_name, 'unformatted2.txt.json')
+        self.assertEqual(document.display_name, 'test.txt.json')
 
 
 class FileProcessTests(TestCase):
@@ -89,9 +94,114 @@ class FileProcessTests(TestCase):
         self.assertEqual(processor.file.parsed_data[0]['time'], '00:00:01,000 --> 00:00:02,000')
         self.assertEqual(processor.file.parsed_data[1]['body'], 'Hello world!')
 
+    def test_parse_head(self):
+        '''Tests if only the first entries of line based files are parsed for a preview.'''
+        head = file_handling.FileProcessor(f'{ROOT_DIR}/test/files/test.csv').parse_head(2)
+        self.assertEqual([row['body'] for row in head], ['Hi', 'How are you today?'])
+        head = file_handling.FileProcessor(f'{ROOT_DIR}/test/files/test.txt').parse_head(2)
+        self.assertEqual(len(head), 2)
+        self.assertEqual(head[0]['name'], 'Danny')
+        self.assertEqual(file_handling.FileProcessor(
+            f'{ROOT_DIR}/test/files/test.json').parse_head(2), [])
+
     def test_unsupported(self):
         '''Tests if unsupported file is rejected correctly.'''
         processor = file_handling.FileProcessor(f'{ROOT_DIR}/test/files/test.pdf')
         with self.assertRaises(Exception) as context:
             processor.process()
         self.assertTrue('Unsupported file type' in str(context.exception))
+
+
+class StubOpenAIHandler(BaseHTTPRequestHandler):
+    '''Local stand-in for the chat completions endpoint, parses "name: body" lines.'''
+    requests_seen: list[list[str]] = []
+
+    def do_POST(self): # pylint: disable=invalid-name
+        '''Answers a chat completion request with a document_parser tool call.'''
+        request = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        lines = request['messages'][-1]['content'].split('\n')
+        StubOpenAIHandler.requests_seen.append(lines)
+        # Lines without a sender cannot be parsed, the arguments then have no conversation.
+        conversation = [
+            {'name': name.strip(), 'body': body.strip()}
+            for name, body in (line.split(':', 1) for line in lines if ':' in line)
+        ]
+        arguments = {'conversation': conversation} if len(conversation) == len(lines) else {}
+        body = json.dumps({
+            'id': 'stub', 'object': 'chat.completion',
+            'choices': [{'index': 0, 'finish_reason': 'tool_calls', 'message': {
+                'role': 'assistant', 'content': None,
+                'tool_calls': [{'id': 'call', 'type': 'function', 'function': {
+                    'name': 'document_parser',
+                    'arguments': json.dumps(arguments)
+                }}]
+            }}]
+        }).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args): # pylint: disable=redefined-builtin
+        '''Keeps the test output quiet.'''
+
+
+class ChunkedAIParsingTests(TestCase):
+    '''Checks windowing, stitching and concurrent parsing against a local stub endpoint.'''
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubOpenAIHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.previous_api = (openai.api_base, openai.api_key)
+        openai.api_base = f'http://127.0.0.1:{self.server.server_port}/v1'
+        openai.api_key = 'stub'
+        StubOpenAIHandler.requests_seen = []
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        openai.api_base, openai.api_key = self.previous_api
+
+    def test_windows_respect_budget(self):
+        '''Windows stay on line boundaries, within budget and overlap by the given lines.'''
+        lines = [f'Person {index}: {"word " * 10}' for index in range(50)]
+        windows = ai_parsing.split_windows(lines + [''], 60, 2)
+        self.assertGreater(len(windows), 1)
+        for window in windows:
+            self.assertLessEqual(sum(map(ai_parsing.estimate_tokens, window)), 60)
+        for previous, current in zip(windows, windows[1:]):
+            self.assertEqual(previous[-2:], current[:2])
+        self.assertEqual(windows[-1][-1], lines[-1])
+
+    def test_stitch_drops_overlap(self):
+        '''Entries repeated at the start of the next window are only kept once.'''
+        windows = [['A: one', 'B: two'], ['B: two', 'A: three']]
+        first = [{'name': 'A', 'body': 'one'}, {'name': 'B', 'body': 'two'}]
+        second = [{'name': 'b', 'body': ' two '}, {'name': 'A', 'body': 'three'}]
+        stitched = ai_parsing.stitch_windows(windows, [first, second], 1)
+        self.assertEqual([entry['body'] for entry in stitched], ['one', 'two', 'three'])
+
+    def test_stitch_keeps_repeated_messages(self):
+        '''Messages repeated after the overlap are kept, only the overlap lines are dropped.'''
+        windows = [['A: ok', 'A: ok', 'A: ok'], ['A: ok', 'A: ok', 'A: ok', 'A: ok']]
+        results = [[{'name': 'A', 'body': 'ok'}] * len(window) for window in windows]
+        self.assertEqual(len(ai_parsing.stitch_windows(windows, results, 2)), 5)
+
+    def test_failed_window_is_reported(self):
+        '''A window which OpenAI cannot parse fails the parse, rather than leaving a gap.'''
+        lines = [f'Person {index % 3}: message number {index}' for index in range(40)]
+        lines[20] = 'unparseable'
+        parser = ai_parsing.ChunkedAIParser(token_budget=40, overlap=1, workers=3)
+        with self.assertRaises(ai_parsing.WindowParseError) as context:
+            parser.parse(lines)
+        self.assertIn('could not parse part', str(context.exception))
+
+    def test_parse_against_stub(self):
+        '''Large input is split into several requests and stitched back in order.'''
+        lines = [f'Person {index % 3}: message number {index}' for index in range(40)]
+        parser = ai_parsing.ChunkedAIParser(token_budget=40, overlap=1, workers=3)
+        parsed = parser.parse(lines)
+        self.assertGreater(len(StubOpenAIHandler.requests_seen), 1)
+        self.assertEqual([entry['body'] for entry in parsed],
+                         [f'message number {index}' for index in range(40)])
@@ -0,0 +1,97 @@
+'''
+Cache of rendered graphs.
+
+Drawing a Plotly figure and rendering it to HTML is most of the work of the dashboard, profile
+and messages pages. Rendered graphs are kept by the name of the graph and the versions of the
+statistics of the documents or profiles they are drawn from, which are bumped whenever their
+messages or NLP results change, so a graph of unchanged data is only drawn once. At most
+GRAPH_CACHE_MAX_BYTES of rendered graphs are kept, the least recently used are evicted first.
+'''
+from collections import Counter, OrderedDict
+import hashlib
+import threading
+from typing import Any, Callable
+from django.conf import settings
+import numpy as np
+
+# Rendered graphs by key, with their size in bytes.
+_cache: OrderedDict[str, tuple[int, Any]] = OrderedDict()
+_cache_lock = threading.Lock()
+_stats: Counter[str] = Counter()
+
+def get_payload_size(payload) -> int:
+    '''Estimates the memory a rendered graph takes, from the length of its strings.'''
+    if isinstance(payload, str):
+        return len(payload)
+    if isinstance(payload, np.ndarray):
+        return payload.nbytes
+    if isinstance(payload, dict):
+        return sum(get_payload_size(key) + get_payload_size(value)
+                   for key, value in payload.items())
+    if isinstance(payload, (list, tuple)):
+        return sum(get_payload_size(item) for item in payload)
+    return 8
+
+def get_key(graph: str, versions) -> str:
+    '''Gets the key of a graph drawn from data of the given versions.'''
+    return f'{graph}:{hashlib.sha1(repr(versions).encode("utf8")).hexdigest()}'
+
+def get_rendered(key: str) -> tuple[bool, Any]:
+    '''Gets whether a graph is cached, and the graph if so.'''
+    with _cache_lock:
+        cached = _cache.get(key)
+        if cached is None:
+            _stats['misses'] += 1
+            return False, None
+        _stats['hits'] += 1
+        _cache.move_to_end(key)
+        return True, cached[1]
+
+def cache_rendered(key: str, payload):
+    '''Caches a rendered graph, evicting the least recently used graphs.'''
+    size = get_payload_size(payload)
+    if size > settings.GRAPH_CACHE_MAX_BYTES:
+        return
+    with _cache_lock:
+        if key in _cache:
+            _stats['bytes'] -= _cache.pop(key)[0]
+        _cache[key] = (size, payload)
+        _stats['bytes'] += size
+        while _stats['bytes'] > settings.GRAPH_CACHE_MAX_BYTES:
+            _stats['bytes'] -= _cache.popitem(last=False)[1][0]
+            _stats['evictions'] += 1
+
+def render_cached(graph: str, versions, render: Callable[[], Any],
+                  cacheable: Callable[[Any], bool] = lambda payload: payload is not None):
+    '''
+    Gets a rendered graph from the cache, or renders and caches it. versions identifies the
+    data it is drawn from, e.g. the versions of the statistics of a document. Nothing is
+    cached unless cacheable, by default if render gives None, e.g. as NLP results are pending.
+    '''
+    key = get_key(graph, versions)
+    found, payload = get_rendered(key)
+    if not found:
+        payload = render()
+        if cacheable(payload):
+            cache_rendered(key, payload)
+    return payload
+
+def get_cache_stats() -> dict:
+    '''Gets the number of hits, misses and evictions of the cache, and its size.'''
+    with _cache_lock:
+        lookups = _stats['hits'] + _stats['misses']
+        return {
+            'hits': _stats['hits'],
+            'misses': _stats['misses'],
+            'evictions': _stats['evictions'],
+            'hit_rate': _stats['hits'] / lookups if lookups else 0,
+            'entries': len(_cache),
+            'bytes': _stats['bytes'],
+            'max_bytes': settings.GRAPH_CACHE_MAX_BYTES,
+        }
+
+def clear_cache():
+    '''Removes every graph from the cache, and resets its statistics.'''
+    with _cache_lock:
+        _cache.clear()
+        _stats.clear()
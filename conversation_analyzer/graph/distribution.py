@@ -0,0 +1,119 @@
+'''
+Distributions of values, drawn as ridges of the ridge plots.
+
+Violin traces send every value to the browser, which estimates their density itself, so the
+size and drawing time of the graph grow with the number of messages. The density of the
+values is estimated here instead at DISTRIBUTION_POINTS points, with their quartiles and mean,
+and only these are sent. Values are binned first, so the estimate takes O(n) for n values, and
+distributions can be estimated from the histograms of the statistics of documents without
+reading their messages.
+'''
+import math
+from typing import NamedTuple
+from django.conf import settings
+import numpy as np
+import plotly.colors as plc
+import plotly.graph_objs as go
+
+class Distribution(NamedTuple):
+    '''Density of a set of values at points of a grid, with their quartiles, mean and number.'''
+    grid: np.ndarray
+    density: np.ndarray
+    quartiles: list[float]
+    mean: float
+    size: int
+
+    def get_summary(self) -> str:
+        '''Gets the count, quartiles and mean of the values as text.'''
+        first, median, third = self.quartiles
+        return (f'{self.size} values<br>Median {median:.2f}, mean {self.mean:.2f}<br>'
+                f'Quartiles {first:.2f} to {third:.2f}')
+
+def get_density(centers: np.ndarray, weights: np.ndarray, bandwidth: float,
+                grid: np.ndarray) -> np.ndarray:
+    '''Gets the Gaussian kernel density at grid of values at centers, each with a weight.'''
+    distances = (grid[None, :] - centers[:, None]) / bandwidth
+    density = weights @ np.exp(-0.5 * distances ** 2)
+    return density / (weights.sum() * bandwidth * math.sqrt(2 * math.pi))
+
+def get_bandwidth(deviation: float, spread: float, count: float, minimum: float) -> float:
+    '''
+    Gets the bandwidth of the density of count values with Silverman's rule, from their
+    standard deviation and interquartile range, at least minimum.
+    '''
+    scale = min(deviation, spread / 1.34) or deviation
+    return max(0.9 * scale * count ** -0.2, minimum)
+
+def get_distribution(values, points: int|None = None) -> Distribution:
+    '''Estimates the distribution of values, which must not be empty.'''
+    points = points or settings.DISTRIBUTION_POINTS
+    values = np.asarray(values, dtype=float)
+    quartiles = np.percentile(values, [25, 50, 75])
+    low, high = values.min(), values.max()
+    bandwidth = get_bandwidth(values.std(), quartiles[2] - quartiles[0], len(values),
+                              max(high - low, 1) / points)
+    low, high = low - 3 * bandwidth, high + 3 * bandwidth
+    counts, edges = np.histogram(values, bins=points, range=(low, high))
+    centers = (edges[:-1] + edges[1:]) / 2
+    return Distribution(centers, get_density(centers, counts.astype(float), bandwidth, centers),
+                        quartiles.tolist(), float(values.mean()), len(values))
+
+def get_histogram_distribution(counts, edges, mean: float|None = None,
+                               points: int|None = None) -> Distribution:
+    '''
+    Estimates the distribution of the values counted in a histogram with the given bin edges,
+    which must not be empty, over the range of the histogram. The mean is estimated from the
+    bins unless given.
+    '''
+    points = points or settings.DISTRIBUTION_POINTS
+    counts = np.asarray(counts, dtype=float)
+    edges = np.asarray(edges, dtype=float)
+    centers = (edges[:-1] + edges[1:]) / 2
+    total = counts.sum()
+    cumulative = np.concatenate(([0], np.cumsum(counts)))
+    quartiles = np.interp(np.array([0.25, 0.5, 0.75]) * total, cumulative, edges)
+    if mean is None:
+        mean = float(centers @ counts / total)
+    deviation = math.sqrt(max(float(counts @ (centers - mean) ** 2 / total), 0))
+    bandwidth = get_bandwidth(deviation, quartiles[2] - quartiles[0], total,
+                              (edges[1] - edges[0]) / 2)
+    grid = np.linspace(edges[0], edges[-1], points)
+    return Distribution(grid, get_density(centers, counts, bandwidth, grid),
+                        quartiles.tolist(), mean, int(total))
+
+def ridge_traces(distribution: Distribution, name: str, offset: float, color: str,
+                 height: float = 1.5) -> list:
+    '''
+    Creates the traces of a ridge of a ridge plot above offset on the y axis, the density
+    filled with its highest point height above offset, and the quartiles as a box on the
+    baseline with the median and mean marked. The summary is shown on hover.
+    '''
+    peak = distribution.density.max()
+    ridge = offset + distribution.density * (height / peak if peak > 0 else 0)
+    first, median, third = distribution.quartiles
+    summary = distribution.get_summary()
+    return [
+        go.Scatter(x=np.concatenate((distribution.grid, distribution.grid[::-1])).round(4),
+                   y=np.concatenate((ridge, np.full(len(ridge), offset))).round(4),
+                   fill='toself', mode='lines', line={'color': color, 'width': 1},
+                   name=name, legendgroup=name, hoveron='fills', hoverinfo='text+name',
+                   text=summary),
+        go.Scatter(x=[first, third], y=[offset, offset], mode='lines',
+                   line={'color': color, 'width': 6}, legendgroup=name, showlegend=False,
+                   hoverinfo='skip'),
+        go.Scatter(x=[median, distribution.mean], y=[offset, offset], mode='markers',
+                   marker={'color': ['white', 'black'], 'symbol': ['circle', 'line-ns-open'],
+                           'size': [7, 12], 'line': {'color': color, 'width': 1}},
+                   legendgroup=name, showlegend=False, hoverinfo='text+name', name=name,
+                   text=[f'Median {median:.2f}', f'Mean {distribution.mean:.2f}']),
+    ]
+
+def ridge_figure(distributions: list[tuple[str, Distribution]], colors=None) -> go.Figure:
+    '''Creates a ridge plot of named distributions, the first at the bottom.'''
+    colors = colors or plc.qualitative.Plotly
+    fig = go.Figure()
+    for index, (name, distribution) in enumerate(distributions):
+        fig.add_traces(ridge_traces(distribution, name, index, colors[index % len(colors)]))
+    fig.update_layout(yaxis={'showline': False, 'zeroline': False, 'showgrid': False,
+                             'showticklabels': False})
+    return fig
@@ -0,0 +1,93 @@
+'''
+Downsampling of long time series before they are drawn.
+
+A graph of every message of a large document holds hundreds of thousands of points, which are
+slow to send and to draw, while the graph is at most a few thousand pixels wide. Series are
+reduced to GRAPH_MAX_POINTS with largest-triangle-three-buckets, which keeps the points which
+change the shape of the line most, such as peaks, and the full resolution of a range is sent
+as the graph is zoomed into, see get_range. Series over days are downsampled with the days as
+proleptic Gregorian ordinals, see get_ordinal.
+'''
+from datetime import date, datetime
+from django.conf import settings
+import numpy as np
+
+def lttb(x: np.ndarray, y: np.ndarray, points: int) -> np.ndarray:
+    '''
+    Gets the indices of at most points points of a series which keep its shape, with
+    largest-triangle-three-buckets. x must be increasing. The first and last points are kept,
+    and from each bucket between them the point forming the largest triangle with the point
+    kept from the previous bucket and the mean of the next bucket.
+    '''
+    length = len(x)
+    if points >= length:
+        return np.arange(length)
+    if points < 3:
+        return np.array([0, length - 1][:points], dtype=int)
+    # Buckets of the points between the first and the last, as boundaries of indices.
+    bounds = np.linspace(1, length - 1, points - 1).astype(int)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    # Mean of each bucket, the last bucket is followed by the last point.
+    sums_x = np.add.reduceat(x[:length - 1], bounds[:-1])
+    sums_y = np.add.reduceat(y[:length - 1], bounds[:-1])
+    counts = np.diff(bounds)
+    means_x = np.append(sums_x / counts, x[-1])
+    means_y = np.append(sums_y / counts, y[-1])
+
+    return select_points(x, y, bounds, (means_x, means_y))
+
+def select_points(x: np.ndarray, y: np.ndarray, bounds: np.ndarray,
+                  means: tuple[np.ndarray, np.ndarray]) -> np.ndarray:
+    '''
+    Gets the indices of the first and last points, and of the point of each bucket between
+    bounds forming the largest triangle with the point kept from the previous bucket and the
+    means of the next bucket, see lttb.
+    '''
+    means_x, means_y = means
+    indices = np.empty(len(bounds) + 1, dtype=int)
+    indices[0], indices[-1] = 0, len(x) - 1
+    previous = 0
+    for bucket in range(len(bounds) - 1):
+        start, end = bounds[bucket], bounds[bucket + 1]
+        # Twice the area of the triangles between the previous point, each point of the bucket
+        # and the mean of the next bucket.
+        areas = np.abs((x[previous] - means_x[bucket + 1]) * (y[start:end] - y[previous])
+                       - (x[previous] - x[start:end]) * (means_y[bucket + 1] - y[previous]))
+        previous = start + int(np.argmax(areas))
+        indices[bucket + 1] = previous
+    return indices
+
+def downsample(x, y, points: int|None = None) -> tuple[np.ndarray, np.ndarray]:
+    '''
+    Reduces a series to at most points points, by default GRAPH_MAX_POINTS, with lttb.
+    Series which are short enough are given unchanged, as arrays.
+    '''
+    x = np.asarray(x)
+    y = np.asarray(y)
+    indices = lttb(x, y, settings.GRAPH_MAX_POINTS if points is None else points)
+    if len(indices) == len(x):
+        return x, y
+    return x[indices], y[indices]
+
+def get_range(x, y, start: float, end: float,
+              points: int|None = None) -> tuple[np.ndarray, np.ndarray]:
+    '''
+    Gets the points of a series between start and end on x, and the points either side so
+    that the line continues past the edges of the range, downsampled if still too many.
+    x must be increasing.
+    '''
+    x = np.asarray(x)
+    first = max(int(np.searchsorted(x, start, side='left')) - 1, 0)
+    last = min(int(np.searchsorted(x, end, side='right')) + 1, len(x))
+    return downsample(x[first:last], np.asarray(y)[first:last], points)
+
+def get_ordinal(value: str) -> float:
+    '''Gets an ISO date or date and time as a proleptic Gregorian ordinal, with the time.'''
+    moment = datetime.fromisoformat(value)
+    seconds = moment.hour * 3600 + moment.minute * 60 + moment.second + moment.microsecond / 1e6
+    return moment.toordinal() + seconds / 86400
+
+def get_dates(ordinals) -> list[str]:
+    '''Gets the ISO dates of days given as proleptic Gregorian ordinals.'''
+    return [date.fromordinal(int(day)).isoformat() for day in ordinals]
@@ -0,0 +1,164 @@
+'''
+NLP results of a set of messages in columns.
+
+Graphs are drawn from the results of every message of a document, or of every document, which
+as a list of parsed results takes around a kilobyte for each message. A ResultsFrame holds them
+as NumPy arrays instead, with the document, owner and topics of each message as integer codes
+into lists of the distinct values, which takes under a hundred bytes for each message.
+Aggregates over groups of messages are computed with bincount rather than in Python loops. The
+frame is read in one streamed query.
+'''
+from array import array
+import json
+from django.conf import settings
+import numpy as np
+from analyzer.io.statistics import SUMMED_FIELDS
+
+# Scores of the results, by the key of the NLP result they are read from, the fields the
+# statistics sum.
+SCORES = SUMMED_FIELDS
+
+class Codes:
+    '''Distinct values of a column, each coded by its index.'''
+
+    def __init__(self):
+        self.values = []
+        self.indices = {}
+
+    def get_code(self, value) -> int:
+        '''Gets the code of a value, coding it if it is new.'''
+        code = self.indices.get(value)
+        if code is None:
+            code = self.indices[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+# The columns of the frame are its attributes, grouping them would only rename them.
+# pylint: disable-next=too-many-instance-attributes
+class ResultsFrame:
+    '''
+    NLP results of messages in columns, in the order the messages were read. Results of
+    messages which are not analysed yet are NaN, see analysed. The topics mentioned in each
+    message are in two columns of their own, the row of the message and the code of the topic.
+    '''
+
+    def __init__(self):
+        self.message_ids = np.empty(0, dtype=np.int64)
+        self.documents = np.empty(0, dtype=np.int32)
+        self.owners = np.empty(0, dtype=np.int32)
+        self.response_times = np.empty(0)
+        self.scores = {name: np.empty(0) for name in SCORES}
+        self.analysed = np.empty(0, dtype=bool)
+        self.topic_rows = np.empty(0, dtype=np.int32)
+        self.topic_codes = np.empty(0, dtype=np.int32)
+        # Distinct keys of documents, names of owners, and topics as (keyword, concept).
+        self.document_values = []
+        self.owner_values = []
+        self.topic_values = []
+
+    def __len__(self):
+        return len(self.message_ids)
+
+    def is_pending(self) -> bool:
+        '''Gets whether the result of a message is not ready.'''
+        return not self.analysed.all()
+
+    def get_series(self) -> dict[str, np.ndarray]:
+        '''
+        Gets the series of the results of the analysed messages over them, with their ID from
+        1, by the names the graphs of a document use.
+        '''
+        return {'ID': np.arange(1, int(self.analysed.sum()) + 1)} | {
+            name.capitalize(): self.scores[name][self.analysed] for name in
+            ('joy', 'sad', 'anger', 'fear', 'sentiment', 'risk')}
+
+    def group_mean(self, score: str, by: str = 'owners') -> tuple[list, np.ndarray]:
+        '''
+        Gets the mean of a score of the analysed messages of each document or owner, by is
+        'documents' or 'owners'. Gives the groups with analysed messages, and their means.
+        '''
+        codes = getattr(self, by)[self.analysed]
+        values = getattr(self, f'{by[:-1]}_values')
+        counts = np.bincount(codes, minlength=len(values))
+        sums = np.bincount(codes, weights=self.scores[score][self.analysed],
+                           minlength=len(values))
+        present = np.flatnonzero(counts)
+        return [values[code] for code in present], sums[present] / counts[present]
+
+    def split(self, column: np.ndarray, by: str = 'documents') -> dict:
+        '''Splits a column by document or owner, by is 'documents' or 'owners', in row order.'''
+        codes = getattr(self, by)
+        values = getattr(self, f'{by[:-1]}_values')
+        order = np.argsort(codes, kind='stable')
+        bounds = np.searchsorted(codes[order], np.arange(len(values) + 1))
+        return {value: column[order[start:end]]
+                for value, start, end in zip(values, bounds[:-1], bounds[1:])}
+
+    def get_topic_pairs(self, by: str = 'owners') -> list[tuple]:
+        '''
+        Gets each document or owner with each topic it mentioned, by is 'documents' or
+        'owners'. Gives the distinct pairs in the order they were first mentioned, with the
+        number of mentions and the sum of their risk.
+        '''
+        values = getattr(self, f'{by[:-1]}_values')
+        topics = len(self.topic_values)
+        keys = getattr(self, by)[self.topic_rows].astype(np.int64) * topics + self.topic_codes
+        unique, first, inverse, counts = np.unique(keys, return_index=True, return_inverse=True,
+                                                   return_counts=True)
+        risks = np.bincount(inverse, weights=np.nan_to_num(self.scores['risk'][self.topic_rows]),
+                            minlength=len(unique))
+        order = np.argsort(first, kind='stable')
+        return [(values[key // topics], self.topic_values[key % topics], count, risk)
+                for key, count, risk in zip(unique[order].tolist(), counts[order].tolist(),
+                                            risks[order].tolist())]
+
+def read_columns(messages) -> tuple[dict[str, array], dict[str, array], dict[str, list]]:
+    '''
+    Reads the columns of a frame from messages in the order of the query, as arrays by the
+    name of the column, the scores by name, and the distinct values coded in the documents,
+    owners and topics columns.
+    '''
+    columns = {name: array(typecode) for name, typecode in (
+        ('message_ids', 'q'), ('documents', 'i'), ('owners', 'i'), ('response_times', 'd'),
+        ('analysed', 'b'), ('topic_rows', 'i'), ('topic_codes', 'i'))}
+    scores = {name: array('d') for name in SCORES}
+    codes = {name: Codes() for name in ('documents', 'owners', 'topics')}
+
+    for row, (pk, source, owner, response_time, result) in enumerate(
+            messages.values_list('pk', 'source_id', 'owner__name', 'response_time',
+                                 'nlptask__result')
+            .iterator(chunk_size=settings.MESSAGE_BATCH_SIZE)):
+        columns['message_ids'].append(pk)
+        columns['documents'].append(codes['documents'].get_code(source))
+        columns['owners'].append(codes['owners'].get_code(owner))
+        columns['response_times'].append(np.nan if response_time is None else response_time)
+        columns['analysed'].append(result is not None)
+        result = {} if result is None else json.loads(result)
+        for name, key in SCORES.items():
+            scores[name].append(result.get(key, np.nan))
+        for topic in result.get('topics', ()):
+            columns['topic_rows'].append(row)
+            columns['topic_codes'].append(codes['topics'].get_code(tuple(topic)))
+    return columns, scores, {name: column.values for name, column in codes.items()}
+
+def read_frame(messages) -> ResultsFrame:
+    '''
+    Reads the NLP results of messages into a frame, in the order of the query of messages,
+    or of their date if it is not ordered.
+    '''
+    if not messages.ordered:
+        messages = messages.order_by('date', 'pk')
+    columns, scores, values = read_columns(messages)
+    frame = ResultsFrame()
+    frame.message_ids = np.frombuffer(columns['message_ids'], dtype=np.int64)
+    frame.documents = np.frombuffer(columns['documents'], dtype=np.int32)
+    frame.owners = np.frombuffer(columns['owners'], dtype=np.int32)
+    frame.response_times = np.frombuffer(columns['response_times'])
+    frame.scores = {name: np.frombuffer(column) for name, column in scores.items()}
+    frame.analysed = np.frombuffer(columns['analysed'], dtype=np.int8).astype(bool)
+    frame.topic_rows = np.frombuffer(columns['topic_rows'], dtype=np.int32)
+    frame.topic_codes = np.frombuffer(columns['topic_codes'], dtype=np.int32)
+    frame.document_values = values['documents']
+    frame.owner_values = values['owners']
+    frame.topic_values = values['topics']
+    return frame
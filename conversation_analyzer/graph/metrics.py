@@ -0,0 +1,36 @@
+'''
+Load times of the dashboard.
+
+The browser reports how long the first graph of the dashboard took to be drawn, how long every
+graph took, and the size of the graphs it received. The last DASHBOARD_METRICS_WINDOW reports
+of this process are kept.
+'''
+from collections import deque
+import statistics
+import threading
+from django.conf import settings
+
+_loads: deque[dict] = deque()
+_loads_lock = threading.Lock()
+
+def record_load(time_to_first_graph: float, total_time: float, payload_bytes: int, graphs: int):
+    '''Records a load of the dashboard, times are in milliseconds since the page was opened.'''
+    with _loads_lock:
+        _loads.append({'time_to_first_graph': time_to_first_graph, 'total_time': total_time,
+                       'payload_bytes': payload_bytes, 'graphs': graphs})
+        while len(_loads) > settings.DASHBOARD_METRICS_WINDOW:
+            _loads.popleft()
+
+def get_load_stats() -> dict:
+    '''Gets the number of recorded loads of the dashboard, and the median of each measure.'''
+    with _loads_lock:
+        loads = list(_loads)
+    return {'loads': len(loads)} | {
+        measure: statistics.median(load[measure] for load in loads) if loads else 0
+        for measure in ('time_to_first_graph', 'total_time', 'payload_bytes')
+    }
+
+def clear_loads():
+    '''Removes every recorded load.'''
+    with _loads_lock:
+        _loads.clear()
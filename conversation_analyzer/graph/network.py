@@ -0,0 +1,151 @@
+'''
+Network graphs of two groups of nodes, e.g. profiles and the topics they mention.
+
+Every edge of a network is drawn in a single trace, with gaps between the segments, and
+duplicate edges are aggregated into one with a weight, so the size of a figure grows with the
+number of distinct edges rather than with the number of messages. Each group of nodes is laid
+out on a phyllotaxis spiral, the nodes with the heaviest edges in the middle, which is
+deterministic and takes O(n log n) for n nodes.
+'''
+from collections import defaultdict
+import math
+from django.conf import settings
+import numpy as np
+import plotly.graph_objs as go
+
+GOLDEN_ANGLE = math.pi * (3 - math.sqrt(5))
+
+class Network:
+    '''Weighted edges between the nodes of a left and a right group, with hover text.'''
+
+    def __init__(self):
+        self.weights = defaultdict(float)
+        self.texts = defaultdict(list)
+
+    def add_edge(self, left: str, right: str, weight: float = 1, text: str|None = None):
+        '''Adds an edge, adding its weight to an existing edge between the same nodes.'''
+        self.weights[(left, right)] += weight
+        if text is not None and text not in self.texts[(left, right)]:
+            self.texts[(left, right)].append(text)
+
+    def get_degrees(self) -> tuple[dict, dict]:
+        '''Gets the sum of the weights of the edges of each left and each right node.'''
+        degrees: tuple[defaultdict[str, float], defaultdict[str, float]] = (
+            defaultdict(float), defaultdict(float))
+        for (left, right), weight in self.weights.items():
+            degrees[0][left] += weight
+            degrees[1][right] += weight
+        return degrees
+
+def phyllotaxis_layout(count: int, center: tuple[float, float] = (0, 0)) -> np.ndarray:
+    '''
+    Gets count points spread evenly over a disc around center, each a unit from its
+    neighbours, the first in the middle. The disc grows with the square root of count.
+    '''
+    index = np.arange(count)
+    radius = np.sqrt(index + 0.5)
+    angle = index * GOLDEN_ANGLE
+    return np.column_stack((center[0] + radius * np.cos(angle),
+                            center[1] + radius * np.sin(angle)))
+
+def layout_nodes(degrees: dict) -> tuple[list[str], np.ndarray]:
+    '''
+    Orders the nodes of a group by descending degree, then name, and lays them out so that the
+    nodes with the heaviest edges are in the middle, the positions are centered on 0.
+    '''
+    nodes = sorted(degrees, key=lambda node: (-degrees[node], str(node)))
+    return nodes, phyllotaxis_layout(len(nodes))
+
+def get_edge_coordinates(sources: np.ndarray, targets: np.ndarray) -> np.ndarray:
+    '''
+    Gets the coordinates of segments between sources and targets in columns, separated by
+    NaN, which Plotly draws as gaps and sends as null. Float arrays are not copied item by item
+    as Plotly validates them, unlike lists holding None.
+    '''
+    coordinates = np.full((len(sources) * 3, 2), np.nan)
+    coordinates[0::3], coordinates[1::3] = sources, targets
+    return coordinates
+
+def node_trace(nodes: list[str], positions: np.ndarray, degrees: dict, color: str, labelled: bool):
+    '''Creates the trace of the nodes of a group, labelled unless there are too many.'''
+    return go.Scatter(
+        x=positions[:, 0], y=positions[:, 1],
+        text=nodes if labelled else None,
+        hovertext=[f'{node} ({degrees[node]:g})' for node in nodes],
+        mode='markers+text' if labelled else 'markers',
+        hoverinfo='text', textposition='top center', showlegend=False,
+        textfont={'size': 12, 'color': 'black'},
+        marker={'color': color, 'size': 10, 'line': {'width': 1, 'color': 'DarkSlateGrey'}},
+    )
+
+def layout_groups(left_degrees: dict, right_degrees: dict) -> tuple[
+        tuple[list[str], np.ndarray], tuple[list[str], np.ndarray]]:
+    '''
+    Lays out the left and right groups of nodes, see layout_nodes, each on a disc with a gap
+    between them, the left disc left of the right one.
+    '''
+    left_nodes, left_positions = layout_nodes(left_degrees)
+    right_nodes, right_positions = layout_nodes(right_degrees)
+    # Each disc has a radius of the square root of its node count, with a gap between them.
+    left_radius = math.sqrt(len(left_nodes) + 0.5)
+    right_radius = math.sqrt(len(right_nodes) + 0.5)
+    gap = max(left_radius, right_radius) / 2 + 2
+    left_positions[:, 0] -= left_radius + gap / 2
+    right_positions[:, 0] += right_radius + gap / 2
+    # Nodes are a unit apart, finer positions only make the figure larger.
+    return (left_nodes, left_positions.round(2)), (right_nodes, right_positions.round(2))
+
+def get_positions(nodes: list[str], positions: np.ndarray, ends) -> np.ndarray:
+    '''Gets the positions of the nodes at the ends of edges, from those of nodes.'''
+    index = {node: position for position, node in enumerate(nodes)}
+    return positions[[index[node] for node in ends]].reshape(-1, 2)
+
+def edge_traces(network: Network, sources: np.ndarray, targets: np.ndarray,
+                edge_label) -> list:
+    '''
+    Creates the trace of the edges of a network, from sources to targets in the order of its
+    weights, and the trace of their labels at their midpoints, sized by weight.
+    '''
+    edges = list(network.weights.items())
+    weights = np.array([weight for _, weight in edges], dtype=float)
+    segments = get_edge_coordinates(sources, targets)
+    midpoints = (sources + targets) / 2
+    sizes = (4 + 8 * np.sqrt(weights / weights.max())).round(1) if len(weights) else weights
+    return [
+        go.Scatter(x=segments[:, 0], y=segments[:, 1], mode='lines', hoverinfo='skip',
+                   showlegend=False, line={'width': 1, 'color': 'rgba(120, 120, 120, 0.5)'}),
+        go.Scatter(x=midpoints[:, 0], y=midpoints[:, 1], mode='markers', hoverinfo='text',
+                   hovertext=[edge_label(left, right, weight, network.texts[(left, right)])
+                              for (left, right), weight in edges],
+                   marker={'size': sizes, 'color': 'rgba(120, 120, 120, 0.6)'},
+                   showlegend=False),
+    ]
+
+def network_figure(network: Network, colors: tuple[str, str] = ('yellow', 'orange'),
+                   edge_label=lambda left, right, weight, texts: f'{left} - {right}: {weight:g}'):
+    '''
+    Creates the figure of a network, the left group of nodes left of the right group. The
+    edges are drawn in one trace, and their labels are shown on hover over their midpoints,
+    which are sized by the weight of the edge. Nodes are only labelled if there are at most
+    NETWORK_LABEL_LIMIT of them, otherwise their names are shown on hover.
+    '''
+    left_degrees, right_degrees = network.get_degrees()
+    (left_nodes, left_positions), (right_nodes, right_positions) = layout_groups(
+        left_degrees, right_degrees)
+    sources = get_positions(left_nodes, left_positions, [left for left, _ in network.weights])
+    targets = get_positions(right_nodes, right_positions,
+                            [right for _, right in network.weights])
+
+    labelled = len(left_nodes) + len(right_nodes) <= settings.NETWORK_LABEL_LIMIT
+    fig = go.Figure(edge_traces(network, sources, targets, edge_label) + [
+        node_trace(left_nodes, left_positions, left_degrees, colors[0], labelled),
+        node_trace(right_nodes, right_positions, right_degrees, colors[1], labelled),
+    ])
+    fig.update_layout(
+        showlegend=False,
+        hovermode='closest',
+        xaxis={'visible': False},
+        yaxis={'visible': False, 'scaleanchor': 'x'},
+        font_family='Roboto',
+    )
+    return fig
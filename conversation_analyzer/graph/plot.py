@@ -1,144 +1,128 @@
-'''Plotting functions using Plotly.'''
+'''
+Plotting functions using Plotly.
+
+Graphs of the dashboard give their figure with whether NLP results are pending, the figure is
+rendered as an HTML div with figure_to_div, or as JSON for the browser with graph_to_json.
+'''
+from collections import Counter
+from functools import lru_cache
+import json
 from plotly.offline import plot
-from analyzer.models import Message
-from graph import plot_helper
+from plotly.utils import PlotlyJSONEncoder
+from analyzer.io import statistics
+from graph import distribution, downsample, frame, network
 import plotly.graph_objs as go
 import plotly.colors as plc
+import plotly.io as pio
 import numpy as np
 
-def mapping_styles(marker_color):
-    '''Creates common style for mapping plots.'''
-    return {
-            'mode': 'markers+text', 'hoverinfo': 'none',
-            'textposition': 'top center', 'showlegend': False,
-            'textfont': {'size': 12, 'color': 'black'},
-            'marker': {'color': marker_color}
-        }
+def figure_to_div(fig):
+    '''Renders a figure as an HTML div, Plotly must be included in the page.'''
+    return plot(fig, include_plotlyjs=False, output_type='div')
 
-def select_random_coordinates(count, opposite):
+def graph_to_json(fig, description, pending, range_url=None):
     '''
-    Generates count number of random sparse coordinates in column form,
-    and negates them if opposite.
+    Renders a graph of the dashboard as compact JSON, with its description, whether NLP
+    results are pending, and the URL of its series for a range if it can be zoomed into. The
+    template is left out, it is sent with the page once.
     '''
-    sign_multiplier = 1 - int(opposite) * 2
-    chosen_coordinates = np.array([[sign_multiplier, sign_multiplier]])
-    while len(chosen_coordinates) < count:
-        random_coordinates = np.random.randint(10, size=2) * sign_multiplier
-        min_dists = np.linalg.norm(chosen_coordinates - random_coordinates, axis=1)
-        if np.min(min_dists) >= 2:
-            chosen_coordinates = np.append(chosen_coordinates, random_coordinates[None,:], axis=0)
-    return {
-        'x': chosen_coordinates[:, 0],
-        'y': chosen_coordinates[:, 1]
-    }
+    figure = fig.to_plotly_json()
+    figure['layout'].pop('template', None)
+    return json.dumps({'figure': figure, 'description': description, 'pending': pending,
+                       'range_url': range_url},
+                      cls=PlotlyJSONEncoder, separators=(',', ':'))
+
+@lru_cache(maxsize=1)
+def get_template():
+    '''Gets the default template of figures, for drawing graphs sent as JSON.'''
+    return json.loads(json.dumps(pio.templates[pio.templates.default].to_plotly_json(),
+                                 cls=PlotlyJSONEncoder))
 
 def relationship_graph(messages):
-    '''This function creates a network graph for Profile and topic relations'''
-    messages_in_doc, pending = plot_helper.get_owner_topic_risk_list(messages)
-    unique_owners = np.sort(np.array(list({message['owner'] for message in messages_in_doc})))
-    unique_topics = np.sort(np.array(list({message['topic'][0] for message in messages_in_doc})))
-    if pending:
-        return [empty_graph(), pending]
-
-    fig = go.Figure()
-
-    name_points = {'text': unique_owners} | select_random_coordinates(len(unique_owners), False)
-    topic_points = {'text': unique_topics} | select_random_coordinates(len(unique_topics), True)
-
-    for message in messages_in_doc:
-        name_coordinates_i = np.searchsorted(unique_owners, message['owner'])
-        topic_coordinates_i = np.searchsorted(unique_topics, message['topic'][0])
-        fig.add_trace(go.Scatter(
-            x=[name_points['x'][name_coordinates_i], topic_points['x'][topic_coordinates_i]],
-            y=[name_points['y'][name_coordinates_i], topic_points['y'][topic_coordinates_i]],
-            name=message['risk'],
-            mode='lines'
-        ))
+    '''
+    Creates a network graph of the profiles of a document and the topics they mention, each
+    edge weighted by the number of messages, with their average risk.
+    '''
+    results = frame.read_frame(messages)
+    if results.is_pending():
+        return [empty_graph(), True]
+
+    graph = network.Network()
+    risk_sums = Counter()
+    for owner, topic, count, risk_sum in results.get_topic_pairs('owners'):
+        graph.add_edge(owner, topic[0], weight=count)
+        risk_sums[(owner, topic[0])] += risk_sum
+
+    fig = network.network_figure(graph, edge_label=lambda owner, topic, count, _: (
+        f'{owner} mentioned {topic} in {count:g} messages, '
+        f'average risk {risk_sums[(owner, topic)] / count:.2f}'))
+    fig.update_layout(title='Mentioned Topics By Participants')
+    return [fig, False]
 
-    fig.add_trace(go.Scatter(**name_points, **mapping_styles('yellow')))
-    fig.add_trace(go.Scatter(**topic_points, **mapping_styles('orange')))
+def get_graph_risk_and_sentiment(dict_analysis):
+    '''This method renders the graphs for risks and sentiment'''
+    return figure_to_div(risk_and_sentiment_figure(dict_analysis))
 
-    fig.update_layout(
-        title='Mentioned Topics By Participants',
-        showlegend=False,
-        legend_title='Risk',
-        xaxis={'visible': False},
-        yaxis={'visible': False},
-        font_family ="Roboto"
-    )
-    return [plot(fig, include_plotlyjs=False, output_type='div'), pending]
+def series_trace(dict_analysis, series, **kwargs):
+    '''Creates a line of a series of dict_analysis over the messages, downsampled.'''
+    x, y = downsample.downsample(dict_analysis['ID'], dict_analysis[series])
+    return go.Scatter(x=x, y=y, mode='lines', **kwargs)
 
-def get_graph_risk_and_sentiment(dict_analysis):
+def risk_and_sentiment_figure(dict_analysis):
     '''This method creates the graphs for risks and sentiment'''
-    fig_scatter = go.Figure(go.Scatter(x=dict_analysis["ID"],
-                                       y=dict_analysis["Sentiment"],
-                                       mode='lines', name="Sentiment",
-                                       opacity=0.8, marker_color="green",
-                                       hovertemplate='%{y}'),)
-    fig_scatter.add_trace(go.Scatter(x=dict_analysis["ID"],
-                                     y=dict_analysis["Risk"],
-                                     mode='lines', name="Risk",
-                                     opacity=0.8, marker_color="red",
-                                     hovertemplate='%{y}'))
+    fig_scatter = go.Figure(series_trace(dict_analysis, 'Sentiment', name="Sentiment",
+                                         opacity=0.8, marker_color="green",
+                                         hovertemplate='%{y}'))
+    fig_scatter.add_trace(series_trace(dict_analysis, 'Risk', name="Risk",
+                                       opacity=0.8, marker_color="red",
+                                       hovertemplate='%{y}'))
     fig_scatter.update_layout(title="Sentiment And Risk Ratings Over Messages",
                               xaxis_title="Message ID",
                               yaxis_title="Rating",
                               font_family='Roboto')
-    return plot(fig_scatter, include_plotlyjs=False, output_type='div')
+    return fig_scatter
 
 def wassa_graphs(dict_analysis):
     '''Method creates a graph showing the change in emotions
       from the Text Regression on Emotional Presence'''
     fig = go.Figure()
     for emotion in ('Joy', 'Sad', 'Anger', 'Fear'):
-        fig.add_trace(go.Scatter(x=dict_analysis['ID'],
-                                 y=dict_analysis[emotion],
-                                 mode='lines',
-                                 name=emotion,
-                                 hovertemplate='%{y}'))
+        fig.add_trace(series_trace(dict_analysis, emotion, name=emotion,
+                                   hovertemplate='%{y}'))
     fig.update_layout(title='Emotions Over Messages',
                       xaxis_title='Message ID',
                       yaxis_title='Score',
                       font_family='Roboto')
-    return plot(fig, include_plotlyjs=False, output_type='div')
+    return fig
 
 def wassa_ridgeplot(dict_analysis):
     '''Creates a ridgeplot showing the distribution
     of WASSA emotions in the document'''
-    fig = go.Figure()
-    for emotion in ('Sad','Anger','Joy','Fear'):
-        fig.add_trace(go.Violin(x=dict_analysis[emotion],
-                      name=emotion,
-                      box_visible=True,
-                      meanline_visible=True))
-    fig.update_traces(orientation='h', side='positive',
-                      width = 3, points=False, hoverinfo='skip')
+    fig = distribution.ridge_figure([
+        (emotion, distribution.get_distribution(dict_analysis[emotion]))
+        for emotion in ('Sad', 'Anger', 'Joy', 'Fear') if len(dict_analysis[emotion]) > 0])
     fig.update_layout(title ="Emotion Distribution",
                       xaxis_showgrid=False,
                       xaxis_zeroline=False,
                       font_family='Roboto',
                       legend= {'x':0, 'y':-0.1,
                                'traceorder':'normal',
-                               'orientation':'h'},
-                      yaxis={'showline':False,
-                             'zeroline':False,
-                             'showgrid':False,
-                             'showticklabels':False})
-    return plot(fig, include_plotlyjs=False, output_type='div')
+                               'orientation':'h'})
+    return fig
 
-def populate_nlp_dict(messages):
-    '''This method populates a dictionary for Graphical Analysis'''
+def empty_graph():
+    '''This method creates an empty Graph'''
+    return go.Figure()
 
-    populated_dict = {"ID":[], "Joy":[], "Sad":[], "Anger":[], "Fear":[], "Sentiment":[], "Risk":[]}
-    for index, message in enumerate(messages):
-        populated_dict["ID"].append(index + 1)
-        populated_dict["Sad"].append(message["sad_extreme"])
-        populated_dict['Anger'].append(message["anger_extreme"])
-        populated_dict['Fear'].append(message["fear_extreme"])
-        populated_dict['Joy'].append(message["joy_extreme"])
-        populated_dict["Sentiment"].append(message["sentiment"])
-        populated_dict["Risk"].append(message["risk"])
-    return populated_dict
+def get_messages_series(messages):
+    '''
+    Gets the series of the NLP results of messages for Graphical Analysis, see
+    frame.ResultsFrame.get_series, and whether any of them are pending, in which case they are
+    empty.
+    '''
+    results = frame.read_frame(messages)
+    pending = results.is_pending()
+    return (frame.ResultsFrame() if pending else results).get_series(), pending
 
 def cluster_graph(dataframe):
     '''Plots words in clusters predicted by K-Means'''
@@ -163,66 +147,42 @@ def cluster_graph(dataframe):
         xaxis={"title": "Risk"},
         yaxis={"title": "Word Similarity"},
         legend={"title": "Legend"},font_family='Roboto')
-    return plot(fig, include_plotlyjs=False, output_type="div")
+    return figure_to_div(fig)
 
-def risk_dist(documents):
-    '''Creates a ridgeplot
-    of Risk for every document'''
-    doc_pend = False
-    checked_docs = [doc for doc in documents if
-                    check_has_messages(doc)]
-    all_doc_name_freq = []
-    risk_list = []
-    for doc in checked_docs:
-        message_risks_in_doc, doc_pend = plot_helper.get_doc_risk(doc)
-        if doc_pend:
-            return [empty_graph(), doc_pend]
-        risk_list.append(message_risks_in_doc)
-        all_doc_name_freq.append([doc.display_name
-                          ]*len(message_risks_in_doc))
-    fig = go.Figure()
+def risk_dist(snapshot):
+    '''Creates a ridgeplot of Risk for every document, from the
+    histograms of risk of their statistics'''
+    if snapshot.pending:
+        return [empty_graph(), True]
     colors = plc.n_colors('rgb(5, 200, 200)'
                           , 'rgb(200, 10, 10)',
-                          len(documents) + 1,
+                          len(snapshot.documents) + 1,
                           colortype='rgb')
-
-    for doc,mess_risk,color in zip(all_doc_name_freq,
-                                   risk_list,
-                                   colors):
-        if len(mess_risk)>0:
-            fig.add_trace(go.Violin(x=mess_risk,
-                      name=doc[0],
-                      line_color=color,
-                      box_visible=True,
-                      meanline_visible=True))
-
-    fig.update_traces(orientation='h', side='positive',
-                      width = 3, points=False, hoverinfo='skip')
+    edges = statistics.get_bin_edges()
+    distributions = [
+        (doc.name, distribution.get_histogram_distribution(
+            doc.statistics.risk_histogram, edges, doc.statistics.get_mean('risk')))
+        for doc in snapshot.get_documents_with_messages()
+        if doc.statistics.analysed_count > 0
+        and len(doc.statistics.risk_histogram) == len(edges) - 1]
+
+    fig = distribution.ridge_figure(distributions, colors)
     fig.update_layout(title ="Document Risk Distribution",
                       xaxis_showgrid=False,
                       xaxis_zeroline=False,
                       legend= {'x':0, 'y':-0.1,
                                'traceorder':'normal',
                                'orientation':'h'},
-                      yaxis={'showline':False,
-                             'zeroline':False,
-                             'showgrid':False,
-                             'showticklabels':False},font_family='Roboto')
-    return [plot(fig, include_plotlyjs=False, output_type='div'), doc_pend]
+                      font_family='Roboto')
+    return [fig, False]
 
-def document_topics_graph(documents):
+def document_topics_graph(snapshot):
     '''Displays each topic mentioned
     in Each Document grouped by Document'''
-    doc_pending = False
-    checked_docs = [doc for doc
-            in documents
-            if check_has_messages(doc)]
-    doc_topics = {}
-    for doc in checked_docs:
-        doc_topic, doc_pending = plot_helper.get_doc_topics(doc)
-        doc_topics[doc.display_name] = doc_topic
-        if doc_pending:
-            return [empty_graph(), doc_pending]
+    if snapshot.pending:
+        return [empty_graph(), True]
+    doc_topics = {doc.name: list(dict.fromkeys(doc.topics))
+                  for doc in snapshot.get_documents_with_messages()}
     fig = go.Figure()
     colors = [f'rgb({np.random.randint(0, 255)},'
               f'{np.random.randint(0, 255)},'
@@ -244,7 +204,7 @@ def document_topics_graph(documents):
             text=words,
             marker={'size':7, 'color':colors[index]},
             name=document,
-            hoverinfo='text',font_family='Roboto'
+            hoverinfo='text'
         ))
 
     fig.update_layout(
@@ -255,38 +215,17 @@ def document_topics_graph(documents):
                'showgrid':False, 'showticklabels':False},
         yaxis={'showline':False, 'zeroline':False,
             'showgrid':False, 'showticklabels':False},font_family='Roboto')
-    return [plot(fig, include_plotlyjs=False, output_type='div'), doc_pending]
-
-def populate_nlp_lists(docs):
-    '''This method populates the lists
-    for the bar graphs'''
-    sent = []
-    profile_risk = []
-    risk = []
-    pending = False
-    for doc in docs:
-        docs_sent, sent_pend = plot_helper.get_doc_sentiment(doc)
-        prof_risk, risk_pend = plot_helper.get_profiles_in_doc(doc)
-        doc_risk, doc_risk_pend = plot_helper.get_doc_risk(doc)
-        sent.extend(docs_sent)
-        profile_risk.extend(prof_risk)
-        risk.extend(doc_risk)
-        if sent_pend or risk_pend or doc_risk_pend:
-            pending = True
-    return sent, profile_risk, risk, pending
-
-def bar_graph(documents):
+    return [fig, False]
+
+def bar_graph(snapshot):
     '''Creates a bar plot for
     Avg Risk for Profiles, Messages
-    for each document'''
-    checked_docs = [doc for doc in documents
-            if check_has_messages(doc)]
-    doc_names = [doc.display_name for doc in checked_docs]
-    sent, profile_risk,risk, pending = populate_nlp_lists(checked_docs)
-    if pending:
-        return [empty_graph(), pending]
-
-    arrays = [sent, profile_risk, risk]
+    for each document, from their statistics'''
+    checked_docs = snapshot.get_documents_with_messages()
+    doc_names = [doc.name for doc in checked_docs]
+    arrays = [[round(doc.statistics.get_mean('sentiment'), 2) for doc in checked_docs],
+              [round(doc.get_average_profile_risk(), 2) for doc in checked_docs],
+              [round(doc.statistics.get_mean('risk'), 2) for doc in checked_docs]]
     trace_names = ['Average Message Sentiment', 'Average Profile Risk',
                    'Average Message Risk']
     traces = []
@@ -301,22 +240,17 @@ def bar_graph(documents):
                        xaxis={'title':'Document Names'},font_family='Roboto')
     fig = go.Figure(data=traces, layout=layout)
 
-    return [plot(fig, include_plotlyjs=False, output_type='div'),pending]
+    return [fig, snapshot.pending]
 
-def profile_bar_graph(documents):
+def profile_bar_graph(snapshot):
     '''Creates a bar graph showing the number
     of messages per document, number of profiles per document,
-    and the average number of messages per document'''
-    checked_docs = [doc for doc in documents if
-                    check_has_messages(doc)]
-    doc_names = [doc.display_name for doc in checked_docs]
-    docs_message_num = []
-    docs_profile_num = []
-    docs_avg_message = []
-    for doc in checked_docs:
-        docs_message_num.extend([plot_helper.get_number_of_messages(doc)])
-        docs_profile_num.extend([plot_helper.get_number_of_profiles(doc)])
-        docs_avg_message.extend([plot_helper.get_profile_avg_message(doc)])
+    and the average number of messages per document, from their statistics'''
+    checked_docs = snapshot.get_documents_with_messages()
+    doc_names = [doc.name for doc in checked_docs]
+    docs_message_num = [doc.get_message_count() for doc in checked_docs]
+    docs_profile_num = [doc.get_profile_count() for doc in checked_docs]
+    docs_avg_message = [doc.get_average_messages_per_profile() for doc in checked_docs]
     arrays = [docs_message_num, docs_profile_num, docs_avg_message]
     trace_names = ['Number of Messages', "Number of Profiles", "Number of Messages per Profile"]
     traces = []
@@ -328,252 +262,73 @@ def profile_bar_graph(documents):
                        xaxis={'title':'Document Names'},font_family='Roboto')
     fig = go.Figure(data=traces, layout=layout)
 
-    return [plot(fig, include_plotlyjs=False, output_type='div'),False]
+    return [fig, False]
 
-def response_time_dist(documents):
-    '''Creates a violin plot
+def response_time_dist(snapshot):
+    '''Creates a ridgeplot
     of message response time for
     each document'''
-    time_diff = [plot_helper.doc_time_diff(
-        document) for document in documents]
-    docs = []
-    for index, element in enumerate(time_diff):
-        docs.append([documents[index].display_name]
-                    *len(element))
-    fig = go.Figure()
+    documents = list(snapshot.documents.values())
     colors = plc.n_colors('rgb(5, 200, 200)',
                           'rgb(200, 10, 10)',
-                          len(docs) + 1, colortype='rgb')
-    for doc,response,color in zip(docs,
-                                   time_diff, colors):
-        if len(response)>0:
-            fig.add_trace(go.Violin(x=response,
-                      name=doc[0],
-                      line_color=color,
-                      box_visible=True,
-                      meanline_visible=True))
-
-    fig.update_traces(orientation='h', side='positive',
-                      width = 3, points=False, hoverinfo='skip')
+                          len(documents) + 1, colortype='rgb')
+    fig = distribution.ridge_figure([
+        (doc.name, distribution.get_distribution(doc.response_times))
+        for doc in documents if len(doc.response_times) > 0], colors)
     fig.update_layout(
         title="Response Time Distribution",
         xaxis_title="Response Times (Minutes)",
-        yaxis={'showline':False, 'zeroline':False,
-               'showgrid':False, 'showticklabels':False},
         legend={'x':0, 'y':-0.4},font_family='Roboto')
-    return [plot(fig, include_plotlyjs=False, output_type='div'), False]
-
-def all_doc_analysis(doc, messages):
-    '''This method returns
-    all the graphs relevant for all
-    document analysis'''
-    bar_description = ("If the sentiment or risk is lower for "
-                       "a document than others, it indicates potential "
-                       "antisocial behavior in the messages.")
-    response_time_description = ("If the distribution is skewed towards "
-                                 "lower values, it indicates potential urgency in the "
-                                 "conversation")
-    risk_dist_description = ("If the distribution of the ridgeplot is skewed"
-                             " to the left then it indicates potential antisocial"
-                             " behavior in the messages.")
-    profile_bar_description = ("If a document has two participants and a lot "
-                               "of messages it might indicate that one participant"
-                               " is trying to manipulate the other.")
-    common_topics_description = ("If documents share the same topic and"
-                                 " the same profiles it indicates that the"
-                                 " documents are related.")
-    return [bar_graph(doc), response_time_dist(doc),
-             risk_dist(doc), profile_bar_graph(doc),
-            common_topics(messages)], [bar_description,
-                                       response_time_description,
-                                       risk_dist_description,
-                                       profile_bar_description,
-                                       common_topics_description]
-
-def check_has_messages(doc):
-    '''this method checks if a document
-    has associated messages'''
-    return Message.objects.filter(source=doc).exists()
-
-def empty_graph():
-    '''This method creates an empty Graph'''
-    fig = go.Figure()
-    return plot(fig, include_plotlyjs=False, output_type='div')
+    return [fig, False]
 
-def empty_graph_analysis(num_of_graphs):
-    '''This method populates a list of empty
-    graphs'''
-    return [[empty_graph(),False] for i in range(num_of_graphs)],[
-        "" for i in range(num_of_graphs)
-    ]
-
-def singular_doc_analysis(messages, doc_nlp):
-    '''This method returns all the graphs relevant
-    for singular document graphs'''
-    sent_and_risk_description = ("If a point on the graph has a low y value"
-                                 " it has a negative risk or sentiment which "
-                                 "indicates the message contains potential"
-                                 " antisocial behavior.")
-    wassa_description = ("If the function of a emotion is close to"
-                         " 1 there is a high likely hood that emotion"
-                         " is present in that message.")
-    wassa_ridge_description = ("If the distribution of the emotion is"
-                               " skewed to values close to 1 it means "
-                               "that emotion is present often in the conversation")
-    profile_bar_description = ("If a profile has a low number for risk it means"
-                               " the profile has the worst risk and potentially"
-                               " conducting antisocial behavior")
-    relationship_description = ("If a person is mapped to a topic it "
-                                "indicates the spoke about it in a message and shows the "
-                                "relation the speaker has to the topic")
-    return [[get_graph_risk_and_sentiment(doc_nlp), False],
-            [wassa_graphs(doc_nlp), False],
-            [wassa_ridgeplot(doc_nlp), False],
-            profile_risk_bar_graph(messages),
-            relationship_graph(messages)], [sent_and_risk_description,
-                                            wassa_description,
-                                            wassa_ridge_description,
-                                            profile_bar_description,
-                                            relationship_description]
-
-def profile_risk_graph(dict_analysis):
-    '''Method creates a graph showing the average risk for profiles'''
+def profile_risk_graph(days, risks):
+    '''
+    Creates a graph of the average risk of the messages of a profile on each day, with the days
+    as ordinals, see statistics.get_risk_timeline.
+    '''
+    x, y = downsample.downsample(days, risks)
     fig = go.Figure()
-    fig.add_trace(go.Scatter(x=dict_analysis['ID'],
-                             y=dict_analysis["Risk"],
-                             mode='lines',
-                             name=f'{"Risk"} Evaluation'))
+    fig.add_trace(go.Scatter(x=downsample.get_dates(x), y=y, mode='lines',
+                             name='Risk Evaluation'))
     fig.update_layout(title='Risk Scale',
-                      xaxis_title='Message Over Time',
-                      yaxis_title='Risk Score',
+                      xaxis_title='Day',
+                      yaxis_title='Average Risk Score',
                       paper_bgcolor='rgba(0, 0, 0, 0)',font_family='Roboto')
 
-    return plot(fig, include_plotlyjs=False, output_type='div')
+    return figure_to_div(fig)
 
-def common_topics(messages):
-    '''reate a relationship graph between documents
-    and common topics between the documents and the
-    profiles that mentioned the topics'''
-    doc_dict, has_tasks_pending = plot_helper.get_document_profile_topics(messages)
-    topic_dict = plot_helper.change_key_to_topic(doc_dict)
-    topic_points = {'text': list(topic_dict.keys())} | get_topic_coords(len(topic_dict.keys()))
-    doc_points = {'text': get_documents(topic_dict)} | get_doc_coords(len(
-        get_documents(topic_dict)), len(topic_dict.keys()))
-    fig = go.Figure()
-    for index in range(len(topic_points['text'])):
-        fig.add_trace(go.Scatter(x = [topic_points['x'][index]],
-                                  y=[topic_points['y'][index]],
-                                    text=topic_points['text'][index], **mapping_styles('orange')))
-    for index in range(len(doc_points['text'])):
-        fig.add_trace(go.Scatter(x=[doc_points['x'][index]],
-                                  y = [doc_points['y'][index]],
-                                    text =doc_points['text'][index],**mapping_styles('yellow')))
-
-    for topic, doc_owner_pairs in topic_dict.items():
-        topic_pos = topic_points['text'].index(topic)
-        for doc_owner_pair in doc_owner_pairs:
-            doc_pos = doc_points['text'].index(doc_owner_pair[0])
-            fig.add_trace(go.Scatter(x=[topic_points['x'][topic_pos],doc_points['x'][doc_pos]],
-                                     y=[topic_points['y'][topic_pos],doc_points['y'][doc_pos]],
-                                     mode='lines'))
-            annotation_x, annotation_y = random_point_between([topic_points['x'][topic_pos],
-                                                               topic_points['y'][topic_pos]],
-                                                               [doc_points['x'][doc_pos],
-                                                                doc_points['y'][doc_pos]])
-            fig.add_annotation(x = annotation_x,
-                               y = annotation_y,
-                               text =doc_owner_pair[1] + " mentioned",
-                               showarrow=True,
-                               arrowhead=3
-                               )
-    fig.update_layout(
-        title='Common Topics Across Documents',
-        showlegend=False,font_family='Roboto',
-        xaxis={'visible': False},
-        yaxis={'visible': False})
-    return [plot(fig, include_plotlyjs=False, output_type='div'), has_tasks_pending]
-
-def random_point_between(point_1, point_2):
-    '''Gets a random point along
-    the line between the two points provided'''
-    random_factor = np.random.uniform(0, 1)
-    x = (1 - random_factor) * point_1[0] + random_factor * point_2[0]
-    y = (1 - random_factor) * point_1[1] + random_factor * point_2[1]
-    return x, y
-
-def get_documents(topic_dict):
-    '''Gets the dame of documents
-    in the topic_dict structure'''
-    documents = set()
-    for _, doc_owner_pairs in topic_dict.items():
-        for doc_owner_pair in doc_owner_pairs:
-            documents.add(doc_owner_pair[0])
-    return list(documents)
-
-
-def get_doc_coords(doc_count, topic_count):
-    '''Creates coordinates for the document nodes
-    so that the network structure is maintained'''
-    left_of_topics = {'x':[]}
-    right_of_topics = {'x':[]}
-    doc_coords = {}
-    for i in range(doc_count):
-        if i%2 == 0 or i ==0:
-            left_of_topics['x'].append(-1)
-        else: right_of_topics['x'].append(1)
-    left_of_topics['y'] = get_symmetric_position(len(left_of_topics['x']), topic_count)
-    right_of_topics['y'] = get_symmetric_position(len(right_of_topics['x']), topic_count)
-    doc_coords['x'] = [item for pair in zip(left_of_topics['x'],
-                                            right_of_topics['x']) for item in pair ]
-    doc_coords['y'] = [item for pair in zip(left_of_topics['y'],
-                                            right_of_topics['y']) for item in pair]
-
-    if len(left_of_topics['x']) > len(right_of_topics['x']):
-        doc_coords['x'].append(left_of_topics['x'][-1])
-        doc_coords['y'].append(left_of_topics['y'][-1])
-
-    return doc_coords
-
-
-def get_symmetric_position(doc_count, topic_count):
-    '''Gets the symmetric position where
-    each data point is the same distance away from
-    each other as well as the same distance from the
-    last and starting topic nodes'''
-    halving_factor = topic_count/(doc_count + 1)
-    return [ (i+1) * halving_factor for i in range(doc_count)]
-
-def get_topic_coords(count):
-    '''Creates the coordinates for the topic
-    nodes'''
-    y_axis = 1
-    chosen_coordinates = np.array([[0, y_axis]])
-    while len(chosen_coordinates) < count:
-        y_axis+=1
-        coordinates = np.array([0, y_axis])
-        min_dists = np.linalg.norm(chosen_coordinates - coordinates, axis=1)
-        if np.min(min_dists) >= 1:
-            chosen_coordinates = np.append(chosen_coordinates, coordinates[None,:], axis=0)
-    return {
-        'x': chosen_coordinates[:, 0],
-        'y': chosen_coordinates[:, 1]}
+def common_topics(snapshot):
+    '''
+    Creates a network graph of the documents and the topics they have in common, each edge
+    weighted by the number of messages mentioning the topic in the document, and labelled with
+    the profiles who sent them.
+    '''
+    graph = network.Network()
+    for topic, document, owner, count in snapshot.shared_topics:
+        graph.add_edge(snapshot.documents[document].name, topic, weight=count, text=owner)
 
+    fig = network.network_figure(graph, edge_label=lambda document, topic, _, owners: (
+        f'{" and ".join(owners)} mentioned {topic} in {document}'))
+    fig.update_layout(title='Common Topics Across Documents')
+    return [fig, snapshot.pending]
 
 def profile_risk_bar_graph(messages):
     '''Creates bar graph showing the average
     risk for every profile in the document'''
-    profiles_risk,has_tasks_pending = plot_helper.profiles_risk(messages)
+    results = frame.read_frame(messages)
+    has_tasks_pending = results.is_pending()
+    profiles, risks = ([], []) if has_tasks_pending else results.group_mean('risk', 'owners')
     layout = go.Layout(barmode='group',
                        title='Profile Average Risk Ratings',
                        xaxis={'title':'Profile'},
                        yaxis={'title':'Rating'})
     fig = go.Figure(layout=layout)
-    for profile, risks in profiles_risk.items():
-        fig.add_trace(go.Bar(x=[profile], y=[np.mean(np.array(risks))],
+    for profile, risk in zip(profiles, risks):
+        fig.add_trace(go.Bar(x=[profile], y=[risk],
                              name=profile,
                              showlegend= False, hovertemplate='%{y}'))
     fig.update_layout(font_family='Roboto')
-    return [plot(fig,include_plotlyjs=False, output_type='div'), has_tasks_pending]
+    return [fig, has_tasks_pending]
 
 def profile_risk_gauge(average_risk):
     '''Renders a gauge for the average risk.'''
@@ -598,4 +353,76 @@ def profile_risk_gauge(average_risk):
         'height': 80,
         'margin': {'l': 0, 'r': 0, 't': 30, 'b': 30}
     })
-    return plot(fig, include_plotlyjs=False, output_type='div')
+    return figure_to_div(fig)
+
+def emotions_graph(messages):
+    '''Creates the graph of the emotions of the messages of a document'''
+    dict_analysis, pending = get_messages_series(messages)
+    return [wassa_graphs(dict_analysis), pending]
+
+def emotion_distribution_graph(messages):
+    '''Creates the ridgeplot of the emotions of the messages of a document'''
+    dict_analysis, pending = get_messages_series(messages)
+    return [wassa_ridgeplot(dict_analysis), pending]
+
+def sentiment_risk_graph(messages):
+    '''Creates the graph of the risk and sentiment of the messages of a document'''
+    dict_analysis, pending = get_messages_series(messages)
+    return [risk_and_sentiment_figure(dict_analysis), pending]
+
+# Graphs of the dashboard for every document, drawn from a DashboardSnapshot, by name with a
+# description of what they indicate. They are drawn in this order.
+ALL_DOCUMENTS_GRAPHS = {
+    'document-ratings': (bar_graph,
+                         "If the sentiment or risk is lower for "
+                         "a document than others, it indicates potential "
+                         "antisocial behavior in the messages."),
+    'response-times': (response_time_dist,
+                       "If the distribution is skewed towards "
+                       "lower values, it indicates potential urgency in the "
+                       "conversation"),
+    'risk-distribution': (risk_dist,
+                          "If the distribution of the ridgeplot is skewed"
+                          " to the left then it indicates potential antisocial"
+                          " behavior in the messages."),
+    'message-statistics': (profile_bar_graph,
+                           "If a document has two participants and a lot "
+                           "of messages it might indicate that one participant"
+                           " is trying to manipulate the other."),
+    'common-topics': (common_topics,
+                      "If documents share the same topic and"
+                      " the same profiles it indicates that the"
+                      " documents are related."),
+}
+
+# Graphs of the dashboard for a single document, drawn from its messages.
+DOCUMENT_GRAPHS = {
+    'sentiment-risk': (sentiment_risk_graph,
+                       "If a point on the graph has a low y value"
+                       " it has a negative risk or sentiment which "
+                       "indicates the message contains potential"
+                       " antisocial behavior."),
+    'emotions': (emotions_graph,
+                 "If the function of a emotion is close to"
+                 " 1 there is a high likely hood that emotion"
+                 " is present in that message."),
+    'emotion-distribution': (emotion_distribution_graph,
+                             "If the distribution of the emotion is"
+                             " skewed to values close to 1 it means "
+                             "that emotion is present often in the conversation"),
+    'profile-risk': (profile_risk_bar_graph,
+                     "If a profile has a low number for risk it means"
+                     " the profile has the worst risk and potentially"
+                     " conducting antisocial behavior"),
+    'relationships': (relationship_graph,
+                      "If a person is mapped to a topic it "
+                      "indicates the spoke about it in a message and shows the "
+                      "relation the speaker has to the topic"),
+}
+
+# Series of dict_analysis drawn by the graphs of a document over its messages, in the order of
+# their traces. As one is zoomed into, the series are loaded for the range at full resolution.
+DOCUMENT_GRAPH_SERIES = {
+    'sentiment-risk': ('Sentiment', 'Risk'),
+    'emotions': ('Joy', 'Sad', 'Anger', 'Fear'),
+}
@@ -0,0 +1,123 @@
+'''
+Aggregates of a set of documents for the all documents dashboard.
+
+The messages and NLP results of every document are read in a single streamed query into a
+frame.ResultsFrame, the aggregates of each document are taken from its columns, and the
+statistics of the documents, their profiles and the topics they share in three more, so the
+number of queries does not grow with the number of documents. The graphs of the dashboard are
+requested separately, so the snapshots of the last few sets of documents are kept for the
+others.
+'''
+from collections import OrderedDict
+import threading
+from django.conf import settings
+from analyzer.io.statistics import get_shared_topics
+from analyzer.models import DocumentParticipant, DocumentStatistics, Message
+from graph.frame import ResultsFrame, read_frame
+import numpy as np
+
+# Snapshots by the versions of the statistics of their documents, see get_snapshot.
+_snapshots: OrderedDict[str, 'DashboardSnapshot'] = OrderedDict()
+_snapshots_lock = threading.Lock()
+# Locks of the snapshots being taken, by the same keys.
+_building: dict[str, threading.Lock] = {}
+
+class DocumentSnapshot:
+    '''Aggregates of the messages of a single document, with its statistics.'''
+
+    def __init__(self, document):
+        self.name = document.display_name
+        self.statistics = DocumentStatistics(document_id=document.pk)
+        self.profile_risks = []
+        self.has_messages = False
+        self.topics = []
+        self.response_times = np.empty(0)
+
+    def get_message_count(self):
+        '''Gets the number of messages in the document.'''
+        return self.statistics.message_count
+
+    def get_profile_count(self):
+        '''Gets the number of profiles who sent messages in the document.'''
+        return self.statistics.profile_count
+
+    def get_average_messages_per_profile(self):
+        '''Gets the average number of messages sent by each profile.'''
+        return self.statistics.get_average_messages_per_profile()
+
+    def get_average_profile_risk(self):
+        '''Gets the average over the profiles of the document of their risk in every document.'''
+        return sum(self.profile_risks) / len(self.profile_risks) if self.profile_risks else 0
+
+
+class DashboardSnapshot:
+    '''
+    Aggregates of a set of documents, the graphs of the all documents dashboard are drawn from
+    this instead of querying each document. pending is set if an NLP result is not ready.
+    '''
+
+    def __init__(self, documents):
+        self.documents = {document.uuid: DocumentSnapshot(document) for document in documents}
+        self.frame = ResultsFrame()
+        self.shared_topics = []
+        self.pending = False
+        self.populate()
+        self.load_statistics()
+
+    def populate(self):
+        '''Reads every message of the documents in order of date, with its NLP result.'''
+        self.frame = read_frame(Message.objects.filter(source__in=list(self.documents))
+                                .order_by('source_id', 'date'))
+        self.pending = self.frame.is_pending()
+        for source, response_times in self.frame.split(self.frame.response_times).items():
+            document = self.documents[source]
+            document.has_messages = True
+            document.response_times = np.round(
+                response_times[~np.isnan(response_times)] / 60, 2)
+        for source, topic, _count, _risk in self.frame.get_topic_pairs('documents'):
+            self.documents[source].topics.append(topic[0])
+
+    def load_statistics(self):
+        '''
+        Reads the statistics of the documents, of the profiles who sent messages in them, and
+        the topics mentioned in more than one of them.
+        '''
+        for statistics in DocumentStatistics.objects.filter(document__in=list(self.documents)):
+            self.documents[statistics.document_id].statistics = statistics
+        for document, risk_sum, analysed in (
+                DocumentParticipant.objects.filter(document__in=list(self.documents))
+                .values_list('document_id', 'profile__statistics__risk_sum',
+                             'profile__statistics__analysed_count')):
+            if analysed:
+                self.documents[document].profile_risks.append(risk_sum / analysed)
+        self.shared_topics = get_shared_topics(self.documents)
+
+    def get_documents_with_messages(self):
+        '''Gets the aggregates of the documents which have messages, in order.'''
+        return [document for document in self.documents.values() if document.has_messages]
+
+def get_snapshot(documents, versions) -> DashboardSnapshot:
+    '''
+    Gets the snapshot of documents, taken again once versions, the versions of the statistics of
+    the documents, change. Requests for the same documents wait for the snapshot being taken,
+    others do not, the snapshot is taken outside of the lock of the cache.
+    '''
+    key = repr(versions)
+    with _snapshots_lock:
+        snapshot = _snapshots.get(key)
+        if snapshot is not None:
+            _snapshots.move_to_end(key)
+            return snapshot
+        building = _building.setdefault(key, threading.Lock())
+    with building:
+        with _snapshots_lock:
+            snapshot = _snapshots.get(key)
+        if snapshot is None:
+            snapshot = DashboardSnapshot(documents)
+        with _snapshots_lock:
+            _snapshots[key] = snapshot
+            _snapshots.move_to_end(key)
+            while len(_snapshots) > settings.DASHBOARD_SNAPSHOT_CACHE_SIZE:
+                _snapshots.popitem(last=False)
+            _building.pop(key, None)
+    return snapshot
@@ -1,12 +1,14 @@
 '''This file is to get the predictions of the nlp'''
+import itertools
 import json
-from multiprocessing.dummy import Pool
 from pathlib import Path
 from os import path
+import queue
 import string
 import threading
 import demoji
 from django.conf import settings
+from django.db import close_old_connections
 import flair
 from flair.data import Sentence
 from flair.nn import Classifier
@@ -16,12 +18,15 @@ import spacy
 
 flair.cache_root = Path(path.join(settings.BASE_DIR, 'nlp/.flair'))
 
+# Queued sentences with a lower priority are analysed first.
+INTERACTIVE_PRIORITY = 0
+BULK_PRIORITY = 10
+
 class NLPAnalyzer:
     '''Wrapper to manage models and analysis.'''
 
     def __init__(self):
         '''Loads models for analysis.'''
-        self.pool = Pool(4)
         self.units = {}
         self.units['ner'] = Classifier.load(path.join(settings.BASE_DIR,
             'nlp/.flair/models/ner-english-ontonotes-large/' +
@@ -32,44 +37,96 @@ class NLPAnalyzer:
             self.units[emotion] = TextRegressor.load(path.join(settings.BASE_DIR.parent,
                 f'resources/taggers/wassa/{emotion}/final-model.pt'))
         self.units['sm'] = spacy.load("en_core_web_sm")
+        self.queue = queue.PriorityQueue()
+        self.sequence = itertools.count()
+        for _ in range(settings.NLP_WORKERS):
+            threading.Thread(target=self._work, daemon=True).start()
+
+    def submit(self, sentences, pending_records, priority=BULK_PRIORITY):
+        '''
+        Queues strings for analysis in the background, by priority then in order.
+        Without NLP_WORKERS, they are analysed before this returns.
+        '''
+        for sentence, pending_record in zip(sentences, pending_records):
+            self.queue.put((priority, next(self.sequence), sentence, pending_record, 1))
+        if settings.NLP_WORKERS == 0:
+            self.drain()
+
+    def drain(self):
+        '''Analyses the queued strings in this thread until the queue is empty.'''
+        while batch := self._take_batch(block=False):
+            self._analyse(batch)
+
+    def _take_batch(self, block=True):
+        '''Takes up to NLP_BATCH_SIZE items from the queue, waiting for the first if block.'''
+        batch = []
+        while len(batch) < settings.NLP_BATCH_SIZE:
+            try:
+                batch.append(self.queue.get(block=block and not batch))
+            except queue.Empty:
+                break
+        return batch
 
-    def analyze_pooled(self, sentences, pending_records):
-        '''Runs analysis on strings using a pool.'''
-        self.pool.starmap(self.unthreaded_prediction, zip(sentences, pending_records))
-        return self.pool
+    def _work(self):
+        '''Analyses queued strings in batches, closing the connections this thread opened.'''
+        while True:
+            batch = self._take_batch()
+            try:
+                self._analyse(batch)
+            finally:
+                close_old_connections()
 
-    def analyze_single_string(self, sentence, pending_record):
-        '''Runs analysis on the given string using a thread.'''
-        thread = threading.Thread(target=self.unthreaded_prediction,
-                                  args=[sentence, pending_record])
-        thread.daemon = True
-        thread.start()
-        return thread
+    def _analyse(self, batch):
+        '''Analyses a batch of queued items, queueing again the ones which failed.'''
+        try:
+            self.batch_prediction([item[2] for item in batch], [item[3] for item in batch])
+        except Exception: # pylint: disable=broad-except
+            # Retry one at a time, so a single bad string does not fail the batch.
+            for item in batch:
+                try:
+                    self.unthreaded_prediction(item[2], item[3])
+                except Exception as e: # pylint: disable=broad-except
+                    self._retry(item, e)
+
+    def _retry(self, item, error):
+        '''
+        Queues a failed item again, behind the others of its priority, up to NLP_MAX_ATTEMPTS.
+        After that its task is left pending, housekeeping removes it and it is queued again
+        when its messages are viewed.
+        '''
+        priority, _, sentence, pending_record, attempt = item
+        if attempt < settings.NLP_MAX_ATTEMPTS:
+            self.queue.put((priority, next(self.sequence), sentence, pending_record, attempt + 1))
+        else:
+            print(f"NLP analysis failed after {attempt} attempts: {error}")
 
     def unthreaded_prediction(self, sentence, pending_record):
         '''Run prediction on a single string without fancy trading.'''
-        results = {}
+        self.batch_prediction([sentence], [pending_record])
+
+    def batch_prediction(self, sentences, pending_records):
+        '''Run prediction on strings together, each model predicts the batch at once.'''
+        results = [{} for _ in sentences]
         for emotion in ('sad', 'fear', 'anger', 'joy'):
-            results[f'{emotion}_extreme'] = float(
-                self._run_prediction(emotion, sentence)[0].data_point.tag)
-        sentiment_label = self._run_prediction('sentiment', sentence)[0]
-        results['sentiment'] = sentiment_label.score
-        if sentiment_label.value == 'NEGATIVE':
-            results['sentiment'] *= -1
-
-        topics = self._run_prediction('ner', sentence)
-        results['topics'] = [(topic.data_point.text, topic.value) for topic in topics]
-        results['useful_words'] = self._extract_sentence_useful_words(sentence)
-
-        results['risk'] = self._calculate_risk(results)
-
-        pending_record.confirm(json.dumps(results))
-
-    def _run_prediction(self, unit_name, in_sentence):
-        '''Common routines for all models.'''
-        sentence = Sentence(in_sentence)
-        self.units[unit_name].predict(sentence)
-        return sentence.get_labels()
+            for result, labels in zip(results, self._run_prediction(emotion, sentences)):
+                result[f'{emotion}_extreme'] = float(labels[0].data_point.tag)
+        for result, labels in zip(results, self._run_prediction('sentiment', sentences)):
+            result['sentiment'] = labels[0].score
+            if labels[0].value == 'NEGATIVE':
+                result['sentiment'] *= -1
+
+        for result, topics in zip(results, self._run_prediction('ner', sentences)):
+            result['topics'] = [(topic.data_point.text, topic.value) for topic in topics]
+        for result, sentence, pending_record in zip(results, sentences, pending_records):
+            result['useful_words'] = self._extract_sentence_useful_words(sentence)
+            result['risk'] = self._calculate_risk(result)
+            pending_record.confirm(json.dumps(result))
+
+    def _run_prediction(self, unit_name, in_sentences):
+        '''Common routines for all models, gives the labels of each sentence.'''
+        sentences = [Sentence(in_sentence) for in_sentence in in_sentences]
+        self.units[unit_name].predict(sentences, mini_batch_size=settings.NLP_BATCH_SIZE)
+        return [sentence.get_labels() for sentence in sentences]
 
     def _extract_sentence_useful_words(self, sentence):
         '''Filters the string into words which are useful.'''
@@ -1,5 +1,6 @@
 '''Tests for NLP module.'''
 import json
+from unittest import mock
 from django.test import TestCase, TransactionTestCase
 import numpy as np
 from analyzer.io.common import PendingRecord
@@ -11,23 +12,38 @@ class NLPAnalyzerTests(TransactionTestCase):
     '''Checks if the analyzer is performing correctly.'''
 
     def test_thread_execution(self):
-        '''See if the background thread commits the record correctly.'''
+        '''See if the queued string is analysed and its record committed.'''
         pending_record = PendingRecord(NLPTask.get_mock(), 'result')
-        thread = NLP_ANALYZER.analyze_single_string('Sad Glasgow', pending_record)
-        thread.join()
+        NLP_ANALYZER.submit(['Sad Glasgow'], [pending_record])
+        NLP_ANALYZER.drain()
         self.assertEqual('Glasgow', json.loads(NLPTask.get_mock().result)['topics'][0][0])
 
     def test_useful_words(self):
         '''Checks that the useful words preprocessing is as expected.'''
         pending_record = PendingRecord(NLPTask.get_mock(), 'result')
-        thread = NLP_ANALYZER.analyze_single_string(
-            'sleep sleep   myself Glasgow!!', pending_record)
-        thread.join()
+        NLP_ANALYZER.submit(['sleep sleep   myself Glasgow!!'], [pending_record])
+        NLP_ANALYZER.drain()
         expected = {'sleep', 'glasgow'}
         result = json.loads(NLPTask.get_mock().result)['useful_words']
         self.assertEqual(len(expected), len(result))
         self.assertEqual(expected, set(result))
 
+    def test_failed_strings_are_retried(self):
+        '''Checks that a string which fails is queued again rather than dropped.'''
+        pending_record = PendingRecord(NLPTask.get_mock(), 'result')
+        calls = []
+        original = NLP_ANALYZER.batch_prediction
+        def flaky_prediction(sentences, pending_records):
+            # Fails the batch and the single retry of the first attempt.
+            calls.append(sentences)
+            if len(calls) <= 2:
+                raise OSError('database table is locked')
+            original(sentences, pending_records)
+        with mock.patch.object(NLP_ANALYZER, 'batch_prediction', flaky_prediction):
+            NLP_ANALYZER.submit(['Sad Glasgow'], [pending_record])
+        self.assertEqual(3, len(calls))
+        self.assertIsNotNone(NLPTask.get_mock().result)
+
 class KeywordExtractionTests(TestCase):
     '''Check if the extraction of keywords is roughly correct.'''
 
@@ -1,4 +1,5 @@
 'use strict';
+/* global Helpers, Plotly, enableGraphZoom, processFileNLPWithProgress */
 /* exported selectDocument */
 /**
  * Sets the selected document value and submits the form.
@@ -8,3 +9,71 @@ function selectDocument(selectedDocument) {
     document.getElementById('selectDocument').value = selectedDocument;
     document.getElementById('dropdown_form').submit();
 }
+
+/**
+ * Measurements of loading the graphs of the dashboard, times are in milliseconds since the page
+ * was opened.
+ */
+const dashboardLoad = {
+    timeToFirstGraph: null,
+    payloadBytes: 0,
+    graphs: 0,
+};
+
+/**
+ * Whether the page reloads once NLP results which graphs are waiting for are ready.
+ */
+let refreshScheduled = false;
+
+/**
+ * Fetches a graph of the dashboard and draws it in its card.
+ * @param {HTMLElement} card - The card of the graph, with the URL of its figure JSON.
+ * @param {object} template - The template of the figures, which is not sent with them.
+ */
+async function loadGraph(card, template) {
+    const response = await fetch(card.dataset.graphUrl);
+    const body = await response.text();
+    const figureElement = card.querySelector('.dashboard-graph-figure');
+    dashboardLoad.payloadBytes += new TextEncoder().encode(body).length;
+    if (!response.ok) {
+        figureElement.textContent = 'This graph could not be loaded.';
+        return;
+    }
+
+    const graph = JSON.parse(body);
+    figureElement.replaceChildren();
+    await Plotly.newPlot(figureElement, graph.figure.data,
+        Object.assign({template}, graph.figure.layout), {responsive: true});
+    card.querySelector('.dashboard-graph-description').textContent = graph.description;
+    if (graph.range_url && !graph.pending) {
+        enableGraphZoom(figureElement, graph.range_url);
+    }
+    dashboardLoad.graphs += 1;
+    if (dashboardLoad.timeToFirstGraph === null) {
+        dashboardLoad.timeToFirstGraph = performance.now();
+    }
+    if (graph.pending && !refreshScheduled) {
+        refreshScheduled = true;
+        processFileNLPWithProgress(null, true);
+    }
+}
+
+/**
+ * Loads every graph of the dashboard in parallel, drawing each as it arrives,
+ * then reports how long they took.
+ */
+async function loadGraphs() {
+    const cards = [...document.getElementsByClassName('dashboard-graph')];
+    if (cards.length === 0) return;
+    const template = JSON.parse(document.getElementById('plotly-template').textContent);
+    await Promise.allSettled(cards.map((card) => loadGraph(card, template)));
+    if (dashboardLoad.graphs === 0) return;
+    Helpers.apiCall('/api/dashboard/metrics', 'POST', {
+        time_to_first_graph: dashboardLoad.timeToFirstGraph,
+        total_time: performance.now(),
+        payload_bytes: dashboardLoad.payloadBytes,
+        graphs: dashboardLoad.graphs,
+    });
+}
+
+loadGraphs();
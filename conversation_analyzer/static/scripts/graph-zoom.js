@@ -0,0 +1,37 @@
+'use strict';
+/* global Plotly */
+/* exported enableGraphZoom */
+
+/**
+ * Loads the series of a graph at full resolution for the range it is zoomed into, as the
+ * server sends long series downsampled, and puts back the downsampled series as it is zoomed
+ * out again.
+ * @param {HTMLElement} figureElement - The element the graph is drawn in.
+ * @param {string} rangeUrl - The URL of the series of the graph between start and end.
+ */
+function enableGraphZoom(figureElement, rangeUrl) {
+    const downsampled = {
+        x: figureElement.data.map((trace) => trace.x),
+        y: figureElement.data.map((trace) => trace.y),
+    };
+    let zooms = 0;
+    figureElement.on('plotly_relayout', async (event) => {
+        const zoom = ++zooms;
+        if (event['xaxis.autorange']) {
+            Plotly.restyle(figureElement, downsampled);
+            return;
+        }
+        const range = event['xaxis.range'] ||
+            [event['xaxis.range[0]'], event['xaxis.range[1]']];
+        if (range[0] === undefined || range[1] === undefined) return;
+
+        const response = await fetch(`${rangeUrl}?start=${range[0]}&end=${range[1]}`);
+        // Only the latest zoom is drawn, when ranges arrive out of order.
+        if (!response.ok || zoom !== zooms) return;
+        const traces = (await response.json()).traces;
+        Plotly.restyle(figureElement, {
+            x: traces.map((trace) => trace.x),
+            y: traces.map((trace) => trace.y),
+        });
+    });
+}
@@ -62,6 +62,17 @@ class Helpers {
         document.getElementById(elementId).innerHTML = content;
     }
 
+    /**
+     * Escapes text to be inserted into HTML, e.g. names chosen by users.
+     * @param {string} text - The text to escape.
+     * @return {string} - The text with its HTML special characters escaped.
+     */
+    static escapeHTML(text) {
+        const element = document.createElement('div');
+        element.textContent = text;
+        return element.innerHTML;
+    }
+
     /**
      * Generates an alert message.
      * @param {string} msg - The message to display in the alert.
@@ -91,7 +102,7 @@ class Helpers {
         <div class="d-flex justify-content-center align-items-center mt-5">
         <div class="text-center">
             <div class="spinner-border text-primary mb-3" role="status"></div>
-            <div>We're processing your conversation, please wait...</div>
+            <div id="loading-status">We're processing your conversation, please wait...</div>
         </div>
         </div>`);
     }
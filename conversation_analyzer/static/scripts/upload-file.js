@@ -20,6 +20,21 @@ class FileUpload {
          * @type {string}
          */
         this.apiBase = '/api/upload-file';
+        /**
+         * The delay between polls of a background upload, in milliseconds.
+         * @type {number}
+         */
+        this.pollInterval = 1000;
+        /**
+         * Files larger than this many bytes are uploaded in resumable chunks.
+         * @type {number}
+         */
+        this.chunkedThreshold = 32 * 1024 * 1024;
+        /**
+         * The number of times a chunk is retried before the upload is abandoned.
+         * @type {number}
+         */
+        this.maxChunkRetries = 5;
         /**
          * The ID of the upload element.
          * @type {string}
@@ -48,35 +63,191 @@ class FileUpload {
     }
 
     /**
-     * Uploads the selected file.
+     * Uploads the selected file, large files are uploaded in resumable chunks.
      */
     upload() {
-        const formData = new FormData();
-        formData.append('file', document.getElementById(this.uploadElementId).control.files[0]);
+        const file = document.getElementById(this.uploadElementId).control.files[0];
+        this.previewData = null;
         Helpers.showLoading(this.uploadElementId);
-        fetch(this.apiBase, {
+        const request = file.size > this.chunkedThreshold ?
+            this.uploadChunked(file) : this.uploadWhole(file);
+        request
+            .then((data) => {
+                if (data.success && data.reuse_url) {
+                    this.offerReuse(data);
+                } else if (data.success) {
+                    this.pollJob(data.status_url);
+                } else {
+                    this.displayError(data.error);
+                }
+            }).catch((err) => {
+                this.displayError(`An unexpected error has occurred. 
+                Please try again with a different file.`);
+                console.log(err);
+            });
+    }
+
+    /**
+     * Uploads a file in a single request.
+     * @param {File} file - The file to upload.
+     * @return {Promise} - A promise of the response data.
+     */
+    uploadWhole(file) {
+        const formData = new FormData();
+        formData.append('file', file);
+        return fetch(this.apiBase, {
             method: 'POST',
             body: formData,
             headers: {
                 'X-CSRFToken': document.querySelector(['[name=csrfmiddlewaretoken]']).value,
             },
-        })
+        }).then((response) => response.json());
+    }
+
+    /**
+     * Uploads a file in chunks. If the connection drops, or the page is reloaded and the
+     * same file is chosen again, the upload resumes from the last acknowledged offset.
+     * @param {File} file - The file to upload.
+     * @return {Promise} - A promise of the response data of the completed upload.
+     */
+    async uploadChunked(file) {
+        const resumeKey = `upload:${file.name}:${file.size}:${file.lastModified}`;
+        let session = null;
+        if (localStorage.getItem(resumeKey)) {
+            const response = await fetch(localStorage.getItem(resumeKey));
+            session = await response.json();
+            session.upload_url = localStorage.getItem(resumeKey);
+        }
+        if (!session || !session.success) {
+            const response = await Helpers.apiCall(`${this.apiBase}/chunked`, 'POST', {
+                file_name: file.name, size: file.size,
+            });
+            session = await response.json();
+            if (!session.success) {
+                return session;
+            }
+            localStorage.setItem(resumeKey, session.upload_url);
+        }
+
+        const chunkDigests = new Map();
+        let offset = session.offset;
+        let retries = 0;
+        while (offset < file.size) {
+            const chunk = file.slice(offset, offset + session.chunk_size);
+            chunkDigests.set(offset, await FileUpload.sha256(chunk));
+            try {
+                const response = await fetch(session.upload_url, {
+                    method: 'PUT',
+                    body: chunk,
+                    headers: {
+                        'X-CSRFToken': document.querySelector('[name=csrfmiddlewaretoken]').value,
+                        'Content-Type': 'application/octet-stream',
+                        'X-Upload-Offset': offset,
+                        'X-Chunk-SHA256': chunkDigests.get(offset),
+                    },
+                });
+                const data = await response.json();
+                if (data.offset > offset) {
+                    retries = 0;
+                } else if (response.status != 409 || ++retries > this.maxChunkRetries) {
+                    return data;
+                }
+                offset = data.offset;
+            } catch (err) {
+                // The connection dropped, ask the server where to resume from.
+                if (++retries > this.maxChunkRetries) {
+                    throw err;
+                }
+                await new Promise((resolve) => setTimeout(resolve, this.pollInterval * retries));
+                offset = (await (await fetch(session.upload_url)).json()).offset;
+            }
+            Helpers.changeInnerHTML('loading-status',
+                `Uploading your conversation... (${Math.floor(offset * 100 / file.size)}%)`);
+        }
+
+        const digests = [];
+        for (let chunkOffset = 0; chunkOffset < file.size; chunkOffset += session.chunk_size) {
+            digests.push(chunkDigests.get(chunkOffset) || await FileUpload.sha256(
+                file.slice(chunkOffset, chunkOffset + session.chunk_size)));
+        }
+        const response = await Helpers.apiCall(`${session.upload_url}/complete`, 'POST', {
+            checksum: await FileUpload.sha256(new Blob([digests.join('')])),
+        });
+        const data = await response.json();
+        if (data.success) {
+            localStorage.removeItem(resumeKey);
+        }
+        return data;
+    }
+
+    /**
+     * Gets the SHA-256 digest of a blob.
+     * @param {Blob} blob - The blob to digest.
+     * @return {Promise<string>} - A promise of the digest in hexadecimal.
+     */
+    static async sha256(blob) {
+        const digest = await crypto.subtle.digest('SHA-256', await blob.arrayBuffer());
+        return Array.from(new Uint8Array(digest))
+            .map((byte) => byte.toString(16).padStart(2, '0')).join('');
+    }
+
+    /**
+     * Offers to reuse the analysis of an identical document which was already accepted.
+     * @param {Object} data - The response of the upload, with the duplicated document.
+     */
+    offerReuse(data) {
+        Helpers.changeInnerHTML('info', Helpers.generateAlert(`
+            This file is identical to ${Helpers.escapeHTML(data.duplicate_of.display_name)}.
+            <button id="reuse-btn" class="btn btn-sm btn-success ms-2">Use its analysis</button>
+            <button id="reprocess-btn" class="btn btn-sm btn-outline-secondary ms-1">
+                Process again
+            </button>`, 'info'));
+        const answer = (reuse) => {
+            Helpers.showLoading(this.uploadElementId);
+            Helpers.apiCall(data.reuse_url, 'POST', {reuse})
+                .then((response) => response.json())
+                .then((data) => {
+                    if (!data.success) {
+                        this.displayError(data.error);
+                    } else if (data.status_url) {
+                        this.pollJob(data.status_url);
+                    } else {
+                        Helpers.changeInnerHTML('info',
+                            Helpers.generateAlert(data.message, 'success'));
+                        Helpers.removeClass(this.uploadElementId, 'disabled');
+                    }
+                }).catch((err) => {
+                    this.displayError('An unexpected error has occurred. Please try again.');
+                    console.log(err);
+                });
+        };
+        document.getElementById('reuse-btn').addEventListener('click', () => answer(true));
+        document.getElementById('reprocess-btn').addEventListener('click', () => answer(false));
+    }
+
+    /**
+     * Polls the status of a background upload until its preview is ready or it fails.
+     * @param {string} statusUrl - The status endpoint of the upload job.
+     */
+    pollJob(statusUrl) {
+        fetch(statusUrl)
             .then((response) => response.json())
-            .catch((err) => {
-                this.displayError('An unexpected error has occurred. Please try again.');
-                console.log(err);
-            })
             .then((data) => {
-                if (data.success) {
-                    this.previewData = data.preview;
-                    this.format();
-                    this.messages();
-                    this.populateFields(Object.keys(this.previewData[0]));
-                    Helpers.changeInnerHTML('info', '');
-                    this.setFileName(data.file_name);
-                    this.showFieldMapping(true);
-                } else {
+                if (!data.success) {
                     this.displayError(data.error);
+                } else if (data.phase === 'done') {
+                    this.showPreview(data);
+                } else {
+                    if (data.preview_ready && this.previewData === null) {
+                        // The first rows can be shown while the rest of the file is parsed.
+                        this.previewData = data.preview;
+                        this.format(data.field_stats);
+                        Helpers.addClass('accept-btn', 'disabled');
+                        Helpers.addClass('reject-btn', 'disabled');
+                    }
+                    Helpers.changeInnerHTML('loading-status', `We're processing your
+                    conversation, please wait... (${data.rows_parsed} messages parsed)`);
+                    setTimeout(() => this.pollJob(statusUrl), this.pollInterval);
                 }
             }).catch((err) => {
                 this.displayError(`An unexpected error has occurred. 
@@ -85,14 +256,35 @@ class FileUpload {
             });
     }
 
+    /**
+     * Shows the preview and field mapping of a parsed upload.
+     * @param {Object} data - The status of the finished upload job.
+     */
+    showPreview(data) {
+        this.previewData = data.preview;
+        this.format(data.field_stats);
+        this.messages();
+        this.populateFields(data.preview_fields);
+        Helpers.changeInnerHTML('info', data.preview_sampled ?
+            `Showing the first and a random sample of the ${data.rows_parsed} messages.` : '');
+        this.setFileName(data.file_name);
+        this.showFieldMapping(true);
+    }
+
     /**
      * Formats the preview data and displays it in the grid.
+     * @param {Object} fieldStats - How often each field is filled, and the kinds of its values.
      */
-    format() {
+    format(fieldStats = {}) {
         const firstPreviewRowData = typeof this.previewData.at(0) === 'undefined' ?
             {} : this.previewData[0];
         const previewColumnDefs = Object.keys(firstPreviewRowData)
-            .map((key) => Object({field: key}));
+            .map((key) => Object({
+                field: key,
+                headerTooltip: key in fieldStats ?
+                    `${Math.round(fieldStats[key].fill_rate * 100)}% filled, ` +
+                    Object.keys(fieldStats[key].types).join(', ') : key,
+            }));
 
         // extract message.raw_content if present
         for (let x = 0; x < this.previewData.length; x++) {
@@ -120,11 +312,13 @@ class FileUpload {
             Helpers.replaceClass('field-map-heading', 'd-none', 'd-block');
             Helpers.replaceClass('messages-heading', 'd-none', 'd-block');
             Helpers.replaceClass('show-messages', 'd-none', 'd-block');
+            Helpers.replaceClass('append-to-wrapper', 'd-none', 'd-block');
         } else {
             Helpers.replaceClass('field-mapping', 'd-block', 'd-none');
             Helpers.replaceClass('field-map-heading', 'd-block', 'd-none');
             Helpers.replaceClass('messages-heading', 'd-block', 'd-none');
             Helpers.replaceClass('show-messages', 'd-block', 'd-none');
+            Helpers.replaceClass('append-to-wrapper', 'd-block', 'd-none');
         }
     }
 
@@ -164,6 +358,11 @@ class FileUpload {
                 );
             }
 
+            const appendTo = document.getElementById('append-to');
+            if (appendTo && appendTo.value) {
+                body.append_to = appendTo.value;
+            }
+
             if (!Helpers.areChoicesValid(body.field_mapping)) {
                 this.displayError(`You have selected duplicate columns, or
                 you have not mapped a column. 
@@ -206,7 +405,7 @@ class FileUpload {
                     Helpers.changeInnerHTML('messages', '');
                     this.showFieldMapping(false);
                     this.unpopulateFields();
-                    processFileNLPWithProgress(this.getFileName(), false);
+                    processFileNLPWithProgress(data.file_name || this.getFileName(), false);
                 } else {
                     this.displayError(data.error);
                     Helpers.removeClass('accept-btn', 'disabled');
@@ -54,6 +54,6 @@ fi
 
 git init
 "$base_path"/db-clean.sh
-mkdir -p "$project_path"/media/ingestion_saves "$project_path"/media/uploaded_documents
+mkdir -p "$project_path"/media/ingestion_saves "$project_path"/media/uploaded_documents "$project_path"/media/upload_sessions
 echo "Installed. Running server..."
 "$base_path"/venv/bin/python "$project_path"/manage.py runserver